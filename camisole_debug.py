@@ -0,0 +1,120 @@
+"""
+Stand-in corrector speaking the camisole protocol, with support for
+content-addressed test inputs (PROBLEMS_CORRECTORS_CONTENT_ADDRESSED).
+
+Test inputs received in `inputs` are cached by hash. Tests referring to an
+unknown `stdin_hash` make the server answer with `missing_inputs` instead
+of running the request.
+
+With --upstream, resolved requests are forwarded to a real camisole.
+Otherwise, a fake result is returned: compilation succeeds and every test
+outputs its input.
+"""
+import collections
+import hashlib
+import http.server
+import threading
+
+import msgpack
+import requests
+
+
+def loads(data):
+    return msgpack.loads(data, encoding='utf-8')
+
+
+def dumps(data):
+    return msgpack.dumps(data, use_bin_type=True)
+
+
+class InputCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def add(self, value):
+        key = hashlib.sha256(value.encode('utf-8')).hexdigest()
+        with self.lock:
+            if key not in self.items:
+                self.items[key] = value
+                self.size += len(value)
+            while self.size > self.max_size and len(self.items) > 1:
+                _, evicted = self.items.popitem(last=False)
+                self.size -= len(evicted)
+        return key
+
+
+def fake_run(request):
+    meta = {'status': 'OK', 'exitcode': 0, 'exitsig': None, 'time': 0.001, 'wall-time': 0.001, 'max-rss': 1000}
+
+    def execution(stdout):
+        return {'exitcode': 0, 'stdout': stdout.encode('utf-8'), 'stderr': b'', 'meta': meta}
+
+    result = {'success': True, 'tests': [dict(execution(test.get('stdin', '')), name=test['name'])
+                                         for test in request.get('tests', [])]}
+    if 'compile' in request:
+        result['compile'] = execution('')
+    return result
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    cache = None
+    upstream = None
+
+    def reply(self, response):
+        body = dumps(response)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/msgpack')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        request = loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+        for value in request.pop('inputs', {}).values():
+            self.cache.add(value)
+
+        missing = []
+        for test in request.get('tests', []):
+            if 'stdin_hash' not in test:
+                continue
+            stdin = self.cache.get(test['stdin_hash'])
+            if stdin is None:
+                missing.append(test['stdin_hash'])
+            else:
+                test['stdin'] = stdin
+                del test['stdin_hash']
+        if missing:
+            return self.reply({'success': False, 'error': "missing inputs", 'missing_inputs': missing})
+
+        if self.upstream:
+            response = requests.post(self.upstream, data=dumps(request),
+                                     headers={'content-type': 'application/msgpack',
+                                              'accept': 'application/msgpack'})
+            response.raise_for_status()
+            return self.reply(loads(response.content))
+        return self.reply(fake_run(request))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=42920)
+    parser.add_argument('--upstream', help="camisole URL to forward requests to, eg. http://localhost:42921/run")
+    parser.add_argument('--cache-size', type=int, default=512, help="input cache size, in MiB")
+    args = parser.parse_args()
+    Handler.cache = InputCache(args.cache_size << 20)
+    Handler.upstream = args.upstream
+    http.server.ThreadingHTTPServer((args.host, args.port), Handler).serve_forever()
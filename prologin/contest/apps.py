@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class ContestConfig(AppConfig):
     name = 'contest'
     verbose_name = 'Contest'
+
+    def ready(self):
+        import contest.signals  # noqa
@@ -0,0 +1,162 @@
+"""
+Current edition context: edition, events, qualification QCM and semifinal
+challenge of PROLOGIN_EDITION. Their rows are kept in a process-wide snapshot
+instead of being queried on every request, and each request gets its own
+model instances built from the snapshot.
+
+Saving or deleting an Edition, Event or Qcm invalidates the snapshot (see
+contest.signals). The invalidation is propagated to other processes through a
+version number in the utility Redis store, checked at most every
+PROLOGIN_EDITION_CONTEXT_CHECK_INTERVAL seconds. The semifinal challenge is
+looked up in the problem repository once per snapshot; its contents are
+reloaded by the problem registry when the repository changes.
+"""
+import collections
+import copy
+import threading
+import time
+
+import redis
+import redis.exceptions
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.utils.functional import cached_property
+
+import contest.models
+
+
+class EditionSnapshot:
+    """
+    Database rows of the edition, its events and qualification QCM. Only plain
+    values are kept, model instances are built for each request by
+    EditionContext so that requests never share mutable objects.
+    """
+    def __init__(self, year):
+        import qcm.models
+        self.year = year
+        self.edition = _rows(contest.models.Edition.objects.filter(year=year))
+        self.events = _rows(contest.models.Event.objects
+                            .filter(edition__year=year)
+                            .order_by('date_begin', 'pk'))
+        self.qcms = _rows(qcm.models.Qcm.objects
+                          .filter(event__type=contest.models.Event.Type.qualification.value,
+                                  event__edition__year=year)
+                          .order_by('pk')[:1])
+
+    @cached_property
+    def semifinal_challenge(self):
+        # only copies are handed out, see EditionContext.semifinal_challenge
+        import problems.models
+        try:
+            return problems.models.Challenge.by_year_and_event_type(self.year, contest.models.Event.Type.semifinal)
+        except ObjectDoesNotExist:
+            return None
+
+
+Rows = collections.namedtuple('Rows', 'db fields values')
+
+
+def _rows(queryset):
+    fields = [field.attname for field in queryset.model._meta.concrete_fields]
+    return Rows(queryset.db, fields, list(queryset.values_list(*fields)))
+
+
+def _instances(model, rows):
+    return [model.from_db(rows.db, rows.fields, values) for values in rows.values]
+
+
+class EditionContext:
+    """Current edition data of one request, built from the shared EditionSnapshot."""
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.year = snapshot.year
+
+    @cached_property
+    def edition(self):
+        editions = _instances(contest.models.Edition, self.snapshot.edition)
+        if not editions or not self.snapshot.events.values:
+            raise ImproperlyConfigured("You need to configure at least one Edition "
+                                       "and one related Event for this year ({})".format(self.year))
+        return editions[0]
+
+    @cached_property
+    def events(self):
+        events = _instances(contest.models.Event, self.snapshot.events)
+        for event in events:
+            event.edition = self.edition
+        return events
+
+    @cached_property
+    def current_events(self):
+        events_dict = collections.defaultdict(list)
+        for event in self.events:
+            event_type = contest.models.Event.Type(event.type)
+            if event_type == contest.models.Event.Type.semifinal:
+                events_dict[event_type.name].append(event)
+            else:
+                events_dict[event_type.name] = event
+        events_dict[contest.models.Event.Type.semifinal.name].sort(key=lambda x: x.date_begin)
+        return events_dict
+
+    @cached_property
+    def current_qcm(self):
+        import qcm.models
+        qcms = _instances(qcm.models.Qcm, self.snapshot.qcms)
+        if not qcms:
+            return None
+        events = {event.pk: event for event in self.events}
+        if qcms[0].event_id in events:
+            qcms[0].event = events[qcms[0].event_id]
+        return qcms[0]
+
+    @cached_property
+    def semifinal_challenge(self):
+        """The semifinal Challenge of the edition, None if there is none."""
+        challenge = self.snapshot.semifinal_challenge
+        # views annotate the Problem instances of a challenge, so each request
+        # gets its own; their data is shared through the problem registry
+        return copy.copy(challenge) if challenge is not None else None
+
+
+_lock = threading.Lock()
+_snapshot = None
+_version = None
+_checked_at = None
+
+
+def _store():
+    return redis.StrictRedis(**settings.PROLOGIN_UTILITY_REDIS_STORE)
+
+
+def _shared_version():
+    try:
+        return _store().get(settings.PROLOGIN_EDITION_CONTEXT_REDIS_KEY)
+    except redis.exceptions.RedisError:
+        # cannot know; rebuild at every check
+        return object()
+
+
+def get_edition_context() -> EditionContext:
+    """A new EditionContext for the current request, from the shared snapshot."""
+    global _snapshot, _version, _checked_at
+    with _lock:
+        now = time.monotonic()
+        if _snapshot is None or now - _checked_at >= settings.PROLOGIN_EDITION_CONTEXT_CHECK_INTERVAL:
+            version = _shared_version()
+            if _snapshot is None or version != _version:
+                _snapshot = EditionSnapshot(settings.PROLOGIN_EDITION)
+                _version = version
+            _checked_at = now
+        snapshot = _snapshot
+    return EditionContext(snapshot)
+
+
+def invalidate_edition_context(**kwargs):
+    """Signal receiver dropping the snapshot, in this process and the others."""
+    global _snapshot
+    with _lock:
+        _snapshot = None
+    try:
+        _store().incr(settings.PROLOGIN_EDITION_CONTEXT_REDIS_KEY)
+    except redis.exceptions.RedisError:
+        pass
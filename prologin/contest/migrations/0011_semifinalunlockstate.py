@@ -0,0 +1,24 @@
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contest', '0010_auto_20231111_2010'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SemifinalUnlockState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('challenge', models.CharField(max_length=64)),
+                ('problems', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('valid_until', models.DateTimeField(blank=True, null=True)),
+                ('date_computed', models.DateTimeField(auto_now=True)),
+                ('contestant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='semifinal_unlock_state', to='contest.Contestant')),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import prologin.utils.db
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contest', '0011_semifinalunlockstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='semifinalunlockstate',
+            name='challenge_version',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        # stored states are recomputed, their challenge version does not match
+        migrations.RemoveField(
+            model_name='semifinalunlockstate',
+            name='problems',
+        ),
+        migrations.AddField(
+            model_name='semifinalunlockstate',
+            name='problems',
+            field=prologin.utils.db.MsgpackField(default=dict),
+        ),
+    ]
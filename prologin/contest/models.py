@@ -1,4 +1,5 @@
 import collections
+import datetime
 import itertools
 
 import os
@@ -12,6 +13,7 @@ from django.db import models
 from django.db.models import Count, Q
 from django.db.models.aggregates import Sum
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.formats import date_format
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_noop, ugettext_lazy as _
@@ -21,6 +23,7 @@ from massmailer import register_enum
 from centers.models import Center
 from prologin.models import EnumField, CodingLanguageField
 from prologin.utils import ChoiceEnum, save_random_state
+from prologin.utils.db import MsgpackField
 from schools.models import School
 
 
@@ -420,15 +423,18 @@ class Contestant(ExportModelOperationsMixin('contestant'), models.Model):
         from problems.models import ExplicitProblemUnlock
         return ExplicitProblemUnlock.objects.filter(challenge=self.semifinal_challenge.name, user=self.user)
 
+    @staticmethod
+    def count_lines_of_code(code):
+        return sum(1 for line in code.replace('\r', '\n').split('\n') if line.strip())
+
     @cached_property
     def semifinal_lines_of_code(self):
         from problems.models import SubmissionCode
-        return sum(1
+        return sum(self.count_lines_of_code(code)
                    for code in (SubmissionCode.objects
                                 .filter(submission__user=self.user,
                                         submission__challenge=self.semifinal_challenge.name)
-                                .values_list('code', flat=True))
-                   for line in code.replace('\r', '\n').split('\n') if line.strip())
+                                .values_list('code', flat=True)))
 
     @cached_property
     def semifinal_problems_score(self):
@@ -439,7 +445,16 @@ class Contestant(ExportModelOperationsMixin('contestant'), models.Model):
 
     @cached_property
     def available_semifinal_problems(self):
-        from problems.models import Challenge, Submission, ExplicitProblemUnlock
+        return self.get_semifinal_unlocks()
+
+    def get_semifinal_unlocks(self, explicit_unlocks=None, solved_submissions=None, store=True):
+        """
+        available_semifinal_problems, computed from the given explicit unlocks
+        and solved submissions of the contestant, if they were loaded already
+        and the stored state is not valid anymore.
+        If `store` is False, a stale state is recomputed but not saved.
+        """
+        from problems.models import Challenge
         challenge = self.semifinal_challenge
 
         if self.user.is_staff:
@@ -448,18 +463,72 @@ class Contestant(ExportModelOperationsMixin('contestant'), models.Model):
         elif challenge.type == Challenge.Type.standard:
             return list(challenge.problems)
 
+        try:
+            state = self.semifinal_unlock_state
+        except SemifinalUnlockState.DoesNotExist:
+            state = None
+        if state is None or not state.is_valid(challenge):
+            if not store:
+                problems, valid_until = self.compute_semifinal_unlocks(explicit_unlocks, solved_submissions)
+                return problems
+            return self.refresh_semifinal_unlocks(explicit_unlocks, solved_submissions)
+        return state.get_problems(challenge)
+
+    def refresh_semifinal_unlocks(self, explicit_unlocks=None, solved_submissions=None):
+        """
+        Compute the semifinal problems unlocked by the contestant and store
+        them, see SemifinalUnlockState.
+        """
+        problems, valid_until = self.compute_semifinal_unlocks(explicit_unlocks, solved_submissions)
+        state, created = SemifinalUnlockState.objects.update_or_create(
+            contestant=self,
+            defaults={'challenge': self.semifinal_challenge.name,
+                      'challenge_version': self.semifinal_challenge.version,
+                      'problems': SemifinalUnlockState.serialize(problems),
+                      'valid_until': valid_until})
+        self.semifinal_unlock_state = state
+        self.__dict__['available_semifinal_problems'] = problems
+        return problems
+
+    def compute_semifinal_unlocks(self, explicit_unlocks=None, solved_submissions=None):
+        """
+        :param explicit_unlocks: ExplicitProblemUnlocks of the contestant, loaded if None
+        :param solved_submissions: solved Submissions of the contestant, loaded if None
+        :return: dict of unlocked problem to its unlock and solve dates, and
+                 the date until which it is valid if it depends on time
+        """
+        from problems.models import Challenge, Submission, ExplicitProblemUnlock
+        challenge = self.semifinal_challenge
+
         seed = self.user.pk
+        now = timezone.now()
+        valid_until = None
         problem_to_solved_date = {}
         problem_to_unlock_date = {}
         difficulty_to_solved = collections.defaultdict(set)
 
-        for unlock in ExplicitProblemUnlock.objects.filter(user=self.user, challenge=challenge.name):
-            problem = challenge.problem(unlock.problem)
-            problem_to_unlock_date[problem] = unlock.date_created
-
-        for submission in Submission.objects.filter(user=self.user, challenge=challenge.name, score_base__gt=0):
-            problem = challenge.problem(submission.problem)
-            problem_to_solved_date[problem] = submission.first_code_success().date_submitted
+        if explicit_unlocks is None:
+            explicit_unlocks = ExplicitProblemUnlock.objects.filter(user=self.user, challenge=challenge.name)
+        if solved_submissions is None:
+            solved_submissions = Submission.objects.filter(user=self.user, challenge=challenge.name, score_base__gt=0)
+
+        problems_by_name = challenge.problems_dict
+        for unlock in explicit_unlocks:
+            if unlock.problem not in problems_by_name:
+                # removed from the repository since
+                continue
+            problem_to_unlock_date[problems_by_name[unlock.problem]] = unlock.date_created
+
+        for submission in solved_submissions:
+            if submission.problem not in problems_by_name:
+                continue
+            # maintained by the correction, rescoring and import paths, and
+            # backfilled by problems.0009_submission_attempts
+            solved_date = submission.date_first_success
+            if solved_date is None:
+                continue
+            problem = problems_by_name[submission.problem]
+            problem_to_solved_date[problem] = solved_date
             difficulty_to_solved[problem.difficulty].add(problem)
 
         # transform into real dict, so we don't get an empty set but an actual KeyError on missing keys
@@ -501,11 +570,16 @@ class Contestant(ExportModelOperationsMixin('contestant'), models.Model):
                     previous_difficulty_problems = [problem for problem in challenge.problems_of_difficulty(previous_difficulty)
                                                     if problem not in problem_to_unlock_date]
                     if previous_difficulty_problems:
-                        if (timezone.now() - earliest_unlock_date).seconds > challenge.auto_unlock_delay:
+                        waited = (now - earliest_unlock_date).seconds
+                        if waited > challenge.auto_unlock_delay:
                             # waited long enough, unlock a new previous-difficulty problem
                             with save_random_state(seed):
                                 problem = random.choice(previous_difficulty_problems)
                                 problem_to_unlock_date[problem] = earliest_unlock_date
+                        else:
+                            # the unlocks change once waited long enough
+                            expires = now + datetime.timedelta(seconds=challenge.auto_unlock_delay - waited + 1)
+                            valid_until = min(valid_until or expires, expires)
 
         # should not happen, but you never know (eg. if explicit unlock is removed after it's solved)
         # assign a fake unlock date to problems that are solved but not unlocked (wtf)
@@ -515,7 +589,7 @@ class Contestant(ExportModelOperationsMixin('contestant'), models.Model):
 
         return {problem: {'unlocked': date_unlocked,
                           'solved': problem_to_solved_date.get(problem)}
-                for problem, date_unlocked in problem_to_unlock_date.items()}
+                for problem, date_unlocked in problem_to_unlock_date.items()}, valid_until
 
     def compute_changes(self, new, event_type):
         changes = {
@@ -538,6 +612,60 @@ class Contestant(ExportModelOperationsMixin('contestant'), models.Model):
         return "{edition}: {user}".format(user=self.user, edition=self.edition)
 
 
+class SemifinalUnlockState(models.Model):
+    """
+    Materialized Contestant.available_semifinal_problems, refreshed when a
+    semifinal code succeeds or a problem is explicitly unlocked.
+    """
+    contestant = models.OneToOneField(Contestant, related_name='semifinal_unlock_state', on_delete=models.CASCADE)
+    challenge = models.CharField(max_length=64)
+    # Challenge.version the unlocks were computed from
+    challenge_version = models.CharField(max_length=64, blank=True)
+    # {problem name: [unlock date, solve date or None]}, as ISO 8601 strings
+    problems = MsgpackField(default=dict)
+    # time-dependent unlocks (delayed challenges) have to be computed again after that
+    valid_until = models.DateTimeField(null=True, blank=True)
+    date_computed = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "{} unlocks for {}".format(self.challenge, self.contestant.user)
+
+    @staticmethod
+    def serialize(problems):
+        return {problem.name: [dates['unlocked'].isoformat(),
+                               dates['solved'].isoformat() if dates['solved'] else None]
+                for problem, dates in problems.items()}
+
+    def is_valid(self, challenge):
+        return (self.challenge == challenge.name
+                and self.challenge_version == challenge.version
+                and (self.valid_until is None or timezone.now() < self.valid_until))
+
+    def get_problems(self, challenge):
+        problems = challenge.problems_dict
+        # problems removed from the repository since are skipped
+        return {problems[name]: {'unlocked': parse_datetime(unlocked),
+                                 'solved': parse_datetime(solved) if solved else None}
+                for name, (unlocked, solved) in self.problems.items() if name in problems}
+
+    @staticmethod
+    def refresh(user, challenge_name):
+        """Refresh the unlocks of `user` after a change in the `challenge_name` challenge."""
+        from problems.models import Challenge
+        if not settings.PROLOGIN_SEMIFINAL_MODE:
+            # only used in semifinal mode; rebuild_semifinal_unlocks catches up
+            return
+        try:
+            # str(): unsaved instances may hold a Challenge
+            challenge = Challenge.by_low_level_name(str(challenge_name))
+        except ObjectDoesNotExist:
+            return
+        if challenge.event_type is not Event.Type.semifinal:
+            return
+        for contestant in Contestant.objects.filter(user=user, edition__year=challenge.year):
+            contestant.refresh_semifinal_unlocks()
+
+
 class EventWish(ExportModelOperationsMixin('event_wish'), models.Model):
     contestant = models.ForeignKey(Contestant, on_delete=models.CASCADE)
     event = models.ForeignKey(Event, on_delete=models.CASCADE)
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from contest.context import invalidate_edition_context
+from contest.models import Edition, Event
+from qcm.models import Qcm
+
+
+# the qualification QCM is part of the current edition context
+@receiver(post_save, sender=Edition)
+@receiver(post_delete, sender=Edition)
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+@receiver(post_save, sender=Qcm)
+@receiver(post_delete, sender=Qcm)
+def edition_context_handler(sender, **kwargs):
+    invalidate_edition_context()
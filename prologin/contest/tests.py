@@ -1,9 +1,17 @@
+import os
+import shutil
+import tempfile
 import unittest.mock
 from datetime import datetime, timedelta
 
+from django.test import override_settings
+from django.utils import timezone
 from django.utils.timezone import make_aware
 
-from contest.models import Edition, Event, Contestant, Assignation
+from contest.context import get_edition_context
+from contest.models import Edition, Event, Contestant, Assignation, SemifinalUnlockState
+from problems.models import Challenge, ExplicitProblemUnlock, Submission
+from problems.registry import registry
 from users.models import ProloginUser
 from prologin.tests import ProloginTestCase
 
@@ -213,3 +221,132 @@ class EventPhaseTest(ProloginTestCase):
     def test_edition_after_end(self):
         self.assertPhaseIs(None, 'finished')
         self.assertCanEdit(self.noob_user, self.semifinal_user, self.final_user)
+
+
+class EditionContextTest(ProloginTestCase):
+    def _contribute(self):
+        super()._contribute()
+        # created in reverse order, listed by date
+        self.semi2 = Event.objects.create(edition=self.edition, type=Event.Type.semifinal.value,
+                                          date_begin=make_aware(datetime(2016, 3, 1)))
+        self.semi1 = Event.objects.create(edition=self.edition, type=Event.Type.semifinal.value,
+                                          date_begin=make_aware(datetime(2016, 2, 1)))
+
+    def test_events(self):
+        context = get_edition_context()
+        self.assertEqual(context.edition, self.edition)
+        self.assertEqual(context.current_events['semifinal'], [self.semi1, self.semi2])
+        self.assertEqual([event for event in context.events if event.type == Event.Type.semifinal.value],
+                         [self.semi1, self.semi2])
+        with self.assertNumQueries(0):
+            self.assertEqual(context.events[0].edition.year, self.edition.year)
+
+    def test_fresh_instances(self):
+        first, second = get_edition_context(), get_edition_context()
+        self.assertIsNot(first.edition, second.edition)
+        self.assertIsNot(first.events[0], second.events[0])
+        first.edition.semifinal_corrected = True
+        self.assertFalse(get_edition_context().edition.semifinal_corrected)
+
+    def test_invalidation(self):
+        get_edition_context()
+        self.edition.semifinal_corrected = True
+        self.edition.save()
+        self.assertTrue(get_edition_context().edition.semifinal_corrected)
+
+
+@override_settings(PROLOGIN_SEMIFINAL_MODE=True)
+class SemifinalUnlockTest(ProloginTestCase):
+    def _contribute(self):
+        super()._contribute()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'demi{}'.format(self.edition.year))
+        os.makedirs(self.path)
+        with open(os.path.join(self.path, 'challenge.props'), 'w') as f:
+            f.write("type: all-by-level\n")
+        for name, difficulty in (('easy', 1), ('medium', 2), ('hard', 3)):
+            self.write_problem(name, difficulty)
+        repository = self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name)
+        repository.enable()
+        self.addCleanup(repository.disable)
+        registry.clear()
+        self.addCleanup(registry.clear)
+
+        self.user = self.create_user('alice', 'alice@example.com')
+        self.contestant = Contestant.objects.create(user=self.user, edition=self.edition)
+        self.challenge = self.contestant.semifinal_challenge.name
+
+    def test_edition_context_challenge(self):
+        first = get_edition_context().semifinal_challenge
+        with unittest.mock.patch('problems.models.Challenge.by_year_and_event_type') as lookup:
+            second = get_edition_context().semifinal_challenge
+        lookup.assert_not_called()
+        self.assertEqual(first, second)
+        # views annotate the problems of their challenge
+        self.assertIsNot(first.problems[0], second.problems[0])
+
+    def write_problem(self, name, difficulty):
+        os.makedirs(os.path.join(self.path, name))
+        with open(os.path.join(self.path, name, 'problem.props'), 'w') as f:
+            f.write("title: {}\ndifficulty: {}\n".format(name, difficulty))
+        registry.clear()
+
+    def unlocked(self):
+        contestant = Contestant.objects.get(pk=self.contestant.pk)
+        return sorted(problem.name for problem in contestant.get_semifinal_unlocks())
+
+    def stored(self):
+        return sorted(SemifinalUnlockState.objects.get(contestant=self.contestant).problems)
+
+    def solve(self, problem):
+        Submission.objects.create(challenge=self.challenge, problem=problem, user=self.user, score_base=100,
+                                  date_first_success=timezone.now())
+        SemifinalUnlockState.refresh(self.user, self.challenge)
+
+    def test_explicit_unlock(self):
+        self.assertEqual(self.unlocked(), [])
+        unlock = ExplicitProblemUnlock.objects.create(challenge=self.challenge, problem='easy', user=self.user)
+        self.assertEqual(self.stored(), ['easy'])
+        self.assertEqual(self.unlocked(), ['easy'])
+        unlock.delete()
+        self.assertEqual(self.stored(), [])
+        self.assertEqual(self.unlocked(), [])
+
+    def test_refresh(self):
+        ExplicitProblemUnlock.objects.create(challenge=self.challenge, problem='easy', user=self.user)
+        self.solve('easy')
+        self.assertEqual(self.stored(), ['easy', 'medium'])
+        # read from the stored state
+        with unittest.mock.patch.object(Contestant, 'compute_semifinal_unlocks') as compute:
+            self.assertEqual(self.unlocked(), ['easy', 'medium'])
+        compute.assert_not_called()
+
+    def test_added_problem(self):
+        ExplicitProblemUnlock.objects.create(challenge=self.challenge, problem='easy', user=self.user)
+        self.solve('easy')
+        self.write_problem('medium2', 2)
+        self.assertEqual(self.unlocked(), ['easy', 'medium', 'medium2'])
+        self.assertEqual(self.stored(), ['easy', 'medium', 'medium2'])
+
+    def test_removed_problem(self):
+        ExplicitProblemUnlock.objects.create(challenge=self.challenge, problem='easy', user=self.user)
+        ExplicitProblemUnlock.objects.create(challenge=self.challenge, problem='hard', user=self.user)
+        self.solve('easy')
+        state = SemifinalUnlockState.objects.get(contestant=self.contestant)
+        shutil.rmtree(os.path.join(self.path, 'hard'))
+        registry.clear()
+        challenge = Challenge.by_low_level_name(self.challenge)
+        self.assertEqual(sorted(problem.name for problem in state.get_problems(challenge)), ['easy', 'medium'])
+        self.assertEqual(self.unlocked(), ['easy', 'medium'])
+
+    def test_compute_from_loaded_submissions(self):
+        unlocks = [ExplicitProblemUnlock.objects.create(challenge=self.challenge, problem='easy', user=self.user)]
+        self.solve('easy')
+        self.solve('medium')
+        solved = list(Submission.objects.filter(user=self.user))
+        contestant = Contestant.objects.select_related('user', 'edition').get(pk=self.contestant.pk)
+        # as the monitoring board does, no query per submission
+        with self.assertNumQueries(0):
+            problems, valid_until = contestant.compute_semifinal_unlocks(unlocks, solved)
+        self.assertEqual(sorted(problem.name for problem in problems), ['easy', 'hard', 'medium'])
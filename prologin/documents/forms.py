@@ -1,50 +1,53 @@
 from collections import namedtuple, defaultdict
 from django import forms
 from django.contrib.auth import get_user_model
-from django.core import serializers
 from django.core.exceptions import ValidationError
 from django.utils.translation import ugettext_lazy as _
 
 import contest.models
+import problems.models
+from prologin.utils.serialization import load_objects
 
 User = get_user_model()
 SemifinalResults = namedtuple('SemifinalResults', 'event contestants submissions submissioncodes explicitunlocks')
 
 
 class ImportSemifinalResultUploadForm(forms.Form):
-    file = forms.FileField(label=_("JSON export file"),
+    file = forms.FileField(label=_("Export file"),
                            required=True,
-                           help_text=_("Select the JSON export file obtained from regional event website and proceed."))
+                           help_text=_("Select the export file obtained from regional event website and proceed."))
 
     def clean_file(self):
         stream = self.cleaned_data['file']
-        stream.seek(0)
-        deserializer = serializers.get_deserializer('json')
 
         invalid_format = _("Invalid format: could not read or deserialize %(type)s")
 
+        objects = defaultdict(list)
         try:
-            import_edition = next(deserializer(stream.readline())).object
+            for item in load_objects(stream):
+                objects[item.object._meta.label_lower].append(item.object)
         except Exception:
-            raise ValidationError(invalid_format % {'type': "Edition"})
+            raise ValidationError(invalid_format % {'type': _("the export file")})
+
+        def single(model, type):
+            try:
+                return objects[model._meta.label_lower][0]
+            except IndexError:
+                raise ValidationError(invalid_format % {'type': type})
+
+        import_edition = single(contest.models.Edition, "Edition")
         try:
             edition = contest.models.Edition.objects.get(pk=import_edition.pk)
         except contest.models.Edition.DoesNotExist:
             raise ValidationError(_("Imported edition is invalid."))
 
-        try:
-            import_center = next(deserializer(stream.readline())).object
-        except Exception:
-            raise ValidationError(invalid_format % {'type': "Center"})
+        import_center = single(contest.models.Center, "Center")
         try:
             center = contest.models.Center.objects.get(pk=import_center.pk)
         except contest.models.Center.DoesNotExist:
             raise ValidationError(_("Imported center is invalid."))
 
-        try:
-            import_event = next(deserializer(stream.readline())).object
-        except Exception:
-            raise ValidationError(invalid_format % {'type': "Event"})
+        import_event = single(contest.models.Event, "Event")
         try:
             event = contest.models.Event.objects.get(pk=import_event.pk)
         except contest.models.Event.DoesNotExist:
@@ -53,18 +56,11 @@ class ImportSemifinalResultUploadForm(forms.Form):
         if event.edition != edition or event.center != center:
             raise ValidationError(_("Imported event edition or center mismatches with known event."))
 
-        try:
-            import_users = deserializer(stream.readline())
-        except Exception:
-            raise ValidationError(invalid_format % {'type': "User"})
-        user_pks = [user.object.pk for user in import_users]
+        user_pks = [user.pk for user in objects[User._meta.label_lower]]
         if User.objects.filter(pk__in=user_pks).count() != len(user_pks):
             raise ValidationError(_("Imported users mismatch."))
 
-        try:
-            import_contestants = [item.object for item in deserializer(stream.readline())]
-        except Exception:
-            raise ValidationError(invalid_format % {'type': "Contestant"})
+        import_contestants = objects[contest.models.Contestant._meta.label_lower]
 
         contestant_pks = set(contestant.pk for contestant in import_contestants)
         challenge = event.challenge
@@ -74,22 +70,19 @@ class ImportSemifinalResultUploadForm(forms.Form):
                                               .select_related('edition', 'user', 'assignation_semifinal_event'))}
         contestants = [(contestant, our_contestants.get(contestant.pk)) for contestant in import_contestants]
 
-        try:
-            import_submissions = list(deserializer(stream.readline()))
-            import_codes = list(deserializer(stream.readline()))
-            import_explicitunlocks = list(deserializer(stream.readline()))
-        except Exception:
-            raise ValidationError(invalid_format % {'type': "Submission/SubmissionCode/ExplicitProblemUnlock"})
+        import_submissions = objects[problems.models.Submission._meta.label_lower]
+        import_codes = objects[problems.models.SubmissionCode._meta.label_lower]
+        import_explicitunlocks = objects[problems.models.ExplicitProblemUnlock._meta.label_lower]
 
         user_submissions = defaultdict(list)
-        for item in import_submissions:
-            user_submissions[item.object.user_id].append(item.object)
+        for submission in import_submissions:
+            user_submissions[submission.user_id].append(submission)
         submission_codes = defaultdict(list)
-        for item in import_codes:
-            submission_codes[item.object.submission_id].append(item.object)
+        for code in import_codes:
+            submission_codes[code.submission_id].append(code)
         problem_unlocks = defaultdict(list)
-        for item in import_explicitunlocks:
-            problem_unlocks[(item.object.user_id, item.object.problem)].append(item.object)
+        for unlock in import_explicitunlocks:
+            problem_unlocks[(unlock.user_id, unlock.problem)].append(unlock)
 
         for contestant, our in contestants:
             contestant.submissions = sorted(user_submissions[contestant.user_id],
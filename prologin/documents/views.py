@@ -6,6 +6,9 @@ from django.conf import settings
 from django.contrib import messages
 from django.core import serializers
 from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Count, Min, Q
 from django.urls import reverse_lazy
 from django.http.response import HttpResponseRedirect, HttpResponse, Http404
 from django.shortcuts import get_object_or_404, redirect
@@ -183,11 +186,10 @@ class SemifinalDataImportView(PermissionRequiredMixin, SessionWizardView):
         context = super().get_context_data(**kwargs)
         context['step_name'] = self.step_names[self.steps.current]
         if self.steps.current == 'review':
-            context.update(self.get_review_context_data())
+            context.update(self.get_review_context_data(self.get_cleaned_data_for_step('upload')['file']))
         return context
 
-    def get_review_context_data(self):
-        result = self.get_cleaned_data_for_step('upload')['file']
+    def get_review_context_data(self, result):
 
         our_contestants = (contest.models.Contestant.objects
                            .filter(assignation_semifinal=contest.models.Assignation.assigned.value,
@@ -230,55 +232,84 @@ class SemifinalDataImportView(PermissionRequiredMixin, SessionWizardView):
         valid_user_pk = set()
         submissions = {}
 
-        data = self.get_review_context_data()
+        data = self.get_review_context_data(result)
 
         # Extract the list of valid user ids
+        valid_contestants = []
         for imported, contestant, warnings, errors in data['contestants']:
             if errors or not imported or not contestant:
                 continue
             valid_user_pk.add(contestant.user.pk)
-
-        # Create or update submissions (score_base and malus)
-        for submission in result.submissions:
-            if submission.object.user_id not in valid_user_pk:
-                continue
-            old_pk = submission.object.pk
-            current_submission, created = (problems.models.Submission.objects
-                                           .get_or_create(challenge=challenge.name,
-                                                          problem=submission.object.problem,
-                                                          user=submission.object.user))
-            # Overwrite score_base and malus
-            current_submission.score_base = submission.object.score_base
-            current_submission.malus = submission.object.malus
-            current_submission.save()
-            # Save reference to old pk for related objects (namely codes)
-            submissions[old_pk] = current_submission
-
-        # Create codes, if they do not already exist
-        for submissioncode in result.submissioncodes:
-            if submissioncode.object.submission_id not in submissions:
-                continue
-            old_submission_pk = submissioncode.object.submission_id
-            current_submission = submissions[old_submission_pk]
-            fields = ('code', 'language', 'summary', 'score', 'result', 'date_submitted', 'date_corrected')
-            current_code, created = (problems.models.SubmissionCode.objects
-                                     .get_or_create(submission=current_submission,
-                                                    defaults={'celery_task_id': submissioncode.object.celery_task_id},
-                                                    **{field: getattr(submissioncode.object, field) for field in fields}))
-            if created:
-                current_code.save()
-
-        # Create unlocks, if they do not already exist
-        for explicitunlock in result.explicitunlocks:
-            if explicitunlock.object.user_id not in valid_user_pk:
-                continue
-            current_unlock, created = (problems.models.ExplicitProblemUnlock.objects
-                                       .get_or_create(challenge=explicitunlock.object.challenge,
-                                                      problem=explicitunlock.object.problem,
-                                                      user=explicitunlock.object.user,
-                                                      defaults={'date_created': explicitunlock.object.date_created}))
-            if created:
-                current_unlock.save()
+            valid_contestants.append(contestant)
+
+        imported_submissions = [submission for submission in result.submissions
+                                if submission.user_id in valid_user_pk]
+        imported_submission_pks = set(submission.pk for submission in imported_submissions)
+        imported_codes = [code for code in result.submissioncodes if code.submission_id in imported_submission_pks]
+        imported_unlocks = [unlock for unlock in result.explicitunlocks if unlock.user_id in valid_user_pk]
+        batch_size = settings.DATA_IMPORT_SEMIFINAL_BATCH_SIZE
+
+        with transaction.atomic():
+            # Create missing submissions, then overwrite their scores
+            problems.models.Submission.objects.bulk_create(
+                (problems.models.Submission(challenge=challenge.name, problem=submission.problem,
+                                            user_id=submission.user_id)
+                 for submission in imported_submissions),
+                batch_size=batch_size, ignore_conflicts=True)
+            current_submissions = {(submission.user_id, submission.problem): submission
+                                   for submission in (problems.models.Submission.objects
+                                                      .filter(challenge=challenge.name, user_id__in=valid_user_pk))}
+            # attempts and date_first_success are derived from the codes below, legacy exports lack them
+            fields = ('score_base', 'malus')
+            for submission in imported_submissions:
+                current_submission = current_submissions[(submission.user_id, submission.problem)]
+                for field in fields:
+                    setattr(current_submission, field, getattr(submission, field))
+                # Save reference to old pk for related objects (namely codes)
+                submissions[submission.pk] = current_submission
+            problems.models.Submission.objects.bulk_update(submissions.values(), fields, batch_size=batch_size)
+
+            # Create codes, if they do not already exist
+            existing_codes = set(problems.models.SubmissionCode.objects
+                                 .filter(submission__in=submissions.values())
+                                 .values_list('submission_id', 'language', 'date_submitted'))
+            fields = ('code', 'language', 'summary', 'score', 'result', 'date_submitted', 'date_corrected',
+                      'celery_task_id')
+            new_codes = []
+            for submissioncode in imported_codes:
+                current_submission = submissions[submissioncode.submission_id]
+                if (current_submission.pk, submissioncode.language, submissioncode.date_submitted) in existing_codes:
+                    continue
+                new_codes.append(problems.models.SubmissionCode(
+                    submission=current_submission,
+                    **{field: getattr(submissioncode, field) for field in fields}))
+            problems.models.SubmissionCode.objects.bulk_create(new_codes, batch_size=batch_size)
+
+            # bulk_create() skips SubmissionCode.save(), which maintains these
+            counters = {row['pk']: row
+                        for row in (problems.models.Submission.objects
+                                    .filter(challenge=challenge.name, user_id__in=valid_user_pk)
+                                    .values('pk')
+                                    .annotate(code_count=Count('codes'),
+                                              first_success=Min('codes__date_submitted', filter=Q(codes__score__gt=0))))}
+            for current_submission in submissions.values():
+                current_submission.attempts = counters[current_submission.pk]['code_count']
+                current_submission.date_first_success = counters[current_submission.pk]['first_success']
+            problems.models.Submission.objects.bulk_update(submissions.values(), ('attempts', 'date_first_success'),
+                                                           batch_size=batch_size)
+
+            # Create unlocks, if they do not already exist
+            problems.models.ExplicitProblemUnlock.objects.bulk_create(
+                (problems.models.ExplicitProblemUnlock(challenge=unlock.challenge, problem=unlock.problem,
+                                                       user_id=unlock.user_id, date_created=unlock.date_created)
+                 for unlock in imported_unlocks),
+                batch_size=batch_size, ignore_conflicts=True)
+
+            # solved counts and unlocks depend on the imported submissions
+            call_command('rebuild_problem_statistics', stdout=io.StringIO())
+            if challenge.type != problems.models.Challenge.Type.standard:
+                for contestant in valid_contestants:
+                    contestant.refresh_semifinal_unlocks()
 
         messages.success(self.request, _("Successfully imported regional event results."))
         return redirect('contest:correction:semifinal', year=event.edition.year, event=event.pk)
@@ -6,7 +6,7 @@ from django.utils.translation import ugettext_lazy as _
 import celery
 import datetime
 
-from problems.tasks import submit_problem_code
+from problems.scheduling import BULK, schedule_correction
 from prologin.utils import admin_url_for
 import problems.models
 
@@ -123,7 +123,7 @@ class SubmissionCodeAdmin(admin.ModelAdmin):
                 if not submission.celery_task_id:
                     submission.celery_task_id = celery.uuid()
                     submission.save()
-                submit_problem_code.apply_async(args=[submission.pk], task_id=submission.celery_task_id, throw=False)
+                schedule_correction(submission, priority=BULK, throw=False)
                 success += 1
             else:
                 errors += 1
@@ -135,7 +135,8 @@ class SubmissionCodeAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         # Prevent O(n) queries
         return (super().get_queryset(request)
-                .select_related('submission', 'submission__user'))
+                .select_related('submission', 'submission__user')
+                .defer('result'))
 
 
 class SubmissionCodeInline(admin.StackedInline):
@@ -0,0 +1,153 @@
+"""
+Compiled challenge bundles.
+
+A bundle packs every file the Challenge and Problem models read (properties,
+subjects, tests and skeletons) into a single file stored at the root of the
+challenge directory, so loading a problem costs one mmap() instead of an
+open()/decode cycle per file. Text is re-encoded to UTF-8 when compiling, so
+no encoding guessing happens at runtime.
+
+Layout:
+
+    MAGIC | index offset (u64, little endian) | file contents… | msgpack index
+
+The index maps each relative path (using '/' separators) to its
+(offset, length) pair, and each directory to the list of its entries.
+"""
+import mmap
+import os
+import struct
+
+from prologin.utils import msgpack_dumps, msgpack_loads, open_try_hard
+
+BUNDLE_FILE_NAME = 'challenge.bundle'
+MAGIC = b'PLBNDL1\n'
+_HEADER = struct.Struct('<Q')
+_HEADER_SIZE = len(MAGIC) + _HEADER.size
+
+
+def _bundled_paths(challenge_path):
+    """Relative paths of the files read by the Challenge and Problem models."""
+    def files_in(*tail):
+        path = os.path.join(challenge_path, *tail)
+        if not os.path.isdir(path):
+            return
+        for item in sorted(os.listdir(path)):
+            if os.path.isfile(os.path.join(path, item)):
+                yield '/'.join(tail + (item,))
+
+    for name in ('challenge.props', 'challenge.txt'):
+        if os.path.isfile(os.path.join(challenge_path, name)):
+            yield name
+    for problem_dir in sorted(os.listdir(challenge_path)):
+        if problem_dir.startswith('.') or not os.path.isdir(os.path.join(challenge_path, problem_dir)):
+            continue
+        for name in ('problem.props', 'subject.md', 'subject.txt'):
+            if os.path.isfile(os.path.join(challenge_path, problem_dir, name)):
+                yield '/'.join((problem_dir, name))
+        yield from files_in(problem_dir, 'test')
+        yield from files_in(problem_dir, 'skeleton')
+
+
+def write_bundle(challenge_path, bundle_path=None):
+    """
+    Compile the challenge at `challenge_path` into a bundle.
+
+    :return: the number of bundled files
+    """
+    if bundle_path is None:
+        bundle_path = os.path.join(challenge_path, BUNDLE_FILE_NAME)
+    files = {}
+    dirs = {}
+    tmp_path = bundle_path + '.tmp'
+    with open(tmp_path, 'wb') as out:
+        out.write(MAGIC)
+        out.write(_HEADER.pack(0))
+        for relpath in _bundled_paths(challenge_path):
+            data = open_try_hard(lambda f: f.read(), os.path.join(challenge_path, *relpath.split('/')))
+            data = data.encode('utf-8')
+            files[relpath] = (out.tell(), len(data))
+            out.write(data)
+            parts = relpath.split('/')
+            for i in range(len(parts)):
+                entries = dirs.setdefault('/'.join(parts[:i]), [])
+                if parts[i] not in entries:
+                    entries.append(parts[i])
+        index_offset = out.tell()
+        out.write(msgpack_dumps({'files': files, 'dirs': dirs}))
+        out.seek(len(MAGIC))
+        out.write(_HEADER.pack(index_offset))
+    os.replace(tmp_path, bundle_path)
+    return len(files)
+
+
+class Bundle:
+    """
+    Read-only, memory-mapped view of a compiled challenge bundle.
+
+    Paths are relative to the challenge directory, as tuples of components.
+    Missing files raise FileNotFoundError, like open() would.
+
+    The mapping is closed by close(), when leaving a `with` block, or when the
+    bundle is garbage collected (eg. after the registry dropped it).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("Not a challenge bundle: {}".format(path))
+        index_offset, = _HEADER.unpack(self._mmap[len(MAGIC):_HEADER_SIZE])
+        index = msgpack_loads(self._mmap[index_offset:])
+        self._files = index['files']
+        self._dirs = index['dirs']
+
+    @classmethod
+    def open(cls, path):
+        """Open the bundle at `path`, or return None if there is none."""
+        if not os.path.exists(path):
+            return None
+        return cls(path)
+
+    def __repr__(self):
+        return '<Bundle: {}>'.format(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        mapping = getattr(self, '_mmap', None)
+        if mapping is not None and not mapping.closed:
+            mapping.close()
+
+    def exists(self, *tail):
+        relpath = '/'.join(tail)
+        return relpath in self._files or relpath in self._dirs
+
+    def listdir(self, *tail):
+        try:
+            return list(self._dirs['/'.join(tail)])
+        except KeyError:
+            raise FileNotFoundError("No such directory in {}: {}".format(self.path, '/'.join(tail)))
+
+    def size(self, *tail) -> int:
+        """Size, in bytes, of the UTF-8 encoded file."""
+        try:
+            return self._files['/'.join(tail)][1]
+        except KeyError:
+            raise FileNotFoundError("No such file in {}: {}".format(self.path, '/'.join(tail)))
+
+    def read(self, *tail) -> str:
+        try:
+            offset, length = self._files['/'.join(tail)]
+        except KeyError:
+            raise FileNotFoundError("No such file in {}: {}".format(self.path, '/'.join(tail)))
+        return self._mmap[offset:offset + length].decode('utf-8')
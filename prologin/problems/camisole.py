@@ -1,19 +1,25 @@
 import contextlib
+import hashlib
 import logging
-import requests
+import os
+import select
 import subprocess
 import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import ExitStack
+from django.conf import settings
 from django.utils.encoding import force_text
 
+from problems.correctors import get_pool
 from problems.models import SubmissionCode
 from problems.models.problem import Problem, Test, TestType
-from prologin.utils import msgpack_dumps, msgpack_loads
+from prologin.utils import get_cache, msgpack_dumps, msgpack_loads
 
 logger = logging.getLogger(__name__)
 
 
-
 def is_custom_check_valid(test: Test, output, custom_check, **kwargs) -> bool:
     """
     Check if a given `test` passes against `output` using the custom
@@ -52,24 +58,177 @@ def is_custom_check_valid(test: Test, output, custom_check, **kwargs) -> bool:
         except subprocess.SubprocessError:
             return False
 
-def test_passes(reference: Test, test: dict, custom_check = None):
+
+class BatchChecker:
+    """
+    Long-lived custom checker process, checking many tests over a pipe
+    instead of being started for each of them.
+
+    The checker program is started as `checker --batch`. For each test, it is
+    sent a line with the byte lengths of the contestant output, the test input
+    and the expected output, separated by spaces, followed by these three
+    contents. It shall answer with a line, `OK` if the output is valid, and
+    exit when its input is closed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime_ns
+        self._lock = threading.Lock()
+        self._process = None
+        self._buffer = b''
+
+    def _start(self):
+        # unbuffered: the pipes are used through their raw file descriptors
+        self._process = subprocess.Popen([self.path, '--batch'], bufsize=0,
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        os.set_blocking(self._process.stdin.fileno(), False)
+        self._buffer = b''
+
+    def stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process.stdin.close()
+            self._process.stdout.close()
+            self._process = None
+
+    def _ask(self, blobs) -> bool:
+        if self._process is None or self._process.poll() is not None:
+            self._start()
+        request = memoryview(' '.join(str(len(blob)) for blob in blobs).encode() + b'\n' + b''.join(blobs))
+        stdin = self._process.stdin.fileno()
+        stdout = self._process.stdout.fileno()
+        timeout = settings.PROBLEMS_CUSTOM_CHECK_TIMEOUT
+        deadline = time.monotonic() + timeout
+        sent = 0
+        # write the request and read the answer under the same deadline, so a
+        # checker that stops reading cannot block us on a full pipe
+        while b'\n' not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(self.path, timeout)
+            writers = [stdin] if sent < len(request) else []
+            readable, writable, _ = select.select([stdout], writers, [], remaining)
+            if writable:
+                try:
+                    sent += os.write(stdin, request[sent:])
+                except BlockingIOError:
+                    pass
+            if readable:
+                chunk = os.read(stdout, 4096)
+                if not chunk:
+                    raise EOFError("checker exited")
+                self._buffer += chunk
+        answer, self._buffer = self._buffer.split(b'\n', 1)
+        if sent < len(request):
+            # answered without reading the whole test: the next one would be misread
+            logger.warning("batch checker %s answered before reading its input", self.path)
+            self.stop()
+        return answer.strip() == b'OK'
+
+    def check(self, test: Test, output: str) -> bool:
+        """
+        Check if a given `test` passes against `output`.
+
+        May raise FileNotFoundError if checker program is not available.
+        A checker crashing or timing out is restarted once, then the output
+        is considered invalid.
+        """
+        blobs = [data.encode() for data in (output, test.stdin, test.stdout)]
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    return self._ask(blobs)
+                except FileNotFoundError:
+                    raise
+                except (OSError, EOFError, subprocess.SubprocessError):
+                    logger.exception("batch checker %s failed", self.path)
+                    self.stop()
+            return False
+
+
+_batch_checkers = {}
+_batch_checkers_lock = threading.Lock()
+
+
+def get_batch_checker(path: str) -> BatchChecker:
+    """The running batch checker for `path`, restarted if the program changed."""
+    with _batch_checkers_lock:
+        checker = _batch_checkers.get(path)
+        if checker is not None and checker.mtime != os.stat(path).st_mtime_ns:
+            checker.stop()
+            checker = None
+        if checker is None:
+            checker = _batch_checkers[path] = BatchChecker(path)
+        return checker
+
+
+def test_passes(reference: Test, test: dict, custom_check = None, batch = False):
     """
     Defines what is a successful test:
 
     - exit code shall be zero
     - meta.status shall be OK
     - stdout must be ref. stdout (except for leading and trailing whitespaces)
+
+    The verdict stored by store_verdicts(), if any, is used instead, unless
+    the expected output changed since.
     """
+    # verdicts stored before output hashes were recorded are trusted
+    if 'passes' in test and test.get('expected_sha256', reference.stdout_hash) == reference.stdout_hash:
+        return test['passes']
+
     # assume UnicodeDecode errors as contestant's garbage output
     stdout = force_text(test['stdout'], strings_only=False, errors='replace').strip()
 
+    if not (test['exitcode'] == 0 and test['meta']['status'] == 'OK'):
+        return False
     if custom_check is not None:
-        return (test['exitcode'] == 0 and
-            test['meta']['status'] == 'OK' and
-            is_custom_check_valid(reference, stdout, custom_check))
-    return (test['exitcode'] == 0 and
-            test['meta']['status'] == 'OK' and
-            stdout == reference.stdout.strip())
+        if batch:
+            return get_batch_checker(custom_check).check(reference, stdout)
+        return is_custom_check_valid(reference, stdout, custom_check)
+    return stdout == reference.stdout.strip()
+
+
+def store_verdicts(problem: Problem, result: dict):
+    """
+    Store in `result` whether each test passes (`passes` key), so custom
+    checkers are not run again by get_score() nor when displaying results,
+    along with the hash of the expected output it was checked against
+    (`expected_sha256` key).
+    """
+    reference_tests = {ref.name: ref for ref in problem.tests}
+    custom_check = problem.custom_check
+    batch = problem.custom_check_batch
+    for test in result.get('tests') or []:
+        if not test or test['name'] not in reference_tests:
+            continue
+        ref = reference_tests[test['name']]
+        test['passes'] = test_passes(ref, test, custom_check, batch)
+        test['expected_sha256'] = ref.stdout_hash
+
+
+def needs_recorrection(problem: Problem, result: dict) -> bool:
+    """
+    Whether the stored `result` can not be scored again against the current
+    tests of `problem`, so the code has to be corrected again: tests were
+    added or removed since, or the expected output of a test whose output
+    was truncated (see compact_result()) changed.
+    """
+    if not result.get('success') or ('compile' in result and result['compile']['exitcode'] != 0):
+        return False
+    tests = [test for test in result.get('tests') or [] if test]
+    names = [test['name'] for test in tests]
+    reference_tests = problem.tests
+    if names != [ref.name for ref in reference_tests[:len(names)]]:
+        return True
+    if len(names) < len(reference_tests) and not (tests and test_is_fatal(tests[-1])):
+        # all_fatal requests only stop after a fatal test
+        return True
+    hashes = {ref.name: ref.stdout_hash for ref in reference_tests}
+    return any('stdout_size' in test and test.get('expected_sha256', hashes[test['name']]) != hashes[test['name']]
+               for test in tests)
 
 
 def get_score(problem: Problem, result: dict):
@@ -80,10 +239,25 @@ def get_score(problem: Problem, result: dict):
     :param result: the submission result from camisole
     :return the computed score
     """
+    return get_scores(problem, [result])[0]
+
+
+def get_scores(problem: Problem, results: list) -> list:
+    """
+    Compute the raw scores of many `results` for the same problem, see
+    get_score(). Problem properties and tests are looked up only once.
+    """
     difficulty = problem.difficulty
     validation_percent = problem.validation_percent
-    legacy = validation_percent is None
     reference_tests = {ref.name: ref for ref in problem.tests}
+    custom_check = problem.custom_check
+    batch = problem.custom_check_batch
+    return [_compute_score(problem, difficulty, validation_percent, reference_tests, custom_check, batch, result)
+            for result in results]
+
+
+def _compute_score(problem, difficulty, validation_percent, reference_tests, custom_check, batch, result):
+    legacy = validation_percent is None
 
     if 'compile' in result and result['compile']['exitcode'] != 0:
         # compilation failure
@@ -93,20 +267,21 @@ def get_score(problem: Problem, result: dict):
         # no tests
         return 0
 
-    custom_check = problem.custom_check
-
     total_correction = total_performance = passed_correction = passed_performance = 0
     for test in result['tests']:
         if not test:
             continue
-        ref = reference_tests[test['name']]
+        ref = reference_tests.get(test['name'])
+        if ref is None:
+            # removed from the problem since, see needs_recorrection()
+            continue
         if ref.type is TestType.performance:
             total_performance += 1
-            if test_passes(ref, test, custom_check):
+            if test_passes(ref, test, custom_check, batch):
                 passed_performance += 1
         elif ref.type is TestType.correction:
             total_correction += 1
-            if test_passes(ref, test, custom_check):
+            if test_passes(ref, test, custom_check, batch):
                 passed_correction += 1
 
     if not total_correction:
@@ -140,20 +315,167 @@ def get_score(problem: Problem, result: dict):
     return int(score)
 
 
+def _post(uri: str, request: dict) -> dict:
+    logger.debug("sending to camisole: %r", request)
+    result = get_pool().post(
+        uri,
+        data=msgpack_dumps(request),
+        headers={'content-type': 'application/msgpack',
+                 'accept': 'application/msgpack'})
+    return msgpack_loads(result.content)
+
+
+def _send(uri: str, request: dict, code: SubmissionCode) -> dict:
+    """
+    Send `request` to the camisole worker at `uri`, attaching the test inputs
+    it reports missing if the request is content-addressed.
+    """
+    result = _post(uri, request)
+    missing = set(result.get('missing_inputs') or ())
+    if not missing:
+        return result
+
+    problem = code.submission.problem_model()
+    request = dict(request, inputs={ref.stdin_hash: ref.stdin for ref in problem.tests
+                                    if ref.stdin_hash in missing})
+    result = _post(uri, request)
+    if result.get('missing_inputs'):
+        raise RuntimeError("camisole worker is still missing {} test inputs"
+                           .format(len(result['missing_inputs'])))
+    return result
+
+
 def submit(uri: str, code: SubmissionCode) -> dict:
     """
     Submit a code and its tests to a camisole worker listening at ``uri``.
 
+    If PROBLEMS_CORRECTORS_CONTENT_ADDRESSED is set, test inputs are only
+    sent as hashes (`stdin_hash`). The worker answers with the list of hashes
+    it does not have in cache (`missing_inputs`), and the request is sent
+    again with these inputs attached (`inputs`, mapping hash to input).
+
     :param uri: HTTP address of the camisole worker
     :param code: the SubmissionCode to test
     :return: JSON-decoded result from camisole
     """
-    request = code.generate_request()
-    logger.debug("sending to camisole: %r", request)
-    result = requests.post(
-        uri,
-        data=msgpack_dumps(request),
-        headers={'content-type': 'application/msgpack',
-                 'accept': 'application/msgpack'})
-    result.raise_for_status()
-    return msgpack_loads(result.content)
+    request = code.generate_request(content_addressed=settings.PROBLEMS_CORRECTORS_CONTENT_ADDRESSED)
+    return _send(uri, request, code)
+
+
+def compact_result(result: dict) -> bool:
+    """
+    Truncate the outputs of `result` longer than PROBLEMS_RESULT_MAX_OUTPUT
+    UTF-8 encoded bytes, before storing it. Truncated outputs stay strings,
+    without the partial character at the end, if any. The size and SHA-256
+    hash of the UTF-8 encoded outputs are kept as `<output>_size` and
+    `<output>_sha256`.
+
+    Verdicts shall be stored (see store_verdicts()) beforehand, as truncated
+    outputs can no longer be checked.
+
+    :return: whether some output was truncated
+    """
+    limit = settings.PROBLEMS_RESULT_MAX_OUTPUT
+    truncated = False
+    runs = [result.get('compile')] + list(result.get('tests') or [])
+    for run in runs:
+        if not run:
+            continue
+        for key in ('stdout', 'stderr'):
+            output = run.get(key)
+            if output is None or key + '_size' in run:
+                continue
+            encoded = output.encode() if isinstance(output, str) else output
+            if len(encoded) <= limit:
+                continue
+            run[key + '_size'] = len(encoded)
+            run[key + '_sha256'] = hashlib.sha256(encoded).hexdigest()
+            run[key] = encoded[:limit].decode('utf-8', 'ignore')
+            truncated = True
+    return truncated
+
+
+def result_cache_key(code: SubmissionCode) -> str:
+    """
+    Key identifying everything a camisole result depends on: language,
+    source (with normalized line endings), limits, and test names and inputs.
+    """
+    request = code.generate_request(content_addressed=True)
+    request['source'] = request['source'].replace('\r\n', '\n')
+    return 'problems:result:{}'.format(hashlib.sha256(msgpack_dumps(request)).hexdigest())
+
+
+def get_cached_result(code: SubmissionCode):
+    """The camisole result of an identical submission, if any (see result_cache_key())."""
+    if settings.PROBLEMS_RESULT_CACHE is None:
+        return None
+    return get_cache(settings.PROBLEMS_RESULT_CACHE).get(result_cache_key(code))
+
+
+def cache_result(code: SubmissionCode, result: dict):
+    """Keep the camisole `result` of `code` for identical submissions, unless it is an internal error."""
+    if settings.PROBLEMS_RESULT_CACHE is None or not result['success']:
+        return
+    runs = [result.get('compile')] + list(result.get('tests') or [])
+    if any(run and run['meta']['status'] == 'INTERNAL_ERROR' for run in runs):
+        return
+    get_cache(settings.PROBLEMS_RESULT_CACHE).set(result_cache_key(code), result,
+                                                   settings.PROBLEMS_RESULT_CACHE_TIMEOUT)
+
+
+def test_is_fatal(test: dict) -> bool:
+    """Whether camisole stops running the next tests after `test` (all_fatal)."""
+    return test['exitcode'] != 0 or test['meta']['status'] != 'OK'
+
+
+def merge_results(tests: list, results: list) -> dict:
+    """
+    Merge the camisole results of shards of the `tests` request list into the
+    result a single worker would have returned.
+
+    Tests are put back in request order. As requests are `all_fatal`, the
+    merged list stops at the first fatal test; this also drops the tests that
+    other shards ran past that point.
+    """
+    for result in results:
+        if not result['success']:
+            return result
+        if 'compile' in result and result['compile']['exitcode'] != 0:
+            return result
+
+    by_name = {test['name']: test for result in results for test in (result.get('tests') or []) if test}
+    merged_tests = []
+    for test in tests:
+        test_result = by_name.get(test['name'])
+        if test_result is None:
+            # not run because an earlier test of its shard was fatal
+            break
+        merged_tests.append(test_result)
+        if test_is_fatal(test_result):
+            break
+    return dict(results[0], tests=merged_tests)
+
+
+def submit_sharded(uris: list, code: SubmissionCode) -> dict:
+    """
+    Split the tests of a code in as many shards as there are ``uris`` and run
+    them concurrently on these camisole workers.
+
+    Each worker compiles the code on its own, as camisole cannot share the
+    compiled program. Tests are dealt in turn to each shard so slow
+    performance tests, usually last, are spread across workers.
+
+    :return: the merged result, see merge_results()
+    """
+    request = code.generate_request(content_addressed=settings.PROBLEMS_CORRECTORS_CONTENT_ADDRESSED)
+    tests = request['tests']
+    count = min(len(uris), len(tests))
+    if count <= 1:
+        return _send(uris[0], request, code)
+
+    shards = [tests[i::count] for i in range(count)]
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        futures = [executor.submit(_send, uri, dict(request, tests=shard), code)
+                   for uri, shard in zip(uris, shards)]
+        results = [future.result() for future in futures]
+    return merge_results(tests, results)
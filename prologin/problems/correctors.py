@@ -0,0 +1,256 @@
+"""
+Client-side pool of camisole correctors.
+
+Each corrector of PROBLEMS_CORRECTORS gets a persistent keep-alive HTTP
+session. Requests are dispatched to the least loaded correctors first, load
+being the number of in-flight requests (shared between workers through Redis
+when available) divided by the corrector weight.
+
+Correctors failing PROBLEMS_CORRECTOR_FAILURE_THRESHOLD times in a row are
+taken out of rotation (circuit open) for PROBLEMS_CORRECTOR_CIRCUIT_COOLDOWN
+seconds. After that, they are used again (circuit half-open) once the periodic
+problems.tasks.probe_correctors task found them healthy on their health
+endpoint: a success closes the circuit, a failure opens it again. The probe
+results are shared through Redis, corrections never wait for a probe.
+
+When Redis is unavailable, it is not tried again for
+PROBLEMS_CORRECTOR_REDIS_RETRY_DELAY seconds and the load of each corrector is
+counted in this process only.
+"""
+import contextlib
+import logging
+import threading
+import time
+import urllib.parse
+
+import redis
+import requests
+from django.conf import settings
+from prometheus_client import Gauge
+
+logger = logging.getLogger(__name__)
+
+corrector_in_flight = Gauge(
+    'prologin_corrector_in_flight',
+    "Requests being processed by a corrector", ['corrector'])
+corrector_circuit_open = Gauge(
+    'prologin_corrector_circuit_open',
+    "Whether a corrector is taken out of rotation after repeated failures", ['corrector'])
+
+
+class Corrector:
+    def __init__(self, uri, weight=1):
+        self.uri = uri
+        self.weight = weight
+        self.session = requests.Session()
+        self.in_flight = 0
+        self.failures = 0
+        self.opened_at = None
+        self.open_until = None
+
+    def __repr__(self):
+        return '<Corrector: {}>'.format(self.uri)
+
+    @property
+    def health_uri(self):
+        # camisole lists its languages next to the /run endpoint
+        return urllib.parse.urljoin(self.uri, 'languages')
+
+    @property
+    def redis_key(self):
+        return settings.PROBLEMS_CORRECTOR_IN_FLIGHT_REDIS_KEY.format(uri=self.uri)
+
+    def is_open(self, now):
+        return self.open_until is not None and now < self.open_until
+
+    def is_half_open(self, now):
+        return self.open_until is not None and now >= self.open_until
+
+
+class CorrectorPool:
+    def __init__(self, definitions):
+        self._lock = threading.Lock()
+        self.correctors = []
+        for definition in definitions:
+            # either 'uri' or ('uri', weight)
+            if isinstance(definition, str):
+                definition = (definition,)
+            self.correctors.append(Corrector(*definition))
+        self._by_uri = {corrector.uri: corrector for corrector in self.correctors}
+        self._redis = None
+        self._redis_retry_at = 0
+
+    def __getitem__(self, uri):
+        return self._by_uri[uri]
+
+    def _store(self):
+        """The Redis store, None while it is deemed unavailable."""
+        if time.monotonic() < self._redis_retry_at:
+            return None
+        if self._redis is None:
+            self._redis = redis.StrictRedis(**settings.PROLOGIN_UTILITY_REDIS_STORE)
+        return self._redis
+
+    def _redis_failed(self):
+        # do not pay the connection timeout on every request while Redis is down
+        logger.exception("corrector pool: Redis unavailable, retrying in %d seconds",
+                         settings.PROBLEMS_CORRECTOR_REDIS_RETRY_DELAY)
+        self._redis_retry_at = time.monotonic() + settings.PROBLEMS_CORRECTOR_REDIS_RETRY_DELAY
+
+    def _loads(self):
+        """In-flight request count per corrector, across all workers if possible."""
+        store = self._store()
+        if store is not None:
+            try:
+                counts = store.mget([corrector.redis_key for corrector in self.correctors])
+                return {corrector: max(0, int(count or 0)) for corrector, count in zip(self.correctors, counts)}
+            except redis.exceptions.RedisError:
+                self._redis_failed()
+        with self._lock:
+            return {corrector: corrector.in_flight for corrector in self.correctors}
+
+    def _healthy_since(self):
+        """Time of the last successful probe per corrector URI, as recorded by probe_all()."""
+        store = self._store()
+        if store is not None:
+            try:
+                probes = store.hgetall(settings.PROBLEMS_CORRECTOR_HEALTH_REDIS_KEY)
+                return {uri.decode(): float(date) for uri, date in probes.items()}
+            except redis.exceptions.RedisError:
+                self._redis_failed()
+        return {}
+
+    def probe(self, corrector) -> bool:
+        """Check whether `corrector` answers on its health endpoint."""
+        try:
+            response = corrector.session.get(corrector.health_uri,
+                                             timeout=settings.PROBLEMS_CORRECTOR_CONNECT_TIMEOUT)
+            response.raise_for_status()
+            return True
+        except requests.RequestException:
+            return False
+
+    def probe_all(self):
+        """
+        Probe every corrector and record the healthy ones in Redis, for ordered()
+        to put them back in rotation. Returns the {corrector: healthy} mapping.
+        """
+        health = {corrector: self.probe(corrector) for corrector in self.correctors}
+        now = time.time()
+        key = settings.PROBLEMS_CORRECTOR_HEALTH_REDIS_KEY
+        store = self._store()
+        if store is not None:
+            try:
+                with store.pipeline() as pipe:
+                    for corrector, healthy in health.items():
+                        if healthy:
+                            pipe.hset(key, corrector.uri, now)
+                        else:
+                            pipe.hdel(key, corrector.uri)
+                    pipe.execute()
+            except redis.exceptions.RedisError:
+                self._redis_failed()
+        return health
+
+    def ordered(self):
+        """
+        Correctors to try, least loaded first.
+        Correctors with an open circuit come last; those whose cooldown is over
+        are put back in rotation once probed healthy since their circuit opened.
+        """
+        now = time.time()
+        healthy_since = {}
+        if any(corrector.is_half_open(now) for corrector in self.correctors):
+            healthy_since = self._healthy_since()
+        available = []
+        unavailable = []
+        for corrector in self.correctors:
+            if corrector.is_open(now):
+                unavailable.append(corrector)
+            elif corrector.is_half_open(now) and healthy_since.get(corrector.uri, 0) <= corrector.opened_at:
+                unavailable.append(corrector)
+            else:
+                available.append(corrector)
+        loads = self._loads()
+        available.sort(key=lambda corrector: loads[corrector] / corrector.weight)
+        return available + unavailable
+
+    def _record_failure(self, corrector):
+        with self._lock:
+            corrector.failures += 1
+            if corrector.failures >= settings.PROBLEMS_CORRECTOR_FAILURE_THRESHOLD:
+                now = time.time()
+                if not corrector.is_open(now):
+                    logger.warning("[%s] corrector failed %d times, taking it out of rotation",
+                                   corrector.uri, corrector.failures)
+                corrector.opened_at = now
+                corrector.open_until = now + settings.PROBLEMS_CORRECTOR_CIRCUIT_COOLDOWN
+                corrector_circuit_open.labels(corrector.uri).set(1)
+
+    def _record_success(self, corrector):
+        with self._lock:
+            corrector.failures = 0
+            corrector.opened_at = None
+            corrector.open_until = None
+            corrector_circuit_open.labels(corrector.uri).set(0)
+
+    @contextlib.contextmanager
+    def _track(self, corrector):
+        # sharded corrections post from several threads
+        with self._lock:
+            corrector.in_flight += 1
+        corrector_in_flight.labels(corrector.uri).inc()
+        store = self._store()
+        if store is not None:
+            try:
+                with store.pipeline() as pipe:
+                    pipe.incr(corrector.redis_key)
+                    # do not leak load from killed workers forever
+                    pipe.expire(corrector.redis_key, 2 * settings.PROBLEMS_CORRECTOR_REQUEST_TIMEOUT)
+                    pipe.execute()
+            except redis.exceptions.RedisError:
+                self._redis_failed()
+                store = None
+        try:
+            yield
+        finally:
+            with self._lock:
+                corrector.in_flight -= 1
+            corrector_in_flight.labels(corrector.uri).dec()
+            # only decrement what was incremented
+            if store is not None:
+                try:
+                    store.decr(corrector.redis_key)
+                except redis.exceptions.RedisError:
+                    self._redis_failed()
+
+    def post(self, uri, **kwargs) -> requests.Response:
+        """
+        POST to the corrector at `uri` using its persistent session, recording
+        its load and health. Raises requests.RequestException on failure.
+        """
+        corrector = self[uri]
+        kwargs.setdefault('timeout', (settings.PROBLEMS_CORRECTOR_CONNECT_TIMEOUT,
+                                      settings.PROBLEMS_CORRECTOR_REQUEST_TIMEOUT))
+        with self._track(corrector):
+            try:
+                response = corrector.session.post(uri, **kwargs)
+                response.raise_for_status()
+            except requests.RequestException:
+                self._record_failure(corrector)
+                raise
+        self._record_success(corrector)
+        return response
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> CorrectorPool:
+    """The process-wide pool for PROBLEMS_CORRECTORS."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CorrectorPool(settings.PROBLEMS_CORRECTORS)
+        return _pool
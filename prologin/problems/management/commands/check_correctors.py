@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from problems.correctors import get_pool
+
+
+class Command(BaseCommand):
+    help = "Health check the correctors of PROBLEMS_CORRECTORS"
+
+    def handle(self, *args, **options):
+        pool = get_pool()
+        if not pool.correctors:
+            raise CommandError("No corrector configured in PROBLEMS_CORRECTORS.")
+
+        failed = 0
+        for corrector in pool.correctors:
+            healthy = pool.probe(corrector)
+            failed += not healthy
+            self.stdout.write("{:<8} {} (weight {})".format("OK" if healthy else "FAILED",
+                                                           corrector.uri, corrector.weight))
+        if failed:
+            raise CommandError("{} corrector(s) failed the health check.".format(failed))
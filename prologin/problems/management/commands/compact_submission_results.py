@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from problems import camisole
+from problems.models import SubmissionCode
+
+
+class Command(BaseCommand):
+    help = "Compress the stored correction results and truncate their long outputs"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Number of results converted at once")
+
+    def needs_truncation(self, result):
+        runs = [result.get('compile')] + list(result.get('tests') or [])
+        return any(len(run.get(key) or '') > settings.PROBLEMS_RESULT_MAX_OUTPUT
+                   for run in runs if run for key in ('stdout', 'stderr'))
+
+    def handle(self, *args, **options):
+        last_pk = 0
+        converted = truncated = 0
+        while True:
+            codes = list(SubmissionCode.objects
+                         .filter(pk__gt=last_pk, result__isnull=False)
+                         .select_related('submission')
+                         .only('pk', 'result', 'submission__challenge', 'submission__problem')
+                         .order_by('pk')[:options['batch_size']])
+            if not codes:
+                break
+            for code in codes:
+                if self.needs_truncation(code.result):
+                    # truncated outputs can not be checked anymore
+                    try:
+                        camisole.store_verdicts(code.submission.problem_model(), code.result)
+                    except ObjectDoesNotExist:
+                        pass
+                truncated += camisole.compact_result(code.result)
+            with transaction.atomic():
+                # saving compresses the results
+                SubmissionCode.objects.bulk_update(codes, ['result'])
+            converted += len(codes)
+            last_pk = codes[-1].pk
+            self.stdout.write("{} results converted, {} truncated".format(converted, truncated))
@@ -0,0 +1,35 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from problems.bundle import BUNDLE_FILE_NAME, write_bundle
+from problems.models import Challenge
+
+
+class Command(BaseCommand):
+    help = ("Compile challenges into single-file bundles read by the website instead of the problem files. "
+            "Re-run this command every time the problems repository is updated, or use --clean.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('challenges', nargs='*', metavar='challenge',
+                            help="Low-level challenge names, eg. demi2015 (default: all)")
+        parser.add_argument('--clean', action='store_true',
+                            help="Remove the bundles instead, so files are read from the repository")
+
+    def handle(self, *args, **options):
+        names = options['challenges'] or [challenge.name for challenge in Challenge.all()]
+
+        for name in sorted(names):
+            path = os.path.join(settings.PROBLEMS_REPOSITORY_PATH, name)
+            if not os.path.isdir(path):
+                raise CommandError("No such challenge: {}".format(name))
+            if options['clean']:
+                try:
+                    os.unlink(os.path.join(path, BUNDLE_FILE_NAME))
+                    self.stdout.write("{}: removed bundle".format(name))
+                except FileNotFoundError:
+                    pass
+                continue
+            count = write_bundle(path)
+            self.stdout.write("{}: bundled {} files".format(name, count))
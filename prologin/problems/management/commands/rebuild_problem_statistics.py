@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import Count, Q
+from django.core.management.base import BaseCommand
+
+from problems.models import ProblemLanguageStatistics, ProblemStatistics, Submission, SubmissionCode
+
+
+class Command(BaseCommand):
+    help = "Recompute problem statistics from all submissions, dropping the incrementally maintained ones"
+
+    def handle(self, *args, **options):
+        submissions = (Submission.objects
+                       .filter(user__is_staff=False)
+                       .values('challenge', 'problem')
+                       .annotate(tackled=Count('pk', filter=Q(codes__score__isnull=False), distinct=True),
+                                 solved=Count('pk', filter=Q(score_base__gt=0), distinct=True)))
+        codes = (SubmissionCode.objects
+                 .filter(submission__user__is_staff=False, score__isnull=False)
+                 .values('submission__challenge', 'submission__problem', 'language')
+                 .annotate(attempts=Count('pk'), successes=Count('pk', filter=Q(score__gt=0))))
+
+        with transaction.atomic():
+            ProblemStatistics.objects.all().delete()
+            statistics = {}
+            for row in submissions:
+                statistics[row['challenge'], row['problem']] = ProblemStatistics(
+                    challenge=row['challenge'], problem=row['problem'],
+                    tackled=row['tackled'], solved=row['solved'])
+            languages = []
+            for row in codes:
+                stats = statistics[row['submission__challenge'], row['submission__problem']]
+                stats.attempts += row['attempts']
+                languages.append((stats, ProblemLanguageStatistics(language=row['language'],
+                                                                   attempts=row['attempts'],
+                                                                   successes=row['successes'])))
+            ProblemStatistics.objects.bulk_create(statistics.values())
+            if not all(stats.pk for stats in statistics.values()):
+                # backends that do not return primary keys from bulk_create()
+                pks = {(stats.challenge, stats.problem): stats.pk for stats in ProblemStatistics.objects.all()}
+                for stats in statistics.values():
+                    stats.pk = pks[stats.challenge, stats.problem]
+            for stats, language_stats in languages:
+                language_stats.statistics = stats
+            ProblemLanguageStatistics.objects.bulk_create(language for stats, language in languages)
+
+        self.stdout.write("Rebuilt statistics for {} problems".format(len(statistics)))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ObjectDoesNotExist
+
+from problems.models import Challenge
+from prologin.templatetags.markup import cached_flavored_markdown
+
+
+class Command(BaseCommand):
+    help = "Render problem subjects and sample comments to warm the rendered markup cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('challenges', nargs='*', metavar='challenge',
+                            help="Low-level challenge names, eg. demi2015 (default: all)")
+
+    def handle(self, *args, **options):
+        if options['challenges']:
+            try:
+                challenges = [Challenge.by_low_level_name(name) for name in options['challenges']]
+            except ObjectDoesNotExist as e:
+                raise CommandError(str(e))
+        else:
+            challenges = list(Challenge.all())
+
+        for challenge in challenges:
+            rendered = 0
+            for problem in challenge.problems:
+                # Same arguments as the problem template, so the cache keys match
+                if problem.subject_markdown:
+                    cached_flavored_markdown(problem.subject_markdown, False)
+                    rendered += 1
+                for sample in problem.samples:
+                    if sample.comment:
+                        cached_flavored_markdown(sample.comment, False)
+                        rendered += 1
+            self.stdout.write("{}: rendered {} documents".format(challenge.name, rendered))
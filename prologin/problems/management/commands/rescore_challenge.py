@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from problems.models import Challenge, SubmissionCode
+from problems.rescore import rescore_problem
+from problems.scheduling import BULK
+from problems.views import correct_submission
+
+
+class Command(BaseCommand):
+    help = "Recompute the scores of a challenge submissions from their stored correction results"
+
+    def add_arguments(self, parser):
+        parser.add_argument('challenge', help="Low-level challenge name, eg. demi2015")
+        parser.add_argument('problems', nargs='*', metavar='problem', help="Problem names (default: all)")
+        parser.add_argument('--recheck', action='store_true',
+                            help="Check outputs again instead of reusing the stored verdicts "
+                                 "(use when the custom checker changed, verdicts are checked again "
+                                 "when their expected output changed; truncated outputs keep their verdict)")
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help="Number of codes scored and written back at once")
+        parser.add_argument('--dry-run', action='store_true', help="Only report the changes")
+
+    def handle(self, *args, **options):
+        try:
+            challenge = Challenge.by_low_level_name(options['challenge'])
+        except ObjectDoesNotExist as e:
+            raise CommandError(str(e))
+        if options['problems']:
+            try:
+                problems = [challenge.problem(name) for name in options['problems']]
+            except KeyError:
+                raise CommandError("Unknown problem in {}".format(', '.join(options['problems'])))
+        else:
+            problems = challenge.problems
+
+        total = 0
+        for problem in problems:
+            changes, code_changes, stale_codes = rescore_problem(problem, recheck=options['recheck'],
+                                                                 dry_run=options['dry_run'],
+                                                                 chunk_size=options['chunk_size'])
+            total += len(changes)
+            self.stdout.write("{}: {} code scores and {} submission scores changed, "
+                              "{} codes to correct again as the tests changed".format(
+                                  problem.name, code_changes, len(changes), len(stale_codes)))
+            if not options['dry_run']:
+                for code in (SubmissionCode.objects.filter(pk__in=[code.pk for code in stale_codes])
+                             .select_related('submission')):
+                    correct_submission(code, priority=BULK)
+            if options['verbosity'] >= 2:
+                for change in changes:
+                    self.stdout.write("  submission {} (user {}): score {} malus {} -> score {} malus {}".format(
+                        change.submission.pk, change.submission.user_id, *change.old, *change.new))
+
+        if options['dry_run']:
+            self.stdout.write("Dry run, nothing was written.")
+        elif total:
+            # solved counts may have changed
+            call_command('rebuild_problem_statistics', stdout=self.stdout)
+            if settings.PROLOGIN_SEMIFINAL_MODE:
+                # unlocks depend on solved problems
+                call_command('rebuild_semifinal_unlocks', stdout=self.stdout)
+                call_command('rebuild_semifinal_scoreboard', stdout=self.stdout)
@@ -3,7 +3,7 @@ from django.db import transaction
 import celery
 
 from problems.models import SubmissionCode
-from problems.tasks import submit_problem_code
+from problems.scheduling import schedule_correction
 
 
 class Command(BaseCommand):
@@ -37,4 +37,4 @@ class Command(BaseCommand):
 
         for submission in self.get_submissions():
             self.stdout.write('{}: {}'.format(submission.pk, submission.celery_task_id))
-            submit_problem_code.apply_async(args=[submission.pk], task_id=submission.celery_task_id)
+            schedule_correction(submission)
@@ -0,0 +1,45 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+import prologin.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('problems', '0006_result_remove_json'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProblemStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('challenge', models.CharField(db_index=True, max_length=64)),
+                ('problem', models.CharField(db_index=True, max_length=64)),
+                ('tackled', models.PositiveIntegerField(default=0)),
+                ('solved', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Problem statistics',
+                'verbose_name_plural': 'Problem statistics',
+                'unique_together': {('challenge', 'problem')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProblemLanguageStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('language', prologin.models.CodingLanguageField(choices=[('ada', 'Ada'), ('c', 'C'), ('csharp', 'C#'), ('cpp', 'C++'), ('d', 'D'), ('go', 'Go'), ('haskell', 'Haskell'), ('java', 'Java'), ('js', 'Javascript'), ('lua', 'Lua'), ('ocaml', 'OCaml'), ('pascal', 'Pascal'), ('perl', 'Perl'), ('php', 'PHP'), ('pseudocode', 'Pseudocode'), ('python', 'Python'), ('ruby', 'Ruby'), ('rust', 'Rust'), ('scheme', 'Scheme')], max_length=64, verbose_name='Coding language')),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('successes', models.PositiveIntegerField(default=0)),
+                ('statistics', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='languages', to='problems.ProblemStatistics')),
+            ],
+            options={
+                'verbose_name': 'Problem language statistics',
+                'verbose_name_plural': 'Problem language statistics',
+                'unique_together': {('statistics', 'language')},
+            },
+        ),
+    ]
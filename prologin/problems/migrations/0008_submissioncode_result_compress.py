@@ -0,0 +1,18 @@
+from django.db import migrations
+
+import prologin.utils.db
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('problems', '0007_problemstatistics'),
+    ]
+
+    operations = [
+        # existing rows are converted by the compact_submission_results command
+        migrations.AlterField(
+            model_name='submissioncode',
+            name='result',
+            field=prologin.utils.db.MsgpackField(blank=True, null=True, compress=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_attempts(apps, schema_editor):
+    Submission = apps.get_model('problems', 'Submission')
+    SubmissionCode = apps.get_model('problems', 'SubmissionCode')
+    alias = schema_editor.connection.alias
+    codes = SubmissionCode.objects.using(alias).filter(submission=OuterRef('pk')).order_by().values('submission')
+    Submission.objects.using(alias).update(
+        attempts=Coalesce(Subquery(codes.annotate(count=Count('pk')).values('count')[:1]), 0),
+        date_first_success=Subquery(codes.filter(score__gt=0).annotate(date=Min('date_submitted')).values('date')[:1]))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('problems', '0008_submissioncode_result_compress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='submission',
+            name='date_first_success',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_attempts, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from .submission import Submission, SubmissionCode, ExplicitProblemUnlock
 from .problem import Challenge, Problem
+from .statistics import ProblemStatistics, ProblemLanguageStatistics
 from collections import namedtuple
 from django.utils.translation import ugettext_lazy as _
 
@@ -13,6 +14,8 @@ __all__ = [
     'ExplicitProblemUnlock',
     'Challenge',
     'Problem',
+    'ProblemStatistics',
+    'ProblemLanguageStatistics',
     'QUALIFICATION_TUP',
     'REGIONAL_TUP'
 ]
@@ -1,4 +1,5 @@
 import enum
+import hashlib
 import os
 import re
 from collections import namedtuple
@@ -7,8 +8,11 @@ from django.core.exceptions import ObjectDoesNotExist
 from typing import Optional
 
 from contest.models import Event
+from problems.bundle import BUNDLE_FILE_NAME, Bundle
+from problems.registry import registry, shared_attr
+from problems.search import SearchIndex
 from prologin.languages import Language
-from prologin.utils import open_try_hard, lazy_attr, read_props
+from prologin.utils import open_try_hard, lazy_attr, parse_props
 
 PROBLEM_NAME_PATTERN = r'^[a-z0-9_.-]+$'
 
@@ -19,12 +23,47 @@ class TestType(enum.Enum):
 
 
 class Test:
-    def __init__(self, name: str, type: TestType, hidden: bool, stdin: str, stdout: str):
+    """
+    A problem test.
+
+    Metadata (name, type, hidden) is known upfront. Input and output payloads
+    are loaded on first access and shared by the whole process, see
+    Problem.read_test(); they are never kept by the Test itself.
+    """
+    def __init__(self, problem: 'Problem', name: str, type: TestType, hidden: bool):
+        self._problem = problem
         self.name = name
         self.type = type
         self.hidden = hidden
-        self.stdin = stdin
-        self.stdout = stdout
+
+    def __repr__(self):
+        return '<Test: {} of {!r}>'.format(self.name, self._problem)
+
+    @property
+    def stdin(self) -> str:
+        return self._problem.read_test(self.name + '.in')
+
+    @property
+    def stdout(self) -> str:
+        return self._problem.read_test(self.name + '.out')
+
+    @property
+    def stdin_hash(self) -> str:
+        """SHA-256 hex digest of the UTF-8 encoded input, used to identify it in corrector requests."""
+        return self._problem.test_input_hashes[self.name]
+
+    @property
+    def stdout_hash(self) -> str:
+        """SHA-256 hex digest of the UTF-8 encoded expected output, recorded with stored verdicts."""
+        return self._problem.test_output_hashes[self.name]
+
+    @property
+    def stdin_size(self) -> int:
+        return self._problem.size('test', self.name + '.in')
+
+    @property
+    def stdout_size(self) -> int:
+        return self._problem.size('test', self.name + '.out')
 
 
 class Challenge:
@@ -67,7 +106,7 @@ class Challenge:
 
         :return list of Challenge instances
         """
-        for challenge_dir in os.listdir(settings.PROBLEMS_REPOSITORY_PATH):
+        for challenge_dir in cls._directories():
             if not challenge_dir.startswith('.') and any(challenge_dir.startswith(e)
                                                          for e in cls._type_to_low_level.values()):
                 try:
@@ -75,6 +114,11 @@ class Challenge:
                 except ObjectDoesNotExist:
                     pass
 
+    @classmethod
+    def _directories(cls):
+        return registry.get(registry.ROOT, ('directories',),
+                            lambda: frozenset(os.listdir(settings.PROBLEMS_REPOSITORY_PATH)))
+
     @classmethod
     def by_low_level_name(cls, name):
         """
@@ -111,7 +155,9 @@ class Challenge:
         self._year = year
         self._event_type = event_type
         path = self.file_path('challenge.props')
-        if not os.path.exists(path):
+        # check the repository listing first so unknown names do not pollute the registry
+        if (self._low_level_name not in Challenge._directories()
+                or not registry.get(self._low_level_name, ('challenge', 'exists'), lambda: os.path.exists(path))):
             raise ObjectDoesNotExist("No such Challenge: no such file: {}".format(path))
 
     def __hash__(self):
@@ -129,30 +175,85 @@ class Challenge:
     def file_path(self, *tail):
         return os.path.abspath(os.path.join(settings.PROBLEMS_REPOSITORY_PATH, self._low_level_name, *tail))
 
+    def _registry_scope(self):
+        return self._low_level_name
+
+    def _registry_key(self):
+        return ('challenge',)
+
+    def _get_bundle(self):
+        return Bundle.open(self.file_path(BUNDLE_FILE_NAME))
+    bundle = shared_attr('bundle', _get_bundle)
+
+    def exists(self, *tail):
+        """
+        Whether the file or directory at `tail` exists in the challenge, looking
+        in the compiled bundle if there is one.
+        """
+        if self.bundle is not None:
+            return self.bundle.exists(*tail)
+        return os.path.exists(self.file_path(*tail))
+
+    def listdir(self, *tail):
+        if self.bundle is not None:
+            return self.bundle.listdir(*tail)
+        return os.listdir(self.file_path(*tail))
+
+    def read(self, *tail) -> str:
+        """
+        Read the text file at `tail` in the challenge, looking in the compiled
+        bundle if there is one.
+        May raise IOError if the file does not exist.
+        """
+        if self.bundle is not None:
+            return self.bundle.read(*tail)
+        return open_try_hard(lambda f: f.read(), self.file_path(*tail))
+
+    def size(self, *tail) -> int:
+        """
+        Size, in bytes, of the UTF-8 encoded text file at `tail` in the
+        challenge, whatever the encoding of the file in the repository.
+        May raise IOError if the file does not exist.
+        """
+        if self.bundle is not None:
+            return self.bundle.size(*tail)
+        return len(self.read(*tail).encode('utf-8'))
+
     def _get_properties(self):
-        return read_props(self.file_path('challenge.props'))
-    properties = lazy_attr('_properties_', _get_properties)
+        return parse_props(self.read('challenge.props').splitlines())
+    properties = shared_attr('properties', _get_properties)
 
     def _get_subject(self):
-        return open_try_hard(lambda f: f.read(), self.file_path('challenge.txt'))
-    subject = lazy_attr('_subject_', _get_subject)
+        return self.read('challenge.txt')
+    subject = shared_attr('subject', _get_subject)
+
+    def _get_problem_names(self):
+        return frozenset(problem_dir for problem_dir in self.listdir()
+                         if re.match(PROBLEM_NAME_PATTERN, problem_dir) is not None
+                         and self.exists(problem_dir, 'problem.props'))
+    problem_names = shared_attr('problem_names', _get_problem_names)
 
     def _get_problems(self):
         # Do NOT use a generator
-        problems = []
-        for problem_dir in os.listdir(self.file_path()):
-            if os.path.isdir(self.file_path(problem_dir)):
-                try:
-                    problems.append(Problem(self, problem_dir))
-                except ObjectDoesNotExist:
-                    pass
-        return sorted(problems)
+        # Problem instances are per-Challenge as views monkey-patch them; their data is shared
+        return sorted(Problem(self, problem_name) for problem_name in self.problem_names)
     problems = lazy_attr('_problems_', _get_problems)
 
     def _get_problems_dict(self):
         return {problem.name: problem for problem in self.problems}
     problems_dict = lazy_attr('_problems_dict_', _get_problems_dict)
 
+    def _get_search_index(self):
+        return SearchIndex(self.problems)
+    search_index = shared_attr('search_index', _get_search_index)
+
+    def _get_version(self):
+        # computed again whenever the registry reloads the challenge
+        definition = (sorted(self.properties.items()),
+                      [(problem.name, problem.difficulty) for problem in self.problems])
+        return hashlib.sha256(repr(definition).encode()).hexdigest()
+    version = shared_attr('version', _get_version)
+
     def problem(self, name):
         return self.problems_dict[name]
 
@@ -225,7 +326,7 @@ class Problem:
                 'Invalid problem name "{}": does not match '
                 'regular expression {}'
                 .format(name, PROBLEM_NAME_PATTERN))
-        if not os.path.exists(props_path):
+        if name not in challenge.problem_names:
             raise ObjectDoesNotExist("No such Problem: no such file: {}".format(props_path))
         self._challenge = challenge
         self._name = name
@@ -248,48 +349,79 @@ class Problem:
     def file_path(self, *tail):
         return self._challenge.file_path(self._name, *tail)
 
+    def _registry_scope(self):
+        return self._challenge.name
+
+    def _registry_key(self):
+        return ('problem', self._name)
+
+    def exists(self, *tail):
+        return self._challenge.exists(self._name, *tail)
+
+    def listdir(self, *tail):
+        return self._challenge.listdir(self._name, *tail)
+
+    def read(self, *tail) -> str:
+        return self._challenge.read(self._name, *tail)
+
+    def size(self, *tail) -> int:
+        return self._challenge.size(self._name, *tail)
+
+    def read_test(self, name) -> str:
+        """
+        Read the test file `name`. Without a bundle, whose mapping is already
+        shared, the payload is read once and kept in the process-wide registry.
+        """
+        if self._challenge.bundle is not None:
+            return self.read('test', name)
+        return registry.get(self._registry_scope(), self._registry_key() + ('test', name),
+                            lambda: self.read('test', name))
+
     def _get_properties(self):
-        return read_props(self.file_path('problem.props'))
-    properties = lazy_attr('_properties_', _get_properties)
+        return parse_props(self.read('problem.props').splitlines())
+    properties = shared_attr('properties', _get_properties)
 
     def _get_subject(self):
-        subject_path_md = self.file_path('subject.md')
-        subject_path_txt = self.file_path('subject.txt')
-        if os.path.exists(subject_path_md):
-            return open_try_hard(lambda f: f.read(), subject_path_md), 'markdown'
-        elif os.path.exists(subject_path_txt):
-            return open_try_hard(lambda f: f.read(), subject_path_txt), 'html'
-    subject = lazy_attr('_subject_', _get_subject)
-
-    def _get_tests(self):
-        tests_in = {}
-        tests_out = {}
-        for item in os.listdir(self.file_path('test')):
-            full_path = self.file_path('test', item)
+        if self.exists('subject.md'):
+            return self.read('subject.md'), 'markdown'
+        elif self.exists('subject.txt'):
+            return self.read('subject.txt'), 'html'
+    subject = shared_attr('subject', _get_subject)
+
+    def _get_test_names(self):
+        tests_in = set()
+        tests_out = set()
+        for item in self.listdir('test'):
             if item.endswith('.in') or item.endswith('.out'):
                 name = os.path.splitext(item)[0]
                 storage = tests_in if item.endswith('.in') else tests_out
-                def store_item(f):
-                    storage[name] = f.read()
-                open_try_hard(store_item, full_path)
+                storage.add(name)
+        return tuple(sorted(tests_in & tests_out))
+    test_names = shared_attr('test_names', _get_test_names)
 
+    def _get_tests(self):
         perf = self.performance_tests
         hidden = self.hidden_tests
-
-        def gen():
-            for key in sorted(tests_in.keys() & tests_out.keys()):
-                yield Test(key, TestType.performance if key in perf else TestType.correction,
-                           key in hidden, tests_in[key], tests_out[key])
-        return list(gen())
+        return [Test(self, name, TestType.performance if name in perf else TestType.correction, name in hidden)
+                for name in self.test_names]
     tests = lazy_attr('_tests_', _get_tests)
 
+    def _get_test_input_hashes(self):
+        return {name: hashlib.sha256(self.read_test(name + '.in').encode('utf-8')).hexdigest()
+                for name in self.test_names}
+    test_input_hashes = shared_attr('test_input_hashes', _get_test_input_hashes)
+
+    def _get_test_output_hashes(self):
+        return {name: hashlib.sha256(self.read_test(name + '.out').encode('utf-8')).hexdigest()
+                for name in self.test_names}
+    test_output_hashes = shared_attr('test_output_hashes', _get_test_output_hashes)
+
     def _get_hidden_tests(self):
         return set(str(self.properties.get('hidden', '')).split())
     hidden_tests = lazy_attr('_hidden_tests_', _get_hidden_tests)
 
     def _get_correction_tests(self):
-        perf_tests = set(self.performance_tests)
-        return sorted(test for test in set(test.rsplit('.', 1)[0] for test in self.tests) if test not in perf_tests)
+        return [test.name for test in self.tests if test.type is TestType.correction]
     correction_tests = lazy_attr('_correction_tests_', _get_correction_tests)
 
     def _get_performance_tests(self):
@@ -298,12 +430,11 @@ class Problem:
 
     def _get_language_templates(self):
         templates = {}
-        if not os.path.exists(self.file_path('skeleton')):
+        if not self.exists('skeleton'):
             return templates
-        for item in os.listdir(self.file_path('skeleton')):
-            full_path = self.file_path('skeleton', item)
+        for item in self.listdir('skeleton'):
             try:
-                base_name, ext = os.path.splitext(os.path.basename(full_path))
+                base_name, ext = os.path.splitext(item)
             except ValueError:
                 # unpacking error
                 continue
@@ -314,11 +445,9 @@ class Problem:
             if lang is None:
                 # unknown extension
                 continue
-            def store_item(f):
-                templates[lang] = f.read()
-            open_try_hard(store_item, full_path)
+            templates[lang] = self.read('skeleton', item)
         return templates
-    language_templates = lazy_attr('_language_templates_', _get_language_templates)
+    language_templates = shared_attr('language_templates', _get_language_templates)
 
     @property
     def challenge(self):
@@ -377,17 +506,11 @@ class Problem:
         samples = []
         for sample in str(self.properties.get('samples', '')).split():
             try:
-                sample_in = open_try_hard(
-                    lambda f: f.read(),
-                    self.file_path('test', sample) + '.in')
-                sample_out = open_try_hard(
-                    lambda f: f.read(),
-                    self.file_path('test', sample) + '.out')
+                sample_in = self.read('test', sample + '.in')
+                sample_out = self.read('test', sample + '.out')
                 sample_comment = ''
                 try:
-                    sample_comment = open_try_hard(
-                        lambda f: f.read(),
-                        self.file_path('test', sample) + '.comment')
+                    sample_comment = self.read('test', sample + '.comment')
                 except IOError:
                     pass
                 samples.append(Problem.Sample(sample_in, sample_out,
@@ -395,10 +518,15 @@ class Problem:
             except IOError:
                 pass
         return samples
-    samples = lazy_attr('_samples_', _get_samples)
+    samples = shared_attr('samples', _get_samples)
 
     @property
     def custom_check(self) -> Optional[str]:
         if self.properties.get('custom-check') is not None:
             return self.file_path(self.properties.get('custom-check'))
         return None
+
+    @property
+    def custom_check_batch(self) -> bool:
+        # the custom checker speaks the batch protocol, see camisole.BatchChecker
+        return self.properties.get('custom-check-batch', False)
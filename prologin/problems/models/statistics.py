@@ -0,0 +1,66 @@
+from django.db import models
+from django.db.models import F
+from django.utils.translation import ugettext_lazy as _
+from django_prometheus.models import ExportModelOperationsMixin
+
+from prologin.models import CodingLanguageField
+
+
+class ProblemStatistics(ExportModelOperationsMixin('problem_statistics'), models.Model):
+    """
+    Denormalized statistics of a problem over non-staff users, updated by
+    submit_problem_code() when corrections complete.
+    Use the rebuild_problem_statistics command to recompute them from scratch.
+    """
+    challenge = models.CharField(max_length=64, db_index=True)
+    problem = models.CharField(max_length=64, db_index=True)
+    # users having at least one corrected code
+    tackled = models.PositiveIntegerField(default=0)
+    solved = models.PositiveIntegerField(default=0)
+    # corrected codes
+    attempts = models.PositiveIntegerField(default=0)
+
+    @property
+    def average_attempts(self):
+        return self.attempts / self.tackled if self.tackled else 0
+
+    @classmethod
+    def record(cls, challenge, problem, language=None, tackled=0, solved=0, attempts=0, successes=0):
+        """
+        Atomically add the given deltas to the statistics of `problem` and of
+        its `language` breakdown, if given.
+        """
+        stats, created = cls.objects.get_or_create(challenge=challenge, problem=problem)
+        cls.objects.filter(pk=stats.pk).update(tackled=F('tackled') + tackled,
+                                               solved=F('solved') + solved,
+                                               attempts=F('attempts') + attempts)
+        if language is None:
+            return
+        language_stats, created = ProblemLanguageStatistics.objects.get_or_create(statistics=stats,
+                                                                                  language=language)
+        (ProblemLanguageStatistics.objects.filter(pk=language_stats.pk)
+         .update(attempts=F('attempts') + attempts, successes=F('successes') + successes))
+
+    def __str__(self):
+        return "{}/{}".format(self.challenge, self.problem)
+
+    class Meta:
+        verbose_name = _("Problem statistics")
+        verbose_name_plural = _("Problem statistics")
+        unique_together = ('challenge', 'problem')
+
+
+class ProblemLanguageStatistics(models.Model):
+    statistics = models.ForeignKey(ProblemStatistics, related_name='languages', on_delete=models.CASCADE)
+    language = CodingLanguageField()
+    # corrected codes
+    attempts = models.PositiveIntegerField(default=0)
+    successes = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return "{} in {}".format(self.statistics, self.language)
+
+    class Meta:
+        verbose_name = _("Problem language statistics")
+        verbose_name_plural = _("Problem language statistics")
+        unique_together = ('statistics', 'language')
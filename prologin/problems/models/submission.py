@@ -3,8 +3,10 @@ from typing import List, Optional
 
 from django.conf import settings
 from django.db import models
-from django.db.models import F
-from django.db.models.functions import Coalesce, Greatest
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.encoding import force_text
@@ -124,6 +126,7 @@ class Result:
             ref_dict = {ref.name: ref for ref in references}
             test_dict = {test['name']: test for test in tests if test}
             custom_check = problem.custom_check
+            batch = problem.custom_check_batch
 
             for ref in references:
                 is_corr = ref.type is TestType.correction
@@ -134,7 +137,7 @@ class Result:
                     storage.append(Result.SkippedTest(ref.name))
                     continue
 
-                test_ok = test_passes(ref_dict[test['name']], test, custom_check)
+                test_ok = test_passes(ref_dict[test['name']], test, custom_check, batch)
                 storage.append(Result.Test(data=test, reference=ref, test_passes=test_ok))
                 if not test_ok and problem.stop_early:
                     skipped = True
@@ -164,6 +167,10 @@ class Submission(ExportModelOperationsMixin('submission'), models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='training_submissions', on_delete=models.CASCADE)
     score_base = models.IntegerField(default=0)
     malus = models.IntegerField(default=0)
+    # denormalized from the codes: number of codes, and submission date of the
+    # first successful one
+    attempts = models.PositiveIntegerField(default=0)
+    date_first_success = models.DateTimeField(null=True, blank=True)
 
     def challenge_model(self) -> Challenge:
         return Challenge.by_low_level_name(self.challenge)
@@ -177,6 +184,13 @@ class Submission(ExportModelOperationsMixin('submission'), models.Model):
     def first_code_success(self):
         return self.codes.filter(score__gt=0).earliest()
 
+    def record_success(self, date):
+        """Atomically lower date_first_success to `date` if it is earlier."""
+        (Submission.objects.filter(pk=self.pk)
+         .update(date_first_success=Least(Coalesce(F('date_first_success'), Value(date)), Value(date))))
+        if self.date_first_success is None or date < self.date_first_success:
+            self.date_first_success = date
+
     def score(self):
         return max(0, self.score_base - self.malus)
 
@@ -211,7 +225,17 @@ class SubmissionCode(ExportModelOperationsMixin('submission_code'), models.Model
     date_submitted = models.DateTimeField(default=timezone.now)
     date_corrected = models.DateTimeField(null=True, blank=True)
     celery_task_id = models.CharField(max_length=128, blank=True)
-    result = MsgpackField(null=True, blank=True)
+    result = MsgpackField(null=True, blank=True, compress=True)
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            Submission.objects.filter(pk=self.submission_id).update(attempts=F('attempts') + 1)
+            if SubmissionCode.submission.is_cached(self):
+                self.submission.attempts += 1
+            if self.score:
+                self.submission.record_success(self.date_submitted)
 
     def done(self):
         return not self.correctable() or self.score is not None
@@ -261,13 +285,21 @@ class SubmissionCode(ExportModelOperationsMixin('submission_code'), models.Model
             'problem': problem.name, 'submission': self.id,
         })
 
-    def generate_request(self) -> dict:
-        """Generate a camisole request for the SubmissionCode."""
+    def generate_request(self, content_addressed=False) -> dict:
+        """
+        Generate a camisole request for the SubmissionCode.
+
+        :param content_addressed: identify test inputs by their hash
+               (`stdin_hash`) instead of inlining them (`stdin`)
+        """
         problem = self.submission.problem_model()
 
         def build_tests():
             for ref in problem.tests:
-                yield {'name': ref.name, 'stdin': ref.stdin}
+                if content_addressed:
+                    yield {'name': ref.name, 'stdin_hash': ref.stdin_hash}
+                else:
+                    yield {'name': ref.name, 'stdin': ref.stdin}
 
         language = self.language_enum()
         request = {
@@ -320,3 +352,11 @@ class ExplicitProblemUnlock(models.Model):
         verbose_name = _("Explicit problem unlock")
         verbose_name_plural = _("Explicit problem unlocks")
         unique_together = [('challenge', 'problem', 'user')]
+
+
+@receiver(post_save, sender=ExplicitProblemUnlock)
+@receiver(post_delete, sender=ExplicitProblemUnlock)
+def explicit_problem_unlock_changed(sender, instance, **kwargs):
+    from contest.models import SemifinalUnlockState
+    SemifinalUnlockState.refresh(instance.user, instance.challenge)
+
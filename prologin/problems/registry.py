@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+class _Scope:
+    def __init__(self, signature, checked_at):
+        self.signature = signature
+        self.checked_at = checked_at
+        self.values = {}
+
+
+class Registry:
+    """
+    Process-wide store for data read from the problems repository, shared by
+    all Challenge and Problem instances of the worker.
+
+    Values are grouped by scope: Registry.ROOT for the repository itself, or a
+    challenge low-level name (eg. 'demi2015'). A scope is dropped as soon as the
+    modification times of its directories and property files change. They are
+    checked at most once every PROBLEMS_REGISTRY_CHECK_INTERVAL seconds.
+
+    Stored values are shared between requests and threads: callers must treat
+    them as immutable.
+
+    >> registry.get('demi2015', ('problem', 'foo', 'properties'), loader)
+    """
+    ROOT = ''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._scopes = {}
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _signature(self, scope):
+        root = settings.PROBLEMS_REPOSITORY_PATH
+        if scope == self.ROOT:
+            return self._mtime(root)
+        path = os.path.join(root, scope)
+        signature = [self._mtime(path), self._mtime(os.path.join(path, 'challenge.props'))]
+        try:
+            entries = sorted(os.scandir(path), key=lambda e: e.name)
+        except OSError:
+            return tuple(signature)
+        for entry in entries:
+            if not entry.is_dir():
+                continue
+            signature.append((entry.name, entry.stat().st_mtime_ns,
+                              self._mtime(os.path.join(entry.path, 'problem.props')),
+                              self._mtime(os.path.join(entry.path, 'test')),
+                              self._mtime(os.path.join(entry.path, 'skeleton'))))
+        return tuple(signature)
+
+    def _scope(self, scope):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._scopes.get(scope)
+            if entry is None or now - entry.checked_at >= settings.PROBLEMS_REGISTRY_CHECK_INTERVAL:
+                signature = self._signature(scope)
+                if entry is None or entry.signature != signature:
+                    entry = _Scope(signature, now)
+                    self._scopes[scope] = entry
+                entry.checked_at = now
+            return entry
+
+    def get(self, scope, key, loader):
+        """
+        Return the value stored for `key` in `scope`, calling `loader()` to
+        compute it if it is missing or if the scope was invalidated.
+        """
+        values = self._scope(scope).values
+        try:
+            return values[key]
+        except KeyError:
+            value = loader()
+            values[key] = value
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
+
+
+registry = Registry()
+
+
+def shared_attr(key, getter):
+    """
+    Like prologin.utils.lazy_attr, but the result of `getter` is also stored in
+    the process-wide registry, under the scope of the instance challenge, so
+    other instances of the same object do not read the repository again.
+
+    The owner class must define `_registry_scope()` and `_registry_key()`.
+    """
+    prop_name = '_{}_'.format(key)
+
+    def wrapped(self):
+        try:
+            return getattr(self, prop_name)
+        except AttributeError:
+            data = registry.get(self._registry_scope(), self._registry_key() + (key,),
+                                lambda: getter(self))
+            setattr(self, prop_name, data)
+            return data
+    return property(wrapped)
@@ -0,0 +1,146 @@
+"""
+Bulk score recomputation from stored correction results, for when the
+difficulty, validation percentage or tests of a problem change.
+"""
+import collections
+import itertools
+
+from django.db import transaction
+
+from problems import camisole
+from problems.models import Submission, SubmissionCode
+from problems.models.problem import Problem
+
+ScoreChange = collections.namedtuple('ScoreChange', 'submission old new')
+
+
+def replay_submission(difficulty: int, legacy: bool, scores: list) -> (int, int):
+    """
+    Compute the (score_base, malus) of a submission from the scores of its
+    codes, in submission order (None for codes not corrected), like
+    tasks.submit_problem_code() does one correction at a time.
+
+    tasks.submit_problem_code() computes the malus from Submission.attempts at
+    correction time, which is not stored per code. The replay uses the number
+    of codes submitted up to the best one instead. Both agree unless a code was
+    submitted while the best one was still being corrected.
+    """
+    score_base = malus = 0
+    for position, score in enumerate(scores):
+        if score is None:
+            continue
+        if legacy:
+            # Old scoring scheme <= 2023
+            if score_base < score:
+                score_base = score
+            elif score == 0 and score_base == 0 and malus < 4 ** (difficulty + 1):
+                malus += int(4 ** (difficulty - 1))
+        elif score_base < score:
+            score_base = score
+            if difficulty > 0:
+                # one malus per code submitted before the best one, ie.
+                # `attempts - 1` when this code was submitted
+                malus = min(20 * position, 500)
+    return score_base, malus
+
+
+def _verdicts(result):
+    return [(test.get('passes'), test.get('expected_sha256')) for test in result.get('tests') or [] if test]
+
+
+def rescore_problem(problem: Problem, recheck=False, dry_run=False, chunk_size=1000) -> (list, int, list):
+    """
+    Recompute the score of every code submitted to `problem` from its stored
+    result, then the score and malus of every submission. Codes without a
+    result keep their score, as do codes whose result can not be scored again
+    because the tests changed (see camisole.needs_recorrection()); these are
+    returned to be corrected again.
+
+    Stored verdicts are checked again when the expected output of their test
+    changed.
+
+    Results are scored `chunk_size` codes at a time, and changes are written
+    back with one bulk update per chunk.
+
+    :param recheck: check outputs again instead of reusing the stored verdicts,
+                    when expected outputs or the custom checker changed
+    :param dry_run: only report changes
+    :return: the list of ScoreChange of submissions, the number of code
+             scores that changed, and the list of SubmissionCode to correct
+             again
+    """
+    difficulty = problem.difficulty
+    legacy = problem.validation_percent is None
+    submissions = {submission.pk: submission for submission in
+                   (Submission.objects
+                    .filter(challenge=problem.challenge.name, problem=problem.name)
+                    .only('pk', 'user', 'challenge', 'problem', 'score_base', 'malus', 'date_first_success'))}
+    codes = (SubmissionCode.objects
+             .filter(submission__in=submissions.keys())
+             .only('pk', 'submission', 'score', 'result', 'date_submitted')
+             .order_by('submission_id', 'date_submitted', 'pk')
+             .iterator(chunk_size=chunk_size))
+
+    changes = []
+    code_changes = 0
+    stale_codes = []
+
+    def flush(groups):
+        nonlocal code_changes
+        scored = []
+        for code in (code for group in groups for code in group if code.result is not None):
+            if camisole.needs_recorrection(problem, code.result):
+                stale_codes.append(code)
+            else:
+                scored.append(code)
+        reverified = set()
+        for code in scored:
+            if recheck:
+                for test in code.result.get('tests') or []:
+                    # truncated outputs can not be checked again
+                    if test and 'stdout_size' not in test:
+                        test.pop('passes', None)
+            verdicts = _verdicts(code.result)
+            # also checks again the outputs of tests whose expected output changed
+            camisole.store_verdicts(problem, code.result)
+            if _verdicts(code.result) != verdicts:
+                reverified.add(code.pk)
+        changed_codes = []
+        for code, score in zip(scored, camisole.get_scores(problem, [code.result for code in scored])):
+            if recheck or score != code.score or code.pk in reverified:
+                code_changes += score != code.score
+                code.score = score
+                changed_codes.append(code)
+
+        changed_submissions = []
+        for group in groups:
+            submission = submissions[group[0].submission_id]
+            old = (submission.score_base, submission.malus)
+            new = replay_submission(difficulty, legacy, [code.score for code in group])
+            date_first_success = min((code.date_submitted for code in group if code.score), default=None)
+            if new != old:
+                changes.append(ScoreChange(submission, old, new))
+            if new != old or date_first_success != submission.date_first_success:
+                submission.score_base, submission.malus = new
+                submission.date_first_success = date_first_success
+                changed_submissions.append(submission)
+
+        if dry_run:
+            return
+        with transaction.atomic():
+            SubmissionCode.objects.bulk_update(changed_codes, ['score', 'result'])
+            Submission.objects.bulk_update(changed_submissions, ['score_base', 'malus', 'date_first_success'])
+
+    groups = []
+    pending = 0
+    for submission_id, group in itertools.groupby(codes, key=lambda code: code.submission_id):
+        groups.append(list(group))
+        pending += len(groups[-1])
+        if pending >= chunk_size:
+            flush(groups)
+            groups = []
+            pending = 0
+    if groups:
+        flush(groups)
+
+    return changes, code_changes, stale_codes
@@ -1,8 +1,17 @@
 from django.conf import settings
 import rules
 
+from prologin.utils.memoize import request_memoize
+
+
+@request_memoize
+def available_semifinal_problems(user):
+    from contest.models import Contestant
+    return Contestant.objects.get(user=user, edition=settings.PROLOGIN_EDITION).available_semifinal_problems
+
 
 @rules.predicate
+@request_memoize
 def is_challenge_displayable(user, challenge):
     if settings.PROLOGIN_SEMIFINAL_MODE:
         if not user.is_authenticated:
@@ -13,13 +22,13 @@ def is_challenge_displayable(user, challenge):
 
 
 @rules.predicate
+@request_memoize
 def can_view_problem(user, problem):
     displayable = is_challenge_displayable(user, problem.challenge)
     if not displayable:
         return False
     if settings.PROLOGIN_SEMIFINAL_MODE:
-        from contest.models import Contestant
-        return problem in Contestant.objects.get(user=user, edition=settings.PROLOGIN_EDITION).available_semifinal_problems
+        return problem in available_semifinal_problems(user)
     return displayable
 
 
@@ -0,0 +1,91 @@
+"""
+Correction priority classes and per-user fairness.
+
+Corrections are sent to one queue per priority class, so each class can be
+served by its own workers. Users with many corrections still pending get
+their next ones demoted to the next class, so they cannot delay other users.
+"""
+import logging
+import time
+
+import redis
+import redis.exceptions
+from django.conf import settings
+
+from contest.models import Event
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, from the most to the least urgent
+CONTEST = 'contest'
+QUALIFICATION = 'qualification'
+TRAINING = 'training'
+BULK = 'bulk'
+PRIORITIES = (CONTEST, QUALIFICATION, TRAINING, BULK)
+
+
+def queue_for(priority: str) -> str:
+    return settings.PROBLEMS_CORRECTION_QUEUE.format(priority=priority)
+
+
+def correction_priority(submission_code) -> str:
+    """Priority class of a correction, before fairness is applied."""
+    submission = submission_code.submission
+    event_type = submission.challenge_model().event_type
+    if settings.PROLOGIN_SEMIFINAL_MODE and event_type is Event.Type.semifinal:
+        return CONTEST
+    if event_type is Event.Type.qualification and submission.challenge_model().year == settings.PROLOGIN_EDITION:
+        return QUALIFICATION
+    return TRAINING
+
+
+def _pending_key(user_pk):
+    return settings.PROBLEMS_CORRECTION_PENDING_REDIS_KEY.format(user=user_pk)
+
+
+def _add_pending(submission_code) -> int:
+    """Record `submission_code` as pending; returns how many others of its user are."""
+    key = _pending_key(submission_code.submission.user_id)
+    now = time.time()
+    store = redis.StrictRedis(**settings.PROLOGIN_UTILITY_REDIS_STORE)
+    with store.pipeline() as pipe:
+        # forget corrections that never completed
+        pipe.zremrangebyscore(key, '-inf', now - settings.PROBLEMS_CORRECTION_PENDING_TIMEOUT)
+        pipe.zcard(key)
+        pipe.zadd(key, {submission_code.pk: now})
+        pipe.expire(key, settings.PROBLEMS_CORRECTION_PENDING_TIMEOUT)
+        _, pending, _, _ = pipe.execute()
+    return pending
+
+
+def correction_done(submission_code):
+    """Remove `submission_code` from the pending corrections of its user."""
+    try:
+        store = redis.StrictRedis(**settings.PROLOGIN_UTILITY_REDIS_STORE)
+        store.zrem(_pending_key(submission_code.submission.user_id), submission_code.pk)
+    except redis.exceptions.RedisError:
+        pass
+
+
+def schedule_correction(submission_code, priority=None, **kwargs):
+    """
+    Send `submission_code` to the correction queue of its priority class
+    (see correction_priority()), demoted once if its user has more than
+    PROBLEMS_CORRECTION_FAIR_SHARE corrections pending.
+
+    **kwargs are passed verbatim to apply_async().
+    """
+    from problems.tasks import submit_problem_code
+
+    if priority is None:
+        priority = correction_priority(submission_code)
+    try:
+        pending = _add_pending(submission_code)
+    except redis.exceptions.RedisError:
+        pending = 0
+    if pending >= settings.PROBLEMS_CORRECTION_FAIR_SHARE and priority != BULK:
+        priority = PRIORITIES[PRIORITIES.index(priority) + 1]
+        logger.info("user %s has %d corrections pending, demoting to %s",
+                    submission_code.submission.user_id, pending, priority)
+    return submit_problem_code.apply_async(args=[submission_code.pk], task_id=submission_code.celery_task_id,
+                                           queue=queue_for(priority), **kwargs)
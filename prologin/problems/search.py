@@ -0,0 +1,67 @@
+import collections
+
+from django.utils.text import slugify
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """
+    In-memory index over the problems of a challenge, matching slugified
+    queries against slugified problem titles.
+
+    Queries of three characters or more are answered by intersecting the
+    trigram postings of the query, then checking the candidates. Matches are
+    ranked (lower is better):
+        0. the title is the query,
+        1. the title starts with the query,
+        2. a word of the title starts with the query,
+        3. the title contains the query.
+    """
+    EXACT, PREFIX, WORD_PREFIX, SUBSTRING = range(4)
+
+    def __init__(self, problems):
+        self._slugs = {}
+        self._difficulties = {}
+        self._trigrams = collections.defaultdict(set)
+        for problem in problems:
+            slug = slugify(problem.title)
+            self._slugs[problem.name] = slug
+            self._difficulties[problem.name] = problem.difficulty
+            for trigram in trigrams(slug):
+                self._trigrams[trigram].add(problem.name)
+
+    def _rank(self, slug, query):
+        if slug == query:
+            return self.EXACT
+        if slug.startswith(query):
+            return self.PREFIX
+        if any(word.startswith(query) for word in slug.split('-')):
+            return self.WORD_PREFIX
+        return self.SUBSTRING
+
+    def search(self, query='', difficulty_min=None, difficulty_max=None):
+        """
+        :param query: slugified query; empty matches every problem
+        :return: dict of problem name to rank
+        """
+        if len(query) >= 3:
+            postings = sorted((self._trigrams.get(trigram, set()) for trigram in trigrams(query)), key=len)
+            candidates = set.intersection(*postings)
+        else:
+            candidates = self._slugs.keys()
+
+        results = {}
+        for name in candidates:
+            difficulty = self._difficulties[name]
+            if difficulty_min is not None and difficulty < difficulty_min:
+                continue
+            if difficulty_max is not None and difficulty > difficulty_max:
+                continue
+            slug = self._slugs[name]
+            if query not in slug:
+                continue
+            results[name] = self._rank(slug, query) if query else self.EXACT
+        return results
@@ -6,8 +6,11 @@ from django.db import transaction
 from django.utils import timezone
 from prometheus_client import Counter, Histogram
 
+from contest.models import SemifinalUnlockState
 from problems import camisole
-from problems.models import SubmissionCode
+from problems.correctors import get_pool
+from problems.scheduling import correction_done
+from problems.models import ProblemStatistics, Submission, SubmissionCode
 
 logger = get_task_logger('prologin.problems')
 
@@ -19,10 +22,11 @@ correction_score = Histogram(
     "Problem submission score by problem", ['problem'])
 
 
-@shared_task(autoretry_for=(requests.RequestException,),
+@shared_task(bind=True,
+             autoretry_for=(requests.RequestException,),
              default_retry_delay=3,
-             retry_kwargs={'max_retries': 5})
-def submit_problem_code(code_submission_id):
+             max_retries=5)
+def submit_problem_code(self, code_submission_id):
     """
     Submit the code to a camisole backend.
     Update the database with the result (including score & malus).
@@ -41,12 +45,8 @@ def submit_problem_code(code_submission_id):
 
     prometheus_stat_key = '{}/{}'.format(submission.challenge, submission.problem)
 
-    def update_submission(score, result):
-        """
-        Update the Submission and CodeSubmission.
-        :param score: the score, as computed by get_score()
-        :param result: the submission result, as computed by parse_xml()
-        """
+    def update_scores(submission, score):
+        """Update the score_base and malus of `submission` with a new code `score`."""
         if legacy:
             # Old scoring scheme <= 2023
             max_malus = 4 ** (difficulty + 1)
@@ -70,43 +70,124 @@ def submit_problem_code(code_submission_id):
             if submission.score_base < score:
                 submission.score_base = score
                 if difficulty > 0:
-                    submission.malus = min(incr_malus * (SubmissionCode.objects
-                                    .select_related("submission")
-                                    .filter(submission=submission)
-                                    .count() - 1), max_malus)
+                    submission.malus = min(incr_malus * (submission.attempts - 1), max_malus)
 
-
-        code_submission.score = score
+    def update_submission(score, result):
+        """
+        Update the Submission and CodeSubmission.
+        :param score: the score, as computed by get_score()
+        :param result: the submission result, as computed by parse_xml()
+        :return: whether the score of the Submission changed
+        """
         code_submission.result = result
         code_submission.date_corrected = timezone.now()
 
         # stats
-        correction_score.labels(prometheus_stat_key).observe(code_submission.score)
+        correction_score.labels(prometheus_stat_key).observe(score)
         with transaction.atomic():
+            # Concurrent corrections of codes of the same submission are
+            # serialized by this lock, so scores and statistics deltas are
+            # computed from the stored state, not from the state at task start
+            locked = (Submission.objects
+                      .select_for_update()
+                      .select_related('user')
+                      .get(pk=code_submission.submission_id))
+            code_submission.submission = locked
+            previous_code_score = (SubmissionCode.objects
+                                   .filter(pk=code_submission.pk)
+                                   .values_list('score', flat=True)
+                                   .get())
+            # recorrections are not new attempts
+            first_correction = previous_code_score is None
+            # the problem is tackled with the first corrected code of the submission
+            first_tackle = first_correction and not (SubmissionCode.objects
+                                                     .filter(submission=locked, score__isnull=False)
+                                                     .exclude(pk=code_submission.pk)
+                                                     .exists())
+            previously_succeeded = bool(previous_code_score)
+            previously_solved = locked.succeeded()
+            previous_score = locked.score()
+
+            update_scores(locked, score)
+            code_submission.score = score
             code_submission.save()
-            submission.save()
-
-    # Try all PROBLEMS_CORRECTORS, in the order defined in settings
+            # attempts is incremented concurrently by new codes
+            locked.save(update_fields=['score_base', 'malus'])
+            if code_submission.succeeded():
+                locked.record_success(code_submission.date_submitted)
+                # may unlock new semifinal problems
+                SemifinalUnlockState.refresh(locked.user, locked.challenge)
+            if not locked.user.is_staff:
+                ProblemStatistics.record(locked.challenge, locked.problem, code_submission.language,
+                                         tackled=int(first_tackle),
+                                         solved=int(locked.succeeded()) - int(previously_solved),
+                                         attempts=int(first_correction),
+                                         successes=int(code_submission.succeeded()) - int(previously_succeeded))
+            return locked.score() != previous_score
+
+    # Reuse the result of an identical submission, if any
+    # With sharding enabled, then try to spread the tests over several correctors
+    # Then try all PROBLEMS_CORRECTORS, least loaded and healthy ones first
     # Stop at first working
+    corrector_uris = [corrector.uri for corrector in get_pool().ordered()]
+    attempts = []
+    cached_result = camisole.get_cached_result(code_submission)
+    if cached_result is not None:
+        attempts.append(('cache', lambda: cached_result))
+    shards = min(settings.PROBLEMS_CORRECTOR_SHARDS, len(corrector_uris))
+    if shards > 1:
+        shard_uris = corrector_uris[:shards]
+        attempts.append((', '.join(shard_uris),
+                         lambda: camisole.submit_sharded(shard_uris, code_submission)))
+    for corrector_uri in corrector_uris:
+        attempts.append((corrector_uri,
+                         lambda corrector_uri=corrector_uri: camisole.submit(corrector_uri, code_submission)))
+
     last_exc = None
-    for corrector_uri in settings.PROBLEMS_CORRECTORS:
-        try:
-            logger.info("[%s] correcting: %s…", corrector_uri, code_submission)
-
-            result = camisole.submit(corrector_uri, code_submission)
-            logger.debug("camisole result: %r", result)
-            if not result['success']:
-                raise RuntimeError("camisole interal error:\n{}".format(result['error']))
-            score = camisole.get_score(problem, result)
-            update_submission(score, result)
-
-            logger.info("[%s] corrected successfully: %s", corrector_uri, code_submission)
-            correction_status.labels(prometheus_stat_key, 'ok').inc()
-            return result
-        except Exception as exc:  # noqa
-            last_exc = exc
-            logger.exception("[%s] corrector failed", corrector_uri)
-            correction_status.labels(prometheus_stat_key, 'error').inc()
-
-    logger.error("all correctors failed to correct %s", code_submission)
-    raise last_exc
+    corrected = False
+    score_changed = False
+    try:
+        for corrector_label, submit in attempts:
+            try:
+                logger.info("[%s] correcting: %s…", corrector_label, code_submission)
+
+                result = submit()
+                logger.debug("camisole result: %r", result)
+                if not result['success']:
+                    raise RuntimeError("camisole interal error:\n{}".format(result['error']))
+                camisole.cache_result(code_submission, result)
+                camisole.store_verdicts(problem, result)
+                score = camisole.get_score(problem, result)
+                camisole.compact_result(result)
+                score_changed = update_submission(score, result)
+                corrected = True
+
+                logger.info("[%s] corrected successfully: %s", corrector_label, code_submission)
+                correction_status.labels(prometheus_stat_key, 'ok').inc()
+                return result
+            except Exception as exc:  # noqa
+                last_exc = exc
+                logger.exception("[%s] corrector failed", corrector_label)
+                correction_status.labels(prometheus_stat_key, 'error').inc()
+
+        logger.error("all correctors failed to correct %s", code_submission)
+        raise last_exc
+    finally:
+        # requests errors are retried (autoretry_for) until max_retries
+        retried = (not corrected and isinstance(last_exc, requests.RequestException)
+                   and self.request.retries < self.max_retries)
+        if not retried:
+            # also when failing, so the user is not demoted until the pending entry times out
+            correction_done(code_submission)
+        if score_changed and settings.PROLOGIN_SEMIFINAL_MODE:
+            import semifinal.scoreboard
+            # committed by now, and outside of the corrector attempts
+            semifinal.scoreboard.update_score(submission.user)
+
+
+@shared_task
+def probe_correctors():
+    """Periodically health check the correctors, see problems.correctors."""
+    for corrector, healthy in get_pool().probe_all().items():
+        if not healthy:
+            logger.warning("[%s] corrector failed its health check", corrector.uri)
@@ -0,0 +1,870 @@
+import collections
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+import unittest.mock
+
+import redis.exceptions
+import requests
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from contest.models import Event
+from problems import camisole, scheduling
+from problems.bundle import Bundle, write_bundle
+from problems.correctors import CorrectorPool
+from problems.models import ProblemStatistics, Submission, SubmissionCode
+from problems.models.problem import Challenge
+from problems.registry import Registry, registry
+from prologin.languages import Language
+from prologin.utils import open_try_hard
+from problems.rescore import replay_submission, rescore_problem
+from problems.search import SearchIndex
+from problems.tasks import submit_problem_code
+from prologin.tests import ProloginTestCase
+
+FakeProblem = collections.namedtuple('FakeProblem', 'name title difficulty')
+
+
+class BundleTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = self.tmp.name
+        os.makedirs(os.path.join(self.path, 'foo', 'test'))
+        with open(os.path.join(self.path, 'challenge.props'), 'w') as f:
+            f.write("title: Foo\n")
+        with open(os.path.join(self.path, 'foo', 'problem.props'), 'w') as f:
+            f.write("title: Foo\ndifficulty: 1\n")
+        with open(os.path.join(self.path, 'foo', 'test', 'a.in'), 'wb') as f:
+            f.write("énoncé\n".encode('latin-1'))
+        with open(os.path.join(self.path, 'foo', 'test', 'a.out'), 'w') as f:
+            f.write("42\n")
+        with open(os.path.join(self.path, 'foo', 'notes.txt'), 'w') as f:
+            f.write("not bundled\n")
+
+    def test_read(self):
+        self.assertEqual(write_bundle(self.path), 4)
+        with Bundle(os.path.join(self.path, 'challenge.bundle')) as bundle:
+            self.assertEqual(bundle.read('challenge.props'), "title: Foo\n")
+            self.assertEqual(bundle.read('foo', 'test', 'a.out'), "42\n")
+            # re-encoded to UTF-8 at compile time
+            self.assertEqual(bundle.read('foo', 'test', 'a.in'), "énoncé\n")
+            self.assertEqual(bundle.size('foo', 'test', 'a.in'), len("énoncé\n".encode('utf-8')))
+
+    def test_listing(self):
+        write_bundle(self.path)
+        with Bundle(os.path.join(self.path, 'challenge.bundle')) as bundle:
+            self.assertEqual(sorted(bundle.listdir()), ['challenge.props', 'foo'])
+            self.assertEqual(sorted(bundle.listdir('foo', 'test')), ['a.in', 'a.out'])
+            self.assertTrue(bundle.exists('foo', 'test'))
+            self.assertFalse(bundle.exists('foo', 'notes.txt'))
+
+    def test_missing(self):
+        write_bundle(self.path)
+        with Bundle(os.path.join(self.path, 'challenge.bundle')) as bundle:
+            with self.assertRaises(FileNotFoundError):
+                bundle.read('foo', 'test', 'b.in')
+            with self.assertRaises(FileNotFoundError):
+                bundle.size('foo', 'test', 'b.in')
+            with self.assertRaises(FileNotFoundError):
+                bundle.listdir('bar')
+        self.assertIsNone(Bundle.open(os.path.join(self.path, 'missing.bundle')))
+
+    def test_close(self):
+        write_bundle(self.path)
+        bundle = Bundle(os.path.join(self.path, 'challenge.bundle'))
+        bundle.close()
+        bundle.close()
+        with self.assertRaises(ValueError):
+            bundle.read('challenge.props')
+
+    def test_not_a_bundle(self):
+        with self.assertRaises(ValueError):
+            Bundle(os.path.join(self.path, 'challenge.props'))
+
+
+class RegistryTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.props = os.path.join(self.tmp.name, 'demi2015', 'foo', 'problem.props')
+        os.makedirs(os.path.dirname(self.props))
+        with open(self.props, 'w') as f:
+            f.write("title: Foo\n")
+        self.registry = Registry()
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        with open(self.props) as f:
+            return f.read()
+
+    def get(self):
+        return self.registry.get('demi2015', ('problem', 'foo', 'properties'), self.load)
+
+    def touch(self, content):
+        with open(self.props, 'w') as f:
+            f.write(content)
+        # do not depend on the file system timestamp resolution
+        stat = os.stat(self.props)
+        os.utime(self.props, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    @override_settings(PROBLEMS_REGISTRY_CHECK_INTERVAL=0)
+    def test_reload_on_change(self):
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name):
+            self.assertEqual(self.get(), "title: Foo\n")
+            self.assertEqual(self.get(), "title: Foo\n")
+            self.assertEqual(self.loads, 1)
+            self.touch("title: Bar\n")
+            self.assertEqual(self.get(), "title: Bar\n")
+            self.assertEqual(self.loads, 2)
+
+    @override_settings(PROBLEMS_REGISTRY_CHECK_INTERVAL=3600)
+    def test_check_interval(self):
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name):
+            self.get()
+            self.touch("title: Bar\n")
+            self.assertEqual(self.get(), "title: Foo\n")
+            self.registry.clear()
+            self.assertEqual(self.get(), "title: Bar\n")
+
+
+def write_problem(root, props="title: Foo\ndifficulty: 1\n", tests=(('a.in', "1 2\n"), ('a.out', "3\n"))):
+    """Write the 'foo' problem of a 'demi2015' challenge in the repository at `root`."""
+    path = os.path.join(root, 'demi2015')
+    os.makedirs(os.path.join(path, 'foo', 'test'), exist_ok=True)
+    with open(os.path.join(path, 'challenge.props'), 'w') as f:
+        f.write("title: Foo\n")
+    with open(os.path.join(path, 'foo', 'problem.props'), 'w') as f:
+        f.write(props)
+    for name, content in tests:
+        with open(os.path.join(path, 'foo', 'test', name), 'w') as f:
+            f.write(content)
+    return path
+
+
+class TestPayloadTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = write_problem(self.tmp.name)
+        registry.clear()
+        self.addCleanup(registry.clear)
+
+    def get_test(self):
+        challenge = Challenge.by_year_and_event_type(2015, Event.Type.semifinal)
+        test, = challenge.problem('foo').tests
+        return test
+
+    def test_read_once(self):
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name):
+            with unittest.mock.patch('problems.models.problem.open_try_hard', wraps=open_try_hard) as read:
+                self.assertEqual(self.get_test().stdout, "3\n")
+                self.assertEqual(self.get_test().stdout, "3\n")
+            paths = [call[0][1] for call in read.call_args_list]
+            self.assertEqual(paths.count(os.path.join(self.path, 'foo', 'test', 'a.out')), 1)
+
+    def test_bundle(self):
+        write_bundle(self.path)
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name):
+            test = self.get_test()
+            self.assertEqual((test.stdin, test.stdout), ("1 2\n", "3\n"))
+
+
+class ResultCacheKeyTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(registry.clear)
+
+    def key(self, **kwargs):
+        # separate repositories, so no registry invalidation delay is involved
+        root = tempfile.mkdtemp(dir=self.tmp.name)
+        write_problem(root, **kwargs)
+        registry.clear()
+        code = SubmissionCode(submission=Submission(challenge='demi2015', problem='foo'),
+                              language=Language.python.name, code="print(3)\r\n")
+        with self.settings(PROBLEMS_REPOSITORY_PATH=root):
+            return camisole.result_cache_key(code)
+
+    def test_same_submission(self):
+        self.assertEqual(self.key(), self.key())
+
+    def test_test_input(self):
+        self.assertNotEqual(self.key(), self.key(tests=(('a.in', "1 3\n"), ('a.out', "3\n"))))
+
+    def test_tests(self):
+        self.assertNotEqual(self.key(), self.key(tests=(('a.in', "1 2\n"), ('a.out', "3\n"),
+                                                        ('b.in', "2 2\n"), ('b.out', "4\n"))))
+
+    def test_limits(self):
+        self.assertNotEqual(self.key(props="title: Foo\ntime: 1000\n"),
+                            self.key(props="title: Foo\ntime: 2000\n"))
+
+
+class SearchIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = SearchIndex([
+            FakeProblem('sum', "Sum", 1),
+            FakeProblem('sum-of-squares', "Sum of squares", 3),
+            FakeProblem('checksum', "Checksum", 5),
+            FakeProblem('big-sums', "Big sums", 7),
+            FakeProblem('maze', "Maze", 2),
+        ])
+
+    def test_ranking(self):
+        self.assertEqual(self.index.search('sum'), {
+            'sum': SearchIndex.EXACT,
+            'sum-of-squares': SearchIndex.PREFIX,
+            'big-sums': SearchIndex.WORD_PREFIX,
+            'checksum': SearchIndex.SUBSTRING,
+        })
+
+    def test_short_query(self):
+        self.assertEqual(set(self.index.search('ma')), {'maze'})
+        self.assertEqual(set(self.index.search('')), {'sum', 'sum-of-squares', 'checksum', 'big-sums', 'maze'})
+
+    def test_substring(self):
+        # 'msq' is no trigram of any title
+        self.assertEqual(self.index.search('sumsq'), {})
+        self.assertEqual(self.index.search('squares'), {'sum-of-squares': SearchIndex.WORD_PREFIX})
+        self.assertEqual(self.index.search('of-squ'), {'sum-of-squares': SearchIndex.SUBSTRING})
+
+    def test_difficulty(self):
+        self.assertEqual(set(self.index.search('sum', difficulty_min=3)), {'sum-of-squares', 'checksum', 'big-sums'})
+        self.assertEqual(set(self.index.search('sum', difficulty_min=3, difficulty_max=5)),
+                         {'sum-of-squares', 'checksum'})
+        self.assertEqual(set(self.index.search('', difficulty_max=1)), {'sum'})
+
+    def test_no_match(self):
+        self.assertEqual(self.index.search('zzz'), {})
+
+
+def run(name, status='OK', exitcode=0):
+    return {'name': name, 'exitcode': exitcode, 'meta': {'status': status}}
+
+
+class MergeResultsTest(SimpleTestCase):
+    tests = [{'name': name} for name in ('a', 'b', 'c', 'd')]
+
+    def test_request_order(self):
+        results = [{'success': True, 'tests': [run('a'), run('c')]},
+                   {'success': True, 'tests': [run('b'), run('d')]}]
+        merged = camisole.merge_results(self.tests, results)
+        self.assertTrue(merged['success'])
+        self.assertEqual([test['name'] for test in merged['tests']], ['a', 'b', 'c', 'd'])
+
+    def test_stops_at_first_fatal(self):
+        # the second shard ran 'd' past the fatal 'b'
+        results = [{'success': True, 'tests': [run('a'), run('c')]},
+                   {'success': True, 'tests': [run('b', status='TIMED_OUT'), run('d')]}]
+        merged = camisole.merge_results(self.tests, results)
+        self.assertEqual([test['name'] for test in merged['tests']], ['a', 'b'])
+
+    def test_stops_at_tests_not_run(self):
+        # 'a' was fatal in its shard, so 'c' was not run
+        results = [{'success': True, 'tests': [run('a', exitcode=1)]},
+                   {'success': True, 'tests': [run('b'), run('d')]}]
+        merged = camisole.merge_results(self.tests, results)
+        self.assertEqual([test['name'] for test in merged['tests']], ['a'])
+
+    def test_failure(self):
+        failure = {'success': False, 'error': "boom"}
+        results = [{'success': True, 'tests': [run('a'), run('c')]}, failure]
+        self.assertIs(camisole.merge_results(self.tests, results), failure)
+
+    def test_compilation_error(self):
+        failed = {'success': True, 'compile': {'exitcode': 1}, 'tests': []}
+        results = [failed, {'success': True, 'compile': {'exitcode': 1}, 'tests': []}]
+        self.assertIs(camisole.merge_results(self.tests, results), failed)
+
+
+class SubmitShardedTest(SimpleTestCase):
+    def setUp(self):
+        self.code = unittest.mock.Mock()
+        self.code.generate_request.return_value = {'source': "", 'tests': [{'name': name} for name in 'abcde']}
+
+    def fake_send(self, uri, request, code):
+        return {'success': True, 'tests': [run(test['name']) for test in request['tests']], 'uri': uri}
+
+    def test_shards(self):
+        with unittest.mock.patch('problems.camisole._send', side_effect=self.fake_send) as send:
+            result = camisole.submit_sharded(['http://one/', 'http://two/'], self.code)
+        shards = {call[0][0]: [test['name'] for test in call[0][1]['tests']] for call in send.call_args_list}
+        self.assertEqual(shards, {'http://one/': ['a', 'c', 'e'], 'http://two/': ['b', 'd']})
+        self.assertEqual([test['name'] for test in result['tests']], ['a', 'b', 'c', 'd', 'e'])
+
+    def test_single_shard(self):
+        self.code.generate_request.return_value['tests'] = [{'name': 'a'}]
+        with unittest.mock.patch('problems.camisole._send', side_effect=self.fake_send) as send:
+            result = camisole.submit_sharded(['http://one/', 'http://two/'], self.code)
+        send.assert_called_once()
+        self.assertEqual(result['uri'], 'http://one/')
+
+
+class FakeCorrectorStore:
+    """In-memory Redis, with the commands used by the corrector pool."""
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def incr(self, key):
+        self.data[key] = self.data.get(key, 0) + 1
+
+    def decr(self, key):
+        self.data[key] = self.data.get(key, 0) - 1
+
+    def expire(self, key, seconds):
+        pass
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field.encode()] = str(value).encode()
+
+    def hdel(self, key, field):
+        self.data.get(key, {}).pop(field.encode(), None)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def pipeline(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self):
+        pass
+
+
+@override_settings(PROBLEMS_CORRECTOR_FAILURE_THRESHOLD=2, PROBLEMS_CORRECTOR_CIRCUIT_COOLDOWN=30)
+class CorrectorPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.pool = CorrectorPool(['http://one/run', 'http://two/run'])
+        self.one, self.two = self.pool.correctors
+        for corrector in self.pool.correctors:
+            corrector.session = unittest.mock.Mock()
+        self.store = FakeCorrectorStore()
+        self.pool._redis = self.store
+        self.now = 1000
+        patcher = unittest.mock.patch('problems.correctors.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, corrector, fails=False):
+        corrector.session.post.side_effect = requests.ConnectionError if fails else None
+        if fails:
+            with self.assertRaises(requests.ConnectionError):
+                self.pool.post(corrector.uri)
+        else:
+            self.pool.post(corrector.uri)
+
+    def open_circuit(self, corrector):
+        with self.assertLogs('problems.correctors', 'WARNING'):
+            for _ in range(2):
+                self.post(corrector, fails=True)
+
+    def test_open(self):
+        self.post(self.one, fails=True)
+        self.assertEqual(self.pool.ordered(), [self.one, self.two])
+        self.open_circuit(self.one)
+        self.assertEqual(self.pool.ordered(), [self.two, self.one])
+
+    def test_half_open(self):
+        self.open_circuit(self.one)
+        self.now += 31
+        # not used again until found healthy
+        self.assertEqual(self.pool.ordered(), [self.two, self.one])
+        self.now += 1
+        self.pool.probe_all()
+        self.assertEqual(self.pool.ordered(), [self.one, self.two])
+        self.one.session.get.assert_called_once()
+
+    def test_half_open_needs_a_later_probe(self):
+        self.pool.probe_all()
+        self.now += 1
+        self.open_circuit(self.one)
+        self.now += 31
+        self.assertEqual(self.pool.ordered(), [self.two, self.one])
+
+    def test_failed_probe(self):
+        self.pool.probe_all()
+        self.one.session.get.side_effect = requests.ConnectionError
+        self.assertEqual(self.pool.probe_all(), {self.one: False, self.two: True})
+        self.assertEqual(list(self.pool._healthy_since()), ['http://two/run'])
+
+    def test_close(self):
+        self.open_circuit(self.one)
+        self.now += 31
+        self.pool.probe_all()
+        self.post(self.one)
+        self.assertEqual(self.one.failures, 0)
+        self.assertFalse(self.one.is_open(self.now) or self.one.is_half_open(self.now))
+        # back to the failure threshold
+        self.post(self.one, fails=True)
+        self.assertEqual(self.pool.ordered(), [self.one, self.two])
+
+    def test_reopen(self):
+        self.open_circuit(self.one)
+        self.now += 31
+        self.pool.probe_all()
+        with self.assertLogs('problems.correctors', 'WARNING'):
+            self.post(self.one, fails=True)
+        self.assertEqual(self.pool.ordered(), [self.two, self.one])
+
+    def test_load(self):
+        self.store.data[self.one.redis_key] = 3
+        self.assertEqual(self.pool.ordered(), [self.two, self.one])
+
+    def test_redis_down(self):
+        self.pool._redis = unittest.mock.Mock()
+        self.pool._redis.mget.side_effect = redis.exceptions.ConnectionError
+        self.one.in_flight = 1
+        with self.assertLogs('problems.correctors', 'ERROR'):
+            self.assertEqual(self.pool.ordered(), [self.two, self.one])
+        # not tried again before PROBLEMS_CORRECTOR_REDIS_RETRY_DELAY
+        self.assertEqual(self.pool.ordered(), [self.two, self.one])
+        self.post(self.two)
+        self.assertEqual(self.pool._redis.mget.call_count, 1)
+        self.pool._redis.pipeline.assert_not_called()
+
+
+class FakePendingStore:
+    """In-memory Redis, with the sorted set commands used by the correction scheduling."""
+    def __init__(self):
+        self.data = {}
+
+    def zremrangebyscore(self, key, min, max):
+        entries = self.data.get(key, {})
+        for member in [member for member, score in entries.items() if score <= max]:
+            del entries[member]
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update({str(member): score for member, score in mapping.items()})
+
+    def zrem(self, key, member):
+        self.data.get(key, {}).pop(str(member), None)
+
+    def expire(self, key, seconds):
+        pass
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, store):
+        self.store = store
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return call
+
+    def execute(self):
+        return [getattr(self.store, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+@override_settings(PROBLEMS_CORRECTION_FAIR_SHARE=2, PROBLEMS_CORRECTION_PENDING_TIMEOUT=600)
+class SchedulingTest(SimpleTestCase):
+    def setUp(self):
+        self.store = FakePendingStore()
+        self.now = 1000
+        patchers = [unittest.mock.patch('problems.scheduling.redis.StrictRedis', return_value=self.store),
+                    unittest.mock.patch('problems.scheduling.time.time', side_effect=lambda: self.now),
+                    unittest.mock.patch('problems.tasks.submit_problem_code.apply_async')]
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+        self.apply_async = [patcher.start() for patcher in patchers][-1]
+        self.codes = 0
+
+    def code(self, user_pk=1, event_type=Event.Type.qualification, year=2017):
+        self.codes += 1
+        code = unittest.mock.Mock(pk=self.codes, celery_task_id='task-{}'.format(self.codes))
+        code.submission.user_id = user_pk
+        code.submission.challenge_model.return_value = unittest.mock.Mock(event_type=event_type, year=year)
+        return code
+
+    def schedule(self, code, priority=None):
+        scheduling.schedule_correction(code, priority)
+        return self.apply_async.call_args[1]['queue']
+
+    def test_priorities(self):
+        self.assertEqual(self.schedule(self.code()), 'correction-qualification')
+        self.assertEqual(self.schedule(self.code(user_pk=2, year=2016)), 'correction-training')
+        self.assertEqual(self.schedule(self.code(user_pk=3, event_type=Event.Type.semifinal)),
+                         'correction-training')
+        with self.settings(PROLOGIN_SEMIFINAL_MODE=True):
+            self.assertEqual(self.schedule(self.code(user_pk=4, event_type=Event.Type.semifinal)),
+                             'correction-contest')
+        self.assertEqual(self.schedule(self.code(user_pk=5), scheduling.BULK), 'correction-bulk')
+
+    def test_fair_share(self):
+        queues = [self.schedule(self.code()) for _ in range(4)]
+        self.assertEqual(queues, ['correction-qualification'] * 2 + ['correction-training'] * 2)
+        # other users are not demoted
+        self.assertEqual(self.schedule(self.code(user_pk=2)), 'correction-qualification')
+        # demoted once only, and never past bulk
+        with self.settings(PROLOGIN_SEMIFINAL_MODE=True):
+            queues = [self.schedule(self.code(user_pk=3, event_type=Event.Type.semifinal)) for _ in range(3)]
+        self.assertEqual(queues, ['correction-contest'] * 2 + ['correction-qualification'])
+        queues = [self.schedule(self.code(user_pk=4), scheduling.BULK) for _ in range(3)]
+        self.assertEqual(queues, ['correction-bulk'] * 3)
+
+    def test_correction_done(self):
+        first, second = self.code(), self.code()
+        self.schedule(first)
+        self.schedule(second)
+        scheduling.correction_done(first)
+        self.assertEqual(self.schedule(self.code()), 'correction-qualification')
+
+    def test_pending_timeout(self):
+        self.schedule(self.code())
+        self.schedule(self.code())
+        # never completed
+        self.now += 601
+        self.assertEqual(self.schedule(self.code()), 'correction-qualification')
+
+    def test_redis_down(self):
+        with unittest.mock.patch('problems.scheduling.redis.StrictRedis', side_effect=redis.exceptions.ConnectionError):
+            queues = [self.schedule(self.code()) for _ in range(3)]
+            scheduling.correction_done(self.code())
+        self.assertEqual(queues, ['correction-qualification'] * 3)
+
+
+class ReplaySubmissionTest(SimpleTestCase):
+    def test_legacy(self):
+        # failures add 4 ** (difficulty - 1) until success
+        self.assertEqual(replay_submission(2, True, [0, 0, 10]), (10, 8))
+        self.assertEqual(replay_submission(2, True, [0, 10, 0, 5]), (10, 4))
+        # capped to 4 ** (difficulty + 1)
+        self.assertEqual(replay_submission(1, True, [0] * 20), (0, 16))
+
+    def test_malus_counts_previous_codes(self):
+        self.assertEqual(replay_submission(3, False, [0, None, 0, 50, 30, 80]), (80, 100))
+        self.assertEqual(replay_submission(3, False, [100]), (100, 0))
+        self.assertEqual(replay_submission(3, False, [0] * 30 + [100]), (100, 500))
+
+    def test_no_malus_for_difficulty_zero(self):
+        self.assertEqual(replay_submission(0, False, [0, 0, 10]), (10, 0))
+
+    def test_not_corrected(self):
+        self.assertEqual(replay_submission(3, False, [None, None]), (0, 0))
+        self.assertEqual(replay_submission(3, False, []), (0, 0))
+
+
+FAKE_CHECKER = """#!{python}
+import sys
+import time
+
+stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+if {mode!r} == 'hang':
+    time.sleep(60)
+while True:
+    header = stdin.readline()
+    if not header:
+        break
+    if {mode!r} == 'crash':
+        sys.exit(1)
+    output, test_input, expected = (stdin.read(int(length)) for length in header.split())
+    stdout.write(b'OK\\n' if output.strip() == expected.strip() else b'KO\\n')
+    stdout.flush()
+"""
+
+FakeTest = collections.namedtuple('FakeTest', 'name stdin stdout stdout_hash')
+
+
+@override_settings(PROBLEMS_CUSTOM_CHECK_TIMEOUT=0.5)
+class BatchCheckerTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.test = FakeTest('a', "1 2\n", "3\n", hashlib.sha256(b"3\n").hexdigest())
+
+    def checker(self, mode='ok'):
+        path = os.path.join(self.tmp.name, mode)
+        with open(path, 'w') as f:
+            f.write(FAKE_CHECKER.format(python=sys.executable, mode=mode))
+        os.chmod(path, 0o755)
+        checker = camisole.BatchChecker(path)
+        self.addCleanup(checker.stop)
+        return checker
+
+    def test_verdicts(self):
+        checker = self.checker()
+        self.assertTrue(checker.check(self.test, "3"))
+        process = checker._process
+        self.assertFalse(checker.check(self.test, "4"))
+        self.assertTrue(checker.check(self.test, "3\n"))
+        # one process for all the checks
+        self.assertIs(checker._process, process)
+
+    def test_crash(self):
+        checker = self.checker('crash')
+        with self.assertLogs('problems.camisole', 'ERROR') as logs:
+            self.assertFalse(checker.check(self.test, "3"))
+        # restarted once
+        self.assertEqual(len(logs.records), 2)
+        self.assertIsNone(checker._process)
+
+    def test_timeout(self):
+        checker = self.checker('hang')
+        with self.assertLogs('problems.camisole', 'ERROR') as logs:
+            self.assertFalse(checker.check(self.test, "3"))
+        self.assertEqual(len(logs.records), 2)
+        self.assertIsNone(checker._process)
+
+    def test_deadline_on_full_pipe(self):
+        # the checker does not read, writing the request would block forever
+        checker = self.checker('hang')
+        start = time.monotonic()
+        with self.assertLogs('problems.camisole', 'ERROR'):
+            self.assertFalse(checker.check(self.test, "3" * (1 << 20)))
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_restarted_after_crash(self):
+        checker = self.checker()
+        self.assertTrue(checker.check(self.test, "3"))
+        checker._process.kill()
+        checker._process.wait()
+        self.assertTrue(checker.check(self.test, "3"))
+
+    def test_stored_verdicts(self):
+        checker = self.checker()
+        problem = unittest.mock.Mock(tests=[self.test], custom_check=checker.path, custom_check_batch=True)
+        result = {'tests': [{'name': 'a', 'exitcode': 0, 'meta': {'status': 'OK'}, 'stdout': "3"},
+                            {'name': 'a', 'exitcode': 0, 'meta': {'status': 'OK'}, 'stdout': "4"},
+                            {'name': 'a', 'exitcode': 1, 'meta': {'status': 'RUNTIME_ERROR'}, 'stdout': "3"}]}
+        with unittest.mock.patch('problems.camisole.get_batch_checker', return_value=checker):
+            camisole.store_verdicts(problem, result)
+        self.assertEqual([test['passes'] for test in result['tests']], [True, False, False])
+        # the checker is not run again
+        with unittest.mock.patch('problems.camisole.get_batch_checker') as get_batch_checker:
+            self.assertEqual([camisole.test_passes(self.test, test, checker.path, batch=True)
+                              for test in result['tests']], [True, False, False])
+        get_batch_checker.assert_not_called()
+
+
+@override_settings(PROBLEMS_RESULT_MAX_OUTPUT=4)
+class CompactResultTest(SimpleTestCase):
+    def test_short_outputs(self):
+        result = {'success': True, 'compile': {'stdout': "", 'stderr': "ok"},
+                  'tests': [{'name': 'a', 'stdout': "1234", 'stderr': None}]}
+        self.assertFalse(camisole.compact_result(result))
+        self.assertEqual(result['tests'][0], {'name': 'a', 'stdout': "1234", 'stderr': None})
+
+    def test_truncates_long_outputs(self):
+        result = {'success': True, 'compile': {'stdout': "", 'stderr': "warning"},
+                  'tests': [{'name': 'a', 'stdout': "123456", 'stderr': ""}, None]}
+        self.assertTrue(camisole.compact_result(result))
+        test = result['tests'][0]
+        self.assertEqual(test['stdout'], "1234")
+        self.assertEqual(test['stdout_size'], 6)
+        self.assertEqual(test['stdout_sha256'], hashlib.sha256(b"123456").hexdigest())
+        self.assertNotIn('stderr_size', test)
+        self.assertEqual(result['compile']['stderr'], "warn")
+        self.assertEqual(result['compile']['stderr_size'], 7)
+
+    def test_limit_in_bytes(self):
+        # 3 characters, 6 bytes
+        result = {'success': True, 'tests': [{'name': 'a', 'stdout': "ééé", 'stderr': "éé"}]}
+        self.assertTrue(camisole.compact_result(result))
+        test = result['tests'][0]
+        # the partial character is dropped
+        self.assertEqual(test['stdout'], "éé")
+        self.assertEqual(test['stdout_size'], 6)
+        self.assertEqual(test['stdout_sha256'], hashlib.sha256("ééé".encode()).hexdigest())
+        self.assertEqual(test['stderr'], "éé")
+        self.assertNotIn('stderr_size', test)
+
+    def test_idempotent(self):
+        result = {'success': True, 'tests': [{'name': 'a', 'stdout': b"123456"}]}
+        self.assertTrue(camisole.compact_result(result))
+        self.assertFalse(camisole.compact_result(result))
+        self.assertEqual(result['tests'][0]['stdout_size'], 6)
+
+
+def ok(name, stdout):
+    return {'name': name, 'exitcode': 0, 'meta': {'status': 'OK'}, 'stdout': stdout}
+
+
+@override_settings(PROBLEMS_RESULT_MAX_OUTPUT=4)
+class RescoreProblemTest(ProloginTestCase):
+    def _contribute(self):
+        super()._contribute()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = write_problem(self.tmp.name, tests=(('a.in', "1 2\n"), ('a.out', "3\n"),
+                                                        ('b.in', "2 2\n"), ('b.out', "4\n")))
+        registry.clear()
+        self.addCleanup(registry.clear)
+        self.submission = Submission.objects.create(challenge='demi2015', problem='foo',
+                                                    user=self.create_user('alice', 'alice@example.com'))
+
+    def problem(self):
+        registry.clear()
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name):
+            return Challenge.by_year_and_event_type(2015, Event.Type.semifinal).problem('foo')
+
+    def corrected(self, *tests):
+        result = {'success': True, 'tests': list(tests)}
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name):
+            problem = self.problem()
+            camisole.store_verdicts(problem, result)
+            score = camisole.get_score(problem, result)
+            camisole.compact_result(result)
+        return SubmissionCode.objects.create(submission=self.submission, language=Language.python,
+                                             code="", result=result, score=score)
+
+    def write_test(self, name, content):
+        with open(os.path.join(self.path, 'foo', 'test', name), 'w') as f:
+            f.write(content)
+
+    def rescore(self):
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name):
+            changes, code_changes, stale_codes = rescore_problem(self.problem())
+        return code_changes, [code.pk for code in stale_codes]
+
+    def test_unchanged(self):
+        self.corrected(ok('a', "3"), ok('b', "4"))
+        self.assertEqual(self.rescore(), (0, []))
+
+    def test_stopped_early(self):
+        # not run after a fatal test, see merge_results()
+        self.corrected(dict(ok('a', "3"), exitcode=1))
+        self.assertEqual(self.rescore(), (0, []))
+
+    def test_removed_test(self):
+        code = self.corrected(ok('a', "3"), ok('b', "4"))
+        os.remove(os.path.join(self.path, 'foo', 'test', 'b.in'))
+        os.remove(os.path.join(self.path, 'foo', 'test', 'b.out'))
+        self.assertEqual(self.rescore(), (0, [code.pk]))
+        code.refresh_from_db()
+        self.assertEqual(code.score, 64)
+
+    def test_added_test(self):
+        code = self.corrected(ok('a', "3"), ok('b', "4"))
+        self.write_test('c.in', "3 2\n")
+        self.write_test('c.out', "5\n")
+        self.assertEqual(self.rescore(), (0, [code.pk]))
+
+    def test_changed_output(self):
+        code = self.corrected(ok('a', "3"), ok('b', "4"))
+        self.write_test('b.out', "5\n")
+        self.assertEqual(self.rescore(), (1, []))
+        code.refresh_from_db()
+        self.assertEqual(code.score, 0)
+        self.assertEqual([test['passes'] for test in code.result['tests']], [True, False])
+        self.assertEqual(self.rescore(), (0, []))
+
+    def test_changed_output_of_truncated_test(self):
+        code = self.corrected(ok('a', "3"), ok('b', "4" * 10))
+        self.write_test('b.out', "4" * 10 + "\n")
+        self.assertEqual(self.rescore(), (0, [code.pk]))
+
+
+class ProblemStatisticsTest(ProloginTestCase):
+    def _contribute(self):
+        super()._contribute()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        write_problem(self.tmp.name)
+        registry.clear()
+        self.addCleanup(registry.clear)
+
+    def submit(self, user):
+        submission, created = Submission.objects.get_or_create(challenge='demi2015', problem='foo', user=user)
+        return SubmissionCode.objects.create(submission=submission, language=Language.python, code="print(3)")
+
+    def correct(self, code, score):
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name), \
+                unittest.mock.patch('problems.tasks.camisole') as fake_camisole, \
+                unittest.mock.patch('problems.tasks.get_pool') as get_pool, \
+                unittest.mock.patch('problems.tasks.correction_done'):
+            fake_camisole.get_cached_result.return_value = {'success': True}
+            fake_camisole.get_score.return_value = score
+            get_pool.return_value.ordered.return_value = []
+            submit_problem_code(code.pk)
+
+    def statistics(self):
+        stats = ProblemStatistics.objects.get(challenge='demi2015', problem='foo')
+        return ((stats.tackled, stats.solved, stats.attempts),
+                sorted((language.language, language.attempts, language.successes)
+                       for language in stats.languages.all()))
+
+    def test_incremental_equals_rebuild(self):
+        alice = self.create_user('alice', 'alice@example.com')
+        bob = self.create_user('bob', 'bob@example.com')
+        carol = self.create_user('carol', 'carol@example.com')
+        staff = self.create_user('staff', 'staff@example.com', is_staff=True)
+
+        alice_failed, alice_solved = self.submit(alice), self.submit(alice)
+        self.correct(alice_failed, 0)
+        self.correct(alice_solved, 100)
+        # recorrections
+        self.correct(alice_failed, 0)
+        self.correct(alice_solved, 30)
+        self.correct(self.submit(bob), 0)
+        # never corrected
+        self.submit(bob)
+        self.submit(carol)
+        self.correct(self.submit(staff), 100)
+
+        incremental = self.statistics()
+        self.assertEqual(incremental[0], (2, 1, 3))
+        call_command('rebuild_problem_statistics', stdout=io.StringIO())
+        self.assertEqual(self.statistics(), incremental)
+
+
+class CorrectionRetryTest(ProloginTestCase):
+    def _contribute(self):
+        super()._contribute()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        write_problem(self.tmp.name)
+        registry.clear()
+        self.addCleanup(registry.clear)
+        submission = Submission.objects.create(challenge='demi2015', problem='foo',
+                                               user=self.create_user('alice', 'alice@example.com'))
+        self.code = SubmissionCode.objects.create(submission=submission, language=Language.python, code="")
+
+    def correct(self, error):
+        with self.settings(PROBLEMS_REPOSITORY_PATH=self.tmp.name), \
+                unittest.mock.patch('problems.tasks.camisole') as fake_camisole, \
+                unittest.mock.patch('problems.tasks.get_pool') as get_pool, \
+                unittest.mock.patch('problems.tasks.correction_done') as correction_done, \
+                self.assertLogs('prologin.problems', 'ERROR'):
+            fake_camisole.get_cached_result.return_value = None
+            fake_camisole.submit.side_effect = error
+            get_pool.return_value.ordered.return_value = [unittest.mock.Mock(uri='http://one/run')]
+            with self.assertRaises(type(error)):
+                submit_problem_code(self.code.pk)
+        return correction_done
+
+    def test_retried_correction_is_pending(self):
+        self.correct(requests.ConnectionError()).assert_not_called()
+
+    def test_last_retry_is_done(self):
+        with unittest.mock.patch.object(submit_problem_code, 'max_retries', 0):
+            self.correct(requests.ConnectionError()).assert_called_once()
+
+    def test_other_failures_are_done(self):
+        self.correct(RuntimeError("camisole internal error")).assert_called_once()
@@ -13,14 +13,15 @@ from django.views.generic.detail import BaseDetailView, SingleObjectMixin
 from django.views.generic.edit import ModelFormMixin
 from rules.contrib.views import PermissionRequiredMixin
 import celery
-import celery.exceptions
+import collections
 import logging
 import time
 import requests
 
-from contest.models import Event, Contestant
+from contest.models import Event
 from problems.forms import SearchForm, CodeSubmissionForm
-from problems.tasks import submit_problem_code
+from problems.rules import available_semifinal_problems
+from problems.scheduling import schedule_correction
 from prologin.languages import Language
 from prologin.utils import cached
 from prologin.utils.scoring import Scoreboard
@@ -73,7 +74,23 @@ def get_user_submissions(user, extra_filters=Q()):
                            .prefetch_related('codes'))
 
 
-def correct_submission(submission_code):
+def get_user_submissions_for(user, problem_list):
+    """
+    Fetches the submissions of the given user for the given problems, in a
+    single query with one `problem IN (...)` condition per challenge.
+    """
+    names = collections.defaultdict(set)
+    for problem in problem_list:
+        names[problem.challenge.name].add(problem.name)
+    if not names:
+        return problems.models.Submission.objects.none()
+    condition = Q()
+    for challenge, problem_names in names.items():
+        condition |= Q(challenge=challenge, problem__in=problem_names)
+    return get_user_submissions(user, condition)
+
+
+def correct_submission(submission_code, priority=None):
     if not submission_code.correctable():
         return
 
@@ -84,17 +101,8 @@ def correct_submission(submission_code):
     submission_code.save()
     logger.info("Scheduling code correction for CodeSubmission: %s, task uid: %s",
                 submission_code.pk, submission_code.celery_task_id)
-    future = submit_problem_code.apply_async(args=[submission_code.pk],
-                                             task_id=submission_code.celery_task_id)
-    try:
-        # wait a bit for the result
-        future.get(timeout=settings.PROBLEMS_RESULT_TIMEOUT)
-    except celery.exceptions.TimeoutError:
-        pass
-    except Exception:
-        # don't keep any result if something fails
-        future.revoke()
-        future.forget()
+    # don't wait for the result; the submission page polls for it
+    schedule_correction(submission_code, priority)
 
 
 class Index(TemplateView):
@@ -142,8 +150,7 @@ class Challenge(PermissionRequiredMixin, TemplateView):
 
         if challenge.event_type is Event.Type.semifinal and settings.PROLOGIN_SEMIFINAL_MODE:
             # special case because has_perm('problems.view_problem') is heavy
-            contestant = Contestant.objects.get(user=self.request.user, edition__year=challenge.year)
-            available_problems = contestant.available_semifinal_problems
+            available_problems = available_semifinal_problems(self.request.user)
             for problem in context['problems']:
                 if problem not in available_problems:
                     problem.locked = True
@@ -210,13 +217,11 @@ class Problem(PermissionRequiredMixin, CreateView):
         context['challenge'] = challenge
         context['templatable_languages'] = list(problem.language_templates.keys())
 
-        tackled_by = list(problems.models.Submission.objects.filter(challenge=challenge.name,
-                                                                    problem=problem.name,
-                                                                    user__is_staff=False))
-        context['meta_tackled_by'] = len(tackled_by)
-        # Could also be written tackled_by.filter(score__gt=0).count() but
-        # 1. would do two queries 2. would fail if succeeded() impl changes
-        context['meta_solved_by'] = sum(1 for sub in tackled_by if sub.succeeded())
+        statistics = (problems.models.ProblemStatistics.objects
+                      .filter(challenge=challenge.name, problem=problem.name)
+                      .first())
+        context['meta_tackled_by'] = statistics.tackled if statistics else 0
+        context['meta_solved_by'] = statistics.solved if statistics else 0
         context['meta_validation_percent'] = problem.validation_percent
 
         user_submission = None
@@ -328,7 +333,7 @@ class SearchProblems(ChoiceGetAttrsMixin, ListView):
     paginate_by = 20
     allow_empty = True
 
-    get_attrs = {'sort': ('title', 'year', 'difficulty'),
+    get_attrs = {'sort': ('title', 'year', 'difficulty', 'relevance'),
                  'order': ('asc', 'desc')}
 
     def get(self, request, *args, **kwargs):
@@ -339,7 +344,6 @@ class SearchProblems(ChoiceGetAttrsMixin, ListView):
 
     def get_queryset(self):
         all_results = []
-        filter = Q()
         if self.form.is_valid():
             query = slugify(self.form.cleaned_data['query'])
             event_type = self.form.cleaned_data['event_type']
@@ -357,26 +361,22 @@ class SearchProblems(ChoiceGetAttrsMixin, ListView):
                     continue
                 if event_type and challenge.event_type.name != event_type:
                     continue
-                for problem in challenge.problems:
-                    if difficulty_min is not None and problem.difficulty < difficulty_min:
-                        continue
-                    if difficulty_max is not None and problem.difficulty > difficulty_max:
-                        continue
+                matches = challenge.search_index.search(query, difficulty_min, difficulty_max)
+                for problem_name, rank in matches.items():
                     if solved and solved_problems:
-                        key = (challenge.name, problem.name)
+                        key = (challenge.name, problem_name)
                         if ((solved == 'solved' and key not in solved_problems)
                                 or solved == 'unsolved' and key in solved_problems):
                             continue
-                    if not query or query in slugify(problem.title):
-                        if not self.request.user.has_perm('problems.view_problem', problem):
-                            continue
-                        filter |= Q(challenge=challenge.name, problem=problem.name)
-                        all_results.append(problem)
+                    problem = challenge.problem(problem_name)
+                    if not self.request.user.has_perm('problems.view_problem', problem):
+                        continue
+                    problem.search_rank = rank
+                    all_results.append(problem)
 
         if self.request.user.is_authenticated:
             # To display user score on each problem
-            submissions = get_user_submissions(self.request.user,
-                                               extra_filters=filter)
+            submissions = get_user_submissions_for(self.request.user, all_results)
             submissions = {(sub.challenge, sub.problem): sub for sub in submissions}
             for problem in all_results:
                 problem.submission = submissions.get((problem.challenge.name, problem.name))
@@ -393,6 +393,8 @@ class SearchProblems(ChoiceGetAttrsMixin, ListView):
             key = lambda p: (o_year(p), o_title(p), o_diff(p))
         elif sort_by == 'difficulty':
             key = lambda p: (o_diff(p), o_title(p), o_year(p))
+        elif sort_by == 'relevance':
+            key = lambda p: (p.search_rank, o_title(p), o_year(p))
         all_results.sort(key=key, reverse=sort_order == 'desc')
         return all_results
 
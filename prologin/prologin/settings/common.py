@@ -96,6 +96,7 @@ MIDDLEWARE = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'prologin.middleware.ContestMiddleware',
+    'prologin.utils.memoize.RequestMemoizeMiddleware',
     'django_prometheus.middleware.PrometheusAfterMiddleware',
 )
 
@@ -167,8 +168,19 @@ CELERY_RESULT_BACKEND = BROKER_URL  # also use redis to store the results
 CELERY_RESULT_PERSISTENT = True  # keep results on broker restart
 CELERY_TASK_RESULT_EXPIRES = 3600 * 12  # 12 hours
 CELERY_ROUTES = {
+    # corrections are sent to the PROBLEMS_CORRECTION_QUEUE queues explicitly,
+    # see problems.scheduling; other tasks and direct calls go to the default
     '*': {'queue': 'prolosite'},
 }
+# Do not reserve queued tasks, so urgent corrections are not stuck behind others
+CELERYD_PREFETCH_MULTIPLIER = 1
+# Run with `celery beat`, or a worker started with -B
+CELERYBEAT_SCHEDULE = {
+    'probe-correctors': {
+        'task': 'problems.tasks.probe_correctors',
+        'schedule': 10,  # see PROBLEMS_CORRECTOR_CIRCUIT_COOLDOWN
+    },
+}
 
 # Emails
 
@@ -252,11 +264,38 @@ PLAINTEXT_PASSWORD_SALT = "whatever1337leet"
 FINAL_EVENT_DATE_FORMAT = 'l d F'
 GOOGLE_ANALYTICS_ID = ''
 PROLOGIN_UTILITY_REDIS_STORE = dict(host='localhost', port=6379, db=0, socket_connect_timeout=1, socket_timeout=3)
+# Redis key (in PROLOGIN_UTILITY_REDIS_STORE) of the version of the current edition context
+PROLOGIN_EDITION_CONTEXT_REDIS_KEY = 'prologin.contest.edition_context.version'
+# How often, in seconds, processes check whether their edition context is outdated
+PROLOGIN_EDITION_CONTEXT_CHECK_INTERVAL = 5
 PROLOGIN_WEBHOOK_BASE_URL = 'https://webhook.prologin.org'
 PROLOGIN_WEBHOOK_SECRET = 'changeme'
 PROBLEMS_DEFAULT_AUTO_UNLOCK_DELAY = 15 * 60  # in seconds; 15 minutes
 PROLOGIN_SEMIFINAL_MODE = False
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Persistent, shared between workers; can be switched to a Redis cache
+    'rendered': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/tmp/prologin-cache/rendered',
+        'TIMEOUT': 3600 * 24 * 7,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Correction results of submissions, reused for identical submissions
+    'results': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': '/tmp/prologin-cache/results',
+        'TIMEOUT': 3600 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+# Cache alias storing rendered markup (problem subjects), 'default' if missing
+MARKUP_RENDER_CACHE = 'rendered'
+MARKUP_RENDER_CACHE_TIMEOUT = 3600 * 24 * 7
+
 # Cache durations and keys
 CacheSetting = namedtuple('CacheSetting', 'key duration')
 PROLOGIN_CACHES = {
@@ -264,33 +303,78 @@ PROLOGIN_CACHES = {
 }
 
 # Prologin correction system
-# List of strings (tried in order for load-balancing/fallback):
-#  - if local: 'local:///path/to/prefix'
-#  - if remote: 'http://thehost:55080/run'
+# List of camisole URLs, eg. 'http://thehost:55080/run', or of (URL, weight)
+# pairs. Requests go to the least loaded (in-flight requests / weight) healthy
+# corrector first, then fall back to the next ones.
 PROBLEMS_CORRECTORS = (
 )
+# Identify test inputs by their SHA-256 hash in corrector requests, and only
+# send the inputs that the corrector reports missing from its cache.
+# Correctors must support this protocol extension (see camisole_debug.py).
+PROBLEMS_CORRECTORS_CONTENT_ADDRESSED = False
+# Celery queue of each correction priority class (contest, qualification,
+# training, bulk), see problems.scheduling. Workers must consume these queues
+# besides 'prolosite', or corrections are never run (see README.md). Workers
+# consuming several queues do not favor any, so run dedicated workers for the
+# contest queues.
+PROBLEMS_CORRECTION_QUEUE = 'correction-{priority}'
+# Number of pending corrections after which the next corrections of a user are
+# demoted to the next priority class, and how long, in seconds, a correction is
+# counted as pending at most
+PROBLEMS_CORRECTION_FAIR_SHARE = 2
+PROBLEMS_CORRECTION_PENDING_TIMEOUT = 10 * 60
+# Redis key (in PROLOGIN_UTILITY_REDIS_STORE) of the pending corrections of a user
+PROBLEMS_CORRECTION_PENDING_REDIS_KEY = 'prologin.problems.correction.pending.{user}'
+# Outputs of stored correction results are truncated to this many bytes
+PROBLEMS_RESULT_MAX_OUTPUT = 16 * 1024
+# Cache alias storing correction results, so identical submissions (same
+# language, source, limits and tests) are not corrected again; 'default' if
+# missing, None disables
+PROBLEMS_RESULT_CACHE = 'results'
+PROBLEMS_RESULT_CACHE_TIMEOUT = 3600 * 24
+# Number of correctors (the first ones of PROBLEMS_CORRECTORS) to spread the
+# tests of each submission over, concurrently; 1 disables sharding
+PROBLEMS_CORRECTOR_SHARDS = 1
 
 # Max size of uploaded source files in bytes
 PROBLEMS_UPLOAD_MAX_LENGTH = 1 << 21  # 2MiB
 # How long to wait, in seconds, for a remote corrector
 PROBLEMS_CORRECTOR_REQUEST_TIMEOUT = 10 * 60
-# How long to wait, in seconds, before displaying the submission result page.
-# Don't use a too small value because the corrector system will most of the time
-# not have the time to compile & run the tests.
-# Don't use a too large value because it makes the page load for too long.
-PROBLEMS_RESULT_TIMEOUT = 3
+# How long to wait, in seconds, to connect to a corrector or for its health check
+PROBLEMS_CORRECTOR_CONNECT_TIMEOUT = 5
+# Consecutive failures after which a corrector is taken out of rotation, and
+# for how long, in seconds, before it is used again if the periodic
+# problems.tasks.probe_correctors task found it healthy
+PROBLEMS_CORRECTOR_FAILURE_THRESHOLD = 3
+PROBLEMS_CORRECTOR_CIRCUIT_COOLDOWN = 30
+# Redis key (in PROLOGIN_UTILITY_REDIS_STORE) counting in-flight requests per corrector
+PROBLEMS_CORRECTOR_IN_FLIGHT_REDIS_KEY = 'prologin.problems.corrector.inflight.{uri}'
+# Redis key (in PROLOGIN_UTILITY_REDIS_STORE) of the last successful health check per corrector
+PROBLEMS_CORRECTOR_HEALTH_REDIS_KEY = 'prologin.problems.corrector.health'
+# How long, in seconds, the corrector pool stops using Redis after an error
+PROBLEMS_CORRECTOR_REDIS_RETRY_DELAY = 30
+# How long to wait, in seconds, for a batch custom checker to check an output
+PROBLEMS_CUSTOM_CHECK_TIMEOUT = 10
 # Interval, in milliseconds, between checks for results in the submission page
-# (this is done using Javascript).
+# (this is done using Javascript). It grows by half after each check, up to
+# PROBLEMS_RESULT_POLL_MAX_INTERVAL, so pages left open do not poll forever at
+# the same pace.
 PROBLEMS_RESULT_POLL_INTERVAL = 3 * 1000
+PROBLEMS_RESULT_POLL_MAX_INTERVAL = 30 * 1000
 
 # Storage path for temporary files for semifinal data imports
 DATA_IMPORT_SEMIFINAL_TEMPORARY_DIR = '/tmp/data-import/semifinal'
+# Number of rows written at once when importing regional event results
+DATA_IMPORT_SEMIFINAL_BATCH_SIZE = 1000
 
 # List of challenges (directory name), eg. ('demi2015', 'qcm2014')
 # Empty list allows everything
 PROBLEMS_CHALLENGE_WHITELIST = ()
 PROBLEMS_REPOSITORY_PATH = os.path.join(BASE_DIR, 'problems')
 PROBLEMS_REPOSITORY_STATIC_PREFIX = 'problems'
+# How often, in seconds, each worker checks the problems repository for changes
+# before reusing the challenges and problems it already loaded
+PROBLEMS_REGISTRY_CHECK_INTERVAL = 5
 
 # Path to archives repository (sub-folders shall be years)
 ARCHIVES_REPOSITORY_PATH = os.path.join(BASE_DIR, 'archives')
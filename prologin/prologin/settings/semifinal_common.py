@@ -6,6 +6,17 @@ PROLOGIN_SEMIFINAL_MODE = True
 # Format: a tuple of (warning amount, danger amount), amounts in seconds
 SEMIFINAL_CONCERNING_TIME_SPENT = (30 * 60, 45 * 60)
 
+# Interval, in seconds, between updates of the monitoring board; every
+# SEMIFINAL_MONITORING_FULL_REFRESH updates, all rows are refreshed, not only
+# the rows of contestants with new activity
+SEMIFINAL_MONITORING_POLL_INTERVAL = 10
+SEMIFINAL_MONITORING_FULL_REFRESH = 6
+
+# Redis key (in PROLOGIN_UTILITY_REDIS_STORE) of the live scoreboard sorted set
+SEMIFINAL_SCOREBOARD_REDIS_KEY = 'prologin.semifinal.scoreboard.{edition}'
+# Maximum number of users listed on a scoreboard page
+SEMIFINAL_SCOREBOARD_PAGE_SIZE = 500
+
 # We won't use those in semifinal
 RECAPTCHA_PUBLIC_KEY = ''
 RECAPTCHA_PRIVATE_KEY = ''
@@ -23,6 +34,7 @@ MIDDLEWARE = (
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'semifinal.middleware.SemifinalMiddleware',
+    'prologin.utils.memoize.RequestMemoizeMiddleware',
 )
 
 INSTALLED_APPS = (
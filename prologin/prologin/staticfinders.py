@@ -1,5 +1,6 @@
 import glob
 import os
+import time
 
 from django.contrib.staticfiles.finders import BaseFinder
 from django.contrib.staticfiles.utils import matches_patterns
@@ -7,11 +8,57 @@ from django.core.files.storage import FileSystemStorage
 
 
 class PatternStaticFinder(BaseFinder):
-    """Pattern-based static finder with optional prefix"""
+    """
+    Pattern-based static finder with optional prefix
+
+    Matching files are globbed once into a manifest that serves list() and
+    most find() lookups. The manifest is rebuilt when the modification time of one of
+    the directories holding matching files changes, which is checked at most
+    every `manifest_check_interval` seconds.
+    """
 
     prefix = ''
     root = ''
     patterns = ()
+    manifest_check_interval = 30
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._manifest = None
+        self._signature = None
+        self._checked_at = None
+
+    def _get_signature(self):
+        directories = set()
+        for pattern in self.patterns:
+            directories.update(glob.glob(os.path.join(self.root, os.path.dirname(pattern).lstrip(os.path.sep))))
+        signature = []
+        for directory in sorted(directories):
+            try:
+                signature.append((directory, os.stat(directory).st_mtime_ns))
+            except OSError:
+                pass
+        return tuple(signature)
+
+    def _build_manifest(self):
+        manifest = {}
+        for pattern in self.patterns:
+            for f in glob.glob(os.path.join(self.root, pattern.lstrip(os.path.sep))):
+                manifest[os.path.relpath(f, self.root)] = f
+        return manifest
+
+    def get_manifest(self):
+        """
+        Mapping of the matching files, relative to `root`, to their absolute paths.
+        """
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.manifest_check_interval:
+            signature = self._get_signature()
+            if self._manifest is None or signature != self._signature:
+                self._manifest = self._build_manifest()
+                self._signature = signature
+            self._checked_at = now
+        return self._manifest
 
     def find(self, path, all=False):
         if not self.patterns:
@@ -19,19 +66,21 @@ class PatternStaticFinder(BaseFinder):
         if not path.startswith(self.prefix):
             return []
         path = path[len(self.prefix):]
-        if not matches_patterns(path, self.patterns):
-            return []
-        abs_path = os.path.join(self.root, path.lstrip(os.path.sep))
-        if os.path.exists(abs_path):
-            return [abs_path] if all else abs_path
-        return []
+        abs_path = self.get_manifest().get(os.path.normpath(path.lstrip(os.path.sep)))
+        if abs_path is None:
+            # patterns also match nested paths that glob() does not list
+            if not matches_patterns(path, self.patterns):
+                return []
+            abs_path = os.path.join(self.root, path.lstrip(os.path.sep))
+            if not os.path.exists(abs_path):
+                return []
+        return [abs_path] if all else abs_path
 
     def list(self, ignore_patterns):
         storage = FileSystemStorage(location=self.root)
         storage.prefix = self.prefix
 
-        for pattern in self.patterns:
-            for f in glob.glob(os.path.join(self.root, pattern.lstrip(os.path.sep))):
-                if matches_patterns(f, ignore_patterns):
-                    continue
-                yield os.path.relpath(f, self.root), storage
+        for path, abs_path in self.get_manifest().items():
+            if matches_patterns(abs_path, ignore_patterns):
+                continue
+            yield path, storage
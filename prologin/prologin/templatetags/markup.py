@@ -1,5 +1,7 @@
 import bleach
+import hashlib
 from django import template
+from django.conf import settings
 from django.template.defaultfilters import slugify
 from django.utils.safestring import mark_safe
 
@@ -8,6 +10,8 @@ import pygments
 import pygments.lexers
 import pygments.formatters
 
+from prologin.utils import get_cache
+
 register = template.Library()
 
 ALLOWED_TAGS = [
@@ -20,6 +24,10 @@ ALLOWED_TAGS = [
 ALLOWED_ATTRS = ['class', 'rel', 'src', 'alt', 'style', 'href', 'id', 'type', 'checked', 'disabled', 'title']
 ALLOWED_STYLES = ['max-width']
 
+# Bump this when the flavored markdown extensions or the sanitizer settings
+# change, so cached renderings are not reused
+FLAVORED_MARKDOWN_VERSION = 1
+
 
 def _init_flavored_markdown():
     import markdown.extensions.codehilite
@@ -71,6 +79,24 @@ def flavored_markdown(value, escape=True):
     return mark_safe(rendered)
 
 
+@register.filter
+def cached_flavored_markdown(value, escape=True):
+    """
+    Same as flavored_markdown, but the rendering is stored in the
+    MARKUP_RENDER_CACHE cache, keyed by the hash of `value` and the renderer
+    version. Use it for large, rarely changing documents such as problem
+    subjects.
+    """
+    key = 'markup:flavored:{}:{}:{}'.format(FLAVORED_MARKDOWN_VERSION, int(bool(escape)),
+                                             hashlib.sha256(value.encode('utf-8')).hexdigest())
+    store = get_cache(settings.MARKUP_RENDER_CACHE)
+    rendered = store.get(key)
+    if rendered is None:
+        rendered = str(flavored_markdown(value, escape))
+        store.set(key, rendered, settings.MARKUP_RENDER_CACHE_TIMEOUT)
+    return mark_safe(rendered)
+
+
 @register.filter
 def archive_markdown(value, scoreboard):
     import markdown.extensions.toc
@@ -1,13 +1,29 @@
+import collections
 import contextlib
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
 from django.http.response import HttpResponse
-from django.test import RequestFactory, TestCase
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from django.test.client import Client
 from django.utils import timezone
 
+import unittest.mock
+
+import rules
+
 import contest.models
+import problems.models
 import team.models
+from prologin.languages import Language
+from prologin.templatetags import markup
+from prologin.utils import msgpack_dumps
+from prologin.utils.db import COMPRESSED_MARKER, EncodedMsgpack, compress_blob, decompress_blob
+from prologin.utils.memoize import RequestMemoizeMiddleware, memoize_scope, request_memoize
+
+
+FakeChallenge = collections.namedtuple('FakeChallenge', 'name')
+FakeProblem = collections.namedtuple('FakeProblem', 'challenge name')
 
 
 class WithContestantMixin:
@@ -103,3 +119,153 @@ class ProloginTestCase(TestCase):
     def assertResponseCode(self, response, code):
         self.assertIsInstance(response, HttpResponse)
         self.assertEqual(response.status_code, code, msg="HTTP response should be {} but is {} {}".format(code, response.status_code, response.reason_phrase))
+
+
+class MsgpackFieldTest(ProloginTestCase):
+    result = {'success': True, 'tests': [{'name': 'a', 'stdout': "42\n" * 100}]}
+
+    def _contribute(self):
+        super()._contribute()
+        user = self.create_user('coder', 'coder@example.com')
+        submission = problems.models.Submission.objects.create(challenge='demi2017', problem='foo', user=user)
+        self.code = problems.models.SubmissionCode.objects.create(submission=submission, language=Language.python,
+                                                                  code="print(42)", result=self.result)
+
+    def test_compression(self):
+        data = msgpack_dumps(self.result)
+        compressed = compress_blob(data)
+        self.assertEqual(compressed[:1], COMPRESSED_MARKER)
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(decompress_blob(compressed), data)
+        # uncompressed payloads are read as is
+        self.assertEqual(decompress_blob(data), data)
+
+    def test_stored_compressed(self):
+        field = problems.models.SubmissionCode._meta.get_field('result')
+        self.assertEqual(field.get_prep_value(self.result)[:1], COMPRESSED_MARKER)
+        # already encoded values are compressed, not encoded again
+        prepared = field.get_prep_value(EncodedMsgpack(msgpack_dumps(self.result)))
+        self.assertEqual(decompress_blob(prepared), msgpack_dumps(self.result))
+
+    def test_lazy_decoding(self):
+        code = problems.models.SubmissionCode.objects.get(pk=self.code.pk)
+        self.assertIsInstance(code.__dict__['result'], EncodedMsgpack)
+        self.assertEqual(code.result, self.result)
+        self.assertEqual(code.__dict__['result'], self.result)
+
+    def test_deferred(self):
+        code = problems.models.SubmissionCode.objects.defer('result').get(pk=self.code.pk)
+        self.assertNotIn('result', code.__dict__)
+        self.assertEqual(code.result, self.result)
+
+    def test_save_without_decoding(self):
+        code = problems.models.SubmissionCode.objects.get(pk=self.code.pk)
+        code.summary = "changed"
+        code.save()
+        self.assertIsInstance(code.__dict__['result'], EncodedMsgpack)
+        self.assertEqual(problems.models.SubmissionCode.objects.get(pk=self.code.pk).result, self.result)
+
+    def test_null(self):
+        problems.models.SubmissionCode.objects.filter(pk=self.code.pk).update(result=None)
+        self.assertIsNone(problems.models.SubmissionCode.objects.get(pk=self.code.pk).result)
+
+
+class RequestMemoizeTest(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+
+        @request_memoize
+        def double(*args):
+            self.calls.append(args)
+            return [arg * 2 for arg in args]
+
+        self.double = double
+
+    def test_not_memoized_outside_scope(self):
+        self.double(1)
+        self.double(1)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_memoized_in_scope(self):
+        with memoize_scope():
+            self.assertIs(self.double(1), self.double(1))
+            self.double(2)
+        self.assertEqual(self.calls, [(1,), (2,)])
+        # the cache does not outlive the scope
+        self.double(1)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_nested_scope(self):
+        with memoize_scope():
+            self.double(1)
+            with memoize_scope():
+                self.double(1)
+            self.double(1)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_model_instances_by_pk(self):
+        with memoize_scope():
+            self.double(get_user_model()(pk=1, username='a'))
+            self.double(get_user_model()(pk=1, username='b'))
+            self.double(get_user_model()(pk=2, username='a'))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_unhashable_by_identity(self):
+        arg = [1]
+        with memoize_scope():
+            self.double(arg)
+            self.double(arg)
+            self.double([1])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_middleware(self):
+        def view(request):
+            self.double(1)
+            self.double(1)
+            return HttpResponse()
+
+        middleware = RequestMemoizeMiddleware(view)
+        middleware(RequestFactory().get('/'))
+        middleware(RequestFactory().get('/'))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_rules_predicate(self):
+        # the wrapper only takes *args, so rules passes it every argument it has
+        predicate = rules.predicate(request_memoize(lambda user, obj: (user, obj)))
+        self.assertEqual(predicate.test('user', 'obj'), ('user', 'obj'))
+
+
+class UserSubmissionsForTest(ProloginTestCase):
+    def _contribute(self):
+        super()._contribute()
+        self.user = self.create_user('coder', 'coder@example.com')
+        for challenge, problem in (('demi2017', 'foo'), ('demi2017', 'bar'), ('qcm2017', 'foo'), ('demi2016', 'foo')):
+            problems.models.Submission.objects.create(challenge=challenge, problem=problem, user=self.user)
+
+    def test_pairs(self):
+        from problems.views import get_user_submissions_for
+        problem_list = [FakeProblem(FakeChallenge('demi2017'), 'foo'), FakeProblem(FakeChallenge('qcm2017'), 'foo')]
+        submissions = get_user_submissions_for(self.user, problem_list)
+        self.assertEqual(sorted((sub.challenge, sub.problem) for sub in submissions),
+                         [('demi2017', 'foo'), ('qcm2017', 'foo')])
+        self.assertFalse(get_user_submissions_for(self.user, []))
+
+
+# not configured, falls back to the default cache
+@override_settings(MARKUP_RENDER_CACHE='missing')
+class CachedMarkdownTest(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def test_hit_and_miss(self):
+        with unittest.mock.patch('prologin.templatetags.markup.flavored_markdown',
+                                 wraps=markup.flavored_markdown) as render:
+            first = markup.cached_flavored_markdown("# Title")
+            second = markup.cached_flavored_markdown("# Title")
+            self.assertEqual(render.call_count, 1)
+            markup.cached_flavored_markdown("# Other title")
+            markup.cached_flavored_markdown("# Title", escape=False)
+            self.assertEqual(render.call_count, 3)
+        self.assertEqual(first, second)
+        self.assertIn("Title", first)
@@ -11,7 +11,7 @@ import uuid
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.core.files import File
 from django.urls import reverse
 from django.utils.html import conditional_escape, format_html
@@ -26,6 +26,13 @@ def absolute_site_url(request, absolute_path):
     )
 
 
+def get_cache(alias):
+    """The cache `alias`, or the default cache if the deployment does not configure it."""
+    if alias in settings.CACHES:
+        return caches[alias]
+    return caches['default']
+
+
 def get_slug(name):
     name = unicodedata.normalize('NFKD', name.lower())
     name = ''.join(x for x in name if x in string.ascii_letters + string.digits + ' _-')
@@ -245,7 +252,11 @@ def lazy_attr(prop_name, getter):
     return property(wrapped)
 
 
-def read_props(filename):
+def parse_props(lines):
+    """
+    Parse `key: value` lines (an iterable of strings, such as a file object)
+    into a dict. Integer and boolean values are converted.
+    """
     def parse(value):
         value = value.strip()
         value_lower = value.lower()
@@ -255,11 +266,13 @@ def read_props(filename):
             return value_lower == 'true'
         return value
 
-    def props(f):
-        return {k.strip().replace('_', '-'): parse(v)
-                for line in f if line.strip()
-                for k, v in [line.split(':', 1)]}
-    return open_try_hard(props, filename)
+    return {k.strip().replace('_', '-'): parse(v)
+            for line in lines if line.strip()
+            for k, v in [line.split(':', 1)]}
+
+
+def read_props(filename):
+    return open_try_hard(parse_props, filename)
 
 
 def translate_format(format_str):
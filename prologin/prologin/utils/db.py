@@ -1,9 +1,32 @@
+import zlib
+
 from django.db import models
 from django.db.models import Case, When, Value, Sum, IntegerField
+from django.db.models.query_utils import DeferredAttribute
 from django.utils.translation import ugettext_lazy as _
 
 from prologin.utils import msgpack_loads, msgpack_dumps
 
+# 0xc1 is never used in msgpack, so it marks compressed payloads; it is followed
+# by a byte identifying the compression codec
+COMPRESSED_MARKER = b'\xc1'
+CODEC_ZLIB = b'z'
+
+
+def compress_blob(data: bytes) -> bytes:
+    """Compress `data` with zlib."""
+    return COMPRESSED_MARKER + CODEC_ZLIB + zlib.compress(data)
+
+
+def decompress_blob(data: bytes) -> bytes:
+    """Decompress `data` if it was compressed by compress_blob(), return it verbatim otherwise."""
+    if data[:1] != COMPRESSED_MARKER:
+        return data
+    codec, payload = data[1:2], data[2:]
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    raise ValueError("unknown compression codec: {!r}".format(codec))
+
 
 class CaseMapping(Case):
     """
@@ -99,22 +122,72 @@ class AdminOrderFieldsMixin:
         return super().get_queryset(request).annotate(**kwargs)
 
 
+class EncodedMsgpack:
+    """Msgpack payload, as stored in the database, not decoded yet."""
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __repr__(self):
+        return '<EncodedMsgpack: {} bytes>'.format(len(self.data))
+
+    def decode(self):
+        return msgpack_loads(decompress_blob(self.data))
+
+
+class MsgpackAttribute(DeferredAttribute):
+    """
+    Decodes the EncodedMsgpack value of a MsgpackField on first access, and
+    loads it from the database first if it was deferred.
+    """
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, EncodedMsgpack):
+            value = instance.__dict__[self.field_name] = value.decode()
+        return value
+
+
 class MsgpackField(models.Field):
+    """
+    Msgpack encoded data, compressed with compress_blob() if `compress` is set.
+    Uncompressed values are still read, so compression can be enabled on
+    existing fields.
+
+    Values are only decoded when the attribute is first accessed, so loading
+    many rows does not decode payloads that are never used.
+    """
     description = "Msgpack encoded data"
     empty_values = [None, b'']
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, compress=False, **kwargs):
         kwargs['editable'] = False
+        self.compress = compress
         super().__init__(*args, **kwargs)
 
     def deconstruct(self):
         name, path, args, kwargs = super().deconstruct()
         del kwargs['editable']
+        if self.compress:
+            kwargs['compress'] = True
         return name, path, args, kwargs
 
+    def contribute_to_class(self, cls, name, **kwargs):
+        super().contribute_to_class(cls, name, **kwargs)
+        setattr(cls, self.attname, MsgpackAttribute(self.attname))
+
     def get_internal_type(self):
         return "BinaryField"
 
+    def pre_save(self, model_instance, add):
+        # values that were never accessed are saved without being decoded
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, EncodedMsgpack):
+            return value
+        return super().pre_save(model_instance, add)
+
     def get_placeholder(self, value, compiler, connection):
         return connection.ops.binary_placeholder_sql(value)
 
@@ -138,9 +211,16 @@ class MsgpackField(models.Field):
     def get_prep_value(self, value):
         if value is None:
             return None
-        return msgpack_dumps(value)
+        if isinstance(value, EncodedMsgpack):
+            if self.compress and value.data[:1] != COMPRESSED_MARKER:
+                return compress_blob(value.data)
+            return value.data
+        value = msgpack_dumps(value)
+        if self.compress:
+            value = compress_blob(value)
+        return value
 
     def from_db_value(self, value, expression, connection, context):
         if value is None:
             return value
-        return msgpack_loads(value)
+        return EncodedMsgpack(bytes(value))
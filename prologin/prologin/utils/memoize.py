@@ -0,0 +1,66 @@
+"""
+Request-scoped memoization.
+
+RequestMemoizeMiddleware opens a cache for the duration of each request.
+Functions decorated with @request_memoize, such as heavy rules predicates,
+then compute their result once per request and arguments. Outside of requests
+(tasks, commands), they are not memoized.
+"""
+import contextlib
+import functools
+import threading
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def memoize_scope():
+    """Memoize @request_memoize functions within the block."""
+    previous = getattr(_local, 'cache', None)
+    _local.cache = {}
+    try:
+        yield
+    finally:
+        _local.cache = previous
+
+
+def _key(arg):
+    # users are keyed by primary key, so the anonymous user and lazy objects work
+    pk = getattr(arg, 'pk', None)
+    if pk is not None:
+        return type(arg).__name__, pk
+    try:
+        hash(arg)
+        return arg
+    except TypeError:
+        return id(arg)
+
+
+def request_memoize(func):
+    """
+    Memoize `func` for the current request, keyed by its arguments: model
+    instances by primary key, other hashable objects by value and the rest by
+    identity.
+    """
+    @functools.wraps(func)
+    def wrapper(*args):
+        cache = getattr(_local, 'cache', None)
+        if cache is None:
+            return func(*args)
+        key = (func, tuple(_key(arg) for arg in args))
+        try:
+            return cache[key]
+        except KeyError:
+            value = cache[key] = func(*args)
+            return value
+
+    return wrapper
+
+
+class RequestMemoizeMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with memoize_scope():
+            return self.get_response(request)
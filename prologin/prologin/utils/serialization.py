@@ -0,0 +1,73 @@
+"""
+Streaming, line-delimited object dumps.
+
+Objects are written one per line in the format of Django's JSON serializer
+(`{"model": ..., "pk": ..., "fields": {...}}`), gzip-compressed, so that large
+querysets are exported chunk by chunk and read back without holding the whole
+document in memory.
+"""
+import gzip
+import itertools
+import json
+
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def dump_objects(stream, objects, fields=None, chunk_size=2000):
+    """
+    Write `objects` (a queryset or any iterable of model instances) to the
+    text `stream`, one object per line. Querysets are iterated in chunks of
+    `chunk_size`. Returns the number of written objects.
+    """
+    if hasattr(objects, 'iterator'):
+        objects = objects.iterator(chunk_size=chunk_size)
+    objects = iter(objects)
+    count = 0
+    while True:
+        chunk = list(itertools.islice(objects, chunk_size))
+        if not chunk:
+            return count
+        for item in serializers.serialize('python', chunk, fields=fields):
+            stream.write(json.dumps(item, cls=DjangoJSONEncoder))
+            stream.write('\n')
+        count += len(chunk)
+
+
+def open_dump(path):
+    """Open `path` for writing a compressed dump."""
+    return gzip.open(path, 'wt', encoding='utf-8')
+
+
+def load_objects(stream, chunk_size=2000):
+    """
+    Deserialize the objects of the binary `stream`, compressed or not, as
+    django.core.serializers.base.DeserializedObject instances.
+
+    Legacy dumps, made of one JSON list of objects per line, are supported.
+    """
+    if stream.read(2) == GZIP_MAGIC:
+        stream.seek(0)
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    else:
+        stream.seek(0)
+
+    def iter_items():
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line.decode('utf-8'))
+            if isinstance(item, list):
+                yield from item
+            else:
+                yield item
+
+    items = iter_items()
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        yield from serializers.deserialize('python', chunk)
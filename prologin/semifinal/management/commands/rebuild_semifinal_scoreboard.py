@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+import semifinal.scoreboard
+
+
+class Command(BaseCommand):
+    help = "Recompute the live semifinal scoreboard from the submissions in database"
+
+    def handle(self, *args, **options):
+        count = semifinal.scoreboard.rebuild()
+        self.stdout.write("Rebuilt semifinal scoreboard of {} users".format(count))
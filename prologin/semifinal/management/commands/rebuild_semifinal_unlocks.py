@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from contest.models import Contestant
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored semifinal problem unlocks of every contestant of the current edition"
+
+    def handle(self, *args, **options):
+        contestants = Contestant.objects.filter(edition__year=settings.PROLOGIN_EDITION, user__is_staff=False)
+        count = 0
+        for contestant in contestants:
+            contestant.refresh_semifinal_unlocks()
+            count += 1
+        self.stdout.write("Rebuilt semifinal unlocks of {} contestants".format(count))
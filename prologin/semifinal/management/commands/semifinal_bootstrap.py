@@ -1,13 +1,15 @@
 import argparse
+import collections
 
 import getpass
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core import serializers
 from django.core.management import BaseCommand, CommandError
-from django.db import transaction
+from django.core.management.color import no_style
+from django.db import connection, transaction
 
 from contest.models import Edition, Center, Event, Contestant
+from prologin.utils.serialization import load_objects
 
 User = get_user_model()
 
@@ -17,7 +19,11 @@ class Command(BaseCommand):
     args = "<import-file>"
 
     def add_arguments(self, parser):
-        parser.add_argument('import_file', type=argparse.FileType('r'))
+        parser.add_argument('import_file', type=argparse.FileType('rb'))
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only check the import file and the database, do not write anything")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of rows inserted at once")
 
     def abort(self, msg=None):
         raise CommandError(msg)
@@ -37,6 +43,70 @@ class Command(BaseCommand):
     def error(self, format="", *args, **kwargs):
         self._write(self.stderr, format, *args, **kwargs)
 
+    def progress(self, label, done, total):
+        width = 30
+        filled = width * done // total if total else width
+        self.stdout.write("\r    {:<11}[{}{}] {}/{}".format(label, '#' * filled, ' ' * (width - filled), done, total),
+                          ending='\n' if done == total else '')
+        self.stdout.flush()
+
+    def bulk_create(self, label, model, objects, batch_size):
+        for start in range(0, len(objects), batch_size):
+            model.objects.bulk_create(objects[start:start + batch_size])
+            self.progress(label, min(start + batch_size, len(objects)), len(objects))
+        if not objects:
+            self.progress(label, 0, 0)
+
+    def relation_rows(self, relations):
+        """Rows of the many-to-many through tables of the `relations` of deserialized objects, by field."""
+        rows = collections.defaultdict(list)
+        for model, items in relations.items():
+            for obj, m2m_data in items:
+                for name, pks in m2m_data.items():
+                    field = model._meta.get_field(name)
+                    through = field.remote_field.through
+                    for pk in pks:
+                        rows[field].append(through(**{field.m2m_column_name(): obj.pk,
+                                                      field.m2m_reverse_name(): pk}))
+        return rows
+
+    def check_relations(self, relations):
+        targets = collections.defaultdict(set)
+        for model, items in relations.items():
+            for obj, m2m_data in items:
+                for name, pks in m2m_data.items():
+                    targets[model._meta.get_field(name).related_model].update(pks)
+        for model, pks in targets.items():
+            missing = pks - set(model.objects.filter(pk__in=pks).values_list('pk', flat=True))
+            if missing:
+                self.abort("Import file refers to {} missing {} objects: {}."
+                           .format(len(missing), model.__name__, ", ".join(sorted(map(str, missing)))))
+
+    def check_import(self, objects):
+        for model in (Edition, Center, Event):
+            if len(objects[model]) != 1:
+                self.abort("Import file must contain exactly one {}, got {}."
+                           .format(model.__name__, len(objects[model])))
+        edition, = objects[Edition]
+        center, = objects[Center]
+        event, = objects[Event]
+        if event.edition_id != edition.pk or event.center_id != center.pk:
+            self.abort("Imported event edition or center mismatches.")
+
+        usernames = collections.Counter(user.username for user in objects[User])
+        duplicates = [username for username, count in usernames.items() if count > 1]
+        if duplicates:
+            self.abort("Duplicate usernames in import file: {}".format(", ".join(sorted(duplicates))))
+        if 'admin' in usernames:
+            self.abort("Import file contains a user named 'admin'.")
+
+        user_pks = set(user.pk for user in objects[User])
+        for contestant in objects[Contestant]:
+            if contestant.user_id not in user_pks:
+                self.abort("Contestant {} refers to unknown user {}.".format(contestant.pk, contestant.user_id))
+            if contestant.edition_id != edition.pk:
+                self.abort("Contestant {} is not part of edition {}.".format(contestant.pk, edition.pk))
+
     def db_not_empty(self, type):
         self.abort("Database is not empty: it contains {} objects. Please clear the database to a post-migrate state "
                    "before bootstrapping a semifinal.".format(type))
@@ -50,38 +120,60 @@ class Command(BaseCommand):
 
         for model in (Edition, Event, Center, Contestant, User):
             if model.objects.exists():
-                return self.db_not_empty(model.__class__.__name__)
-
-        deserializer = serializers.get_deserializer('json')
-
-        file = options['import_file']
+                return self.db_not_empty(model.__name__)
+
+        objects = collections.defaultdict(list)
+        # many-to-many relations (eg. user groups) are not set by bulk_create()
+        relations = collections.defaultdict(list)
+        try:
+            for item in load_objects(options['import_file']):
+                objects[type(item.object)].append(item.object)
+                if item.m2m_data and any(item.m2m_data.values()):
+                    relations[type(item.object)].append((item.object, item.m2m_data))
+        except Exception as e:
+            self.abort("Could not read import file: {}".format(e))
+        self.check_import(objects)
+        self.check_relations(relations)
+
+        edition, = objects[Edition]
+        center, = objects[Center]
+        event, = objects[Event]
+        self.print("    Edition    {}", edition)
+        self.print("    Center     {}", center)
+        self.print("    Event      {}", event)
+        self.print("    {} users, {} contestants", len(objects[User]), len(objects[Contestant]))
+
+        if options['dry_run']:
+            self.print("Import file is valid, nothing was written (dry run).")
+            return
+
+        # Admin user
+        self.print("\nCreating admin user 'admin'.")
+        while True:
+            self.print("Provide a password for user 'admin': ")
+            password = getpass.getpass("")
+            if password:
+                break
+        admin = User(username='admin', email='admin@prologin.org',
+                     is_active=True, is_superuser=True, is_staff=True)
+        admin.set_password(password)
+
+        batch_size = options['batch_size']
         with transaction.atomic():
-            edition = next(deserializer(file.readline()))
-            self.print("    Edition    {}", edition.object)
             edition.save()
-            center = next(deserializer(file.readline()))
-            self.print("    Center     {}", center.object)
             center.save()
-            event = next(deserializer(file.readline()))
-            self.print("    Event      {}", event.object)
             event.save()
-            for user in deserializer(file.readline()):
-                self.print("    User       {}", user.object.username)
-                user.save()
-            for contestant in deserializer(file.readline()):
-                self.print("    Contestant {}", contestant.object.user.username)
-                contestant.save()
-
-            # Admin user
-            self.print("\nCreating admin user 'admin'.")
-            while True:
-                self.print("Provide a password for user 'admin': ")
-                password = getpass.getpass("")
-                if password:
-                    break
-            admin = User(username='admin', email='admin@prologin.org',
-                         is_active=True, is_superuser=True, is_staff=True)
-            admin.set_password(password)
+            # passwords are hashed by the exporting website, insert them as is
+            self.bulk_create("User", User, objects[User], batch_size)
+            self.bulk_create("Contestant", Contestant, objects[Contestant], batch_size)
+            for field, rows in self.relation_rows(relations).items():
+                self.bulk_create(field.name.capitalize(), field.remote_field.through, rows, batch_size)
+
+            # rows were inserted with explicit primary keys
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Edition, Center, Event, User, Contestant]):
+                    cursor.execute(sql)
+
             admin.save()
 
-            self.print("Bootstrapping completed.")
+        self.print("Bootstrapping completed.")
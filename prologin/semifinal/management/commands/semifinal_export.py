@@ -1,11 +1,10 @@
-import argparse
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.core import serializers
 from django.core.management import BaseCommand, CommandError
 
 import contest.models
 import problems.models
+from prologin.utils.serialization import dump_objects, open_dump
 
 User = get_user_model()
 
@@ -14,7 +13,9 @@ class Command(BaseCommand):
     help = "Export semifinal result data for upload in production website."
 
     def add_arguments(self, parser):
-        parser.add_argument('export_file', type=argparse.FileType('w'))
+        parser.add_argument('export_file', help="Path of the gzip-compressed export file to write")
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Number of objects fetched from the database at once")
 
     def abort(self, msg=None):
         raise CommandError(msg)
@@ -28,45 +29,34 @@ class Command(BaseCommand):
         users = User.objects.filter(is_active=True, is_staff=False, is_superuser=False)
         contestants = contest.models.Contestant.objects.filter(edition=event.edition, user__in=users)
 
-        if len(users) != len(contestants):
+        if users.count() != contestants.count():
             self.abort("Number of users and contestants do not match.")
 
         challenge = problems.models.Challenge.by_year_and_event_type(event.edition.year, contest.models.Event.Type.semifinal)
         submissions = problems.models.Submission.objects.filter(user__in=users, challenge=challenge.name)
-        codes = problems.models.SubmissionCode.objects.filter(submission__in=submissions)
+        codes = problems.models.SubmissionCode.objects.filter(submission__in=submissions).order_by('pk')
         unlocks = problems.models.ExplicitProblemUnlock.objects.filter(challenge=challenge.name, user__in=users)
 
-        serializer = serializers.get_serializer('json')()
-
-        stream = options['export_file']
-
-        serializer.serialize([event.edition], stream=stream)
-        stream.write("\n")
-        serializer.serialize([event.center], stream=stream)
-        stream.write("\n")
-        serializer.serialize([event], stream=stream)
-        stream.write("\n")
-        serializer.serialize(users, fields=('pk',), stream=stream)
-        stream.write("\n")
-        serializer.serialize(contestants,
-                             fields=('edition', 'user', 'score_semifinal_written', 'score_semifinal_interview',
-                                     'score_semifinal_machine', 'score_semifinal_bonus'),
-                             stream=stream)
-        stream.write("\n")
-        serializer.serialize(submissions, stream=stream)
-        stream.write("\n")
-        serializer.serialize(codes,
-                             fields=('submission', 'language', 'code',
-                                     'summary', 'score', 'date_submitted',
-                                     'date_corrected'),
-                             stream=stream)
-        stream.write("\n")
-        serializer.serialize(unlocks, stream=stream)
-        stream.close()
+        chunk_size = options['chunk_size']
+        counts = {}
+        with open_dump(options['export_file']) as stream:
+            dump_objects(stream, [event.edition])
+            dump_objects(stream, [event.center])
+            dump_objects(stream, [event])
+            counts['users'] = dump_objects(stream, users.order_by('pk'), fields=('pk',), chunk_size=chunk_size)
+            counts['contestants'] = dump_objects(
+                stream, contestants.order_by('pk'),
+                fields=('edition', 'user', 'score_semifinal_written', 'score_semifinal_interview',
+                        'score_semifinal_machine', 'score_semifinal_bonus'),
+                chunk_size=chunk_size)
+            counts['submissions'] = dump_objects(stream, submissions.order_by('pk'), chunk_size=chunk_size)
+            counts['codes'] = dump_objects(stream, codes,
+                                           fields=('submission', 'language', 'code',
+                                                   'summary', 'score', 'date_submitted',
+                                                   'date_corrected'),
+                                           chunk_size=chunk_size)
+            counts['explicit unlocks'] = dump_objects(stream, unlocks.order_by('pk'), chunk_size=chunk_size)
 
         self.stdout.write("Exported")
-        self.stdout.write("  {:>4} users".format(len(users)))
-        self.stdout.write("  {:>4} contestants".format(len(contestants)))
-        self.stdout.write("  {:>4} submissions".format(len(submissions)))
-        self.stdout.write("  {:>4} codes".format(len(codes)))
-        self.stdout.write("  {:>4} explicit unlocks".format(len(unlocks)))
+        for name, count in counts.items():
+            self.stdout.write("  {:>4} {}".format(count, name))
@@ -1,8 +1,9 @@
 from django.conf import settings
-from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.functional import SimpleLazyObject
 
-import contest.models
-import problems.models
+from contest.context import get_edition_context
+from prologin.middleware import get_current_contestant
 
 
 class SemifinalMiddleware:
@@ -15,36 +16,25 @@ class SemifinalMiddleware:
 
     def __call__(self, request):
         year = settings.PROLOGIN_EDITION
-        # Current semifinal event
-        event = (contest.models.Event.objects
-                 .select_related('edition')
-                 .filter(edition__year=year)
-                 .first())
+        # shared by all requests, see contest.context
+        context = get_edition_context()
 
-        if event is None:
+        # Current semifinal event
+        if not context.events:
             self._raise()
 
-        request.current_event = event
-
-        try:
-            request.current_edition = event.edition
-        except IndexError:
-            self._raise()
+        request.current_event = context.events[0]
+        request.current_edition = context.edition
 
-        try:
-            request.current_challenge = (problems.models.Challenge
-                                         .by_year_and_event_type(year, contest.models.Event.Type.semifinal))
-        except ObjectDoesNotExist:
+        request.current_challenge = context.semifinal_challenge
+        if request.current_challenge is None:
             raise ImproperlyConfigured("There is no challenge for regional event year {}".format(year))
 
         # Logged-in user related queries
         request.current_contestant = None
         user = request.user
         if user.is_authenticated:
-            # Create the contestant if it does not exist
-            request.current_contestant, created = (contest.models.Contestant.objects
-                                                   .get_or_create(user=user, edition=request.current_edition))
-            if created:
-                request.current_contestant.save()
+            edition = request.current_edition
+            request.current_contestant = SimpleLazyObject(lambda: get_current_contestant(user, edition))
 
         return self.get_response(request)
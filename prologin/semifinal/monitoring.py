@@ -0,0 +1,83 @@
+"""
+Bulk computation of the semifinal monitoring board: the state of every
+contestant is built from a few queries over the whole challenge, instead of
+several queries per contestant.
+"""
+import collections
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.aggregates import Sum
+
+import contest.models
+from problems.models import ExplicitProblemUnlock, Submission, SubmissionCode
+
+
+def changed_users(challenge, since, now):
+    """Users whose monitoring state may have changed since `since`."""
+    users = set(SubmissionCode.objects
+                .filter(submission__challenge=challenge.name)
+                .filter(Q(date_submitted__gt=since) | Q(date_corrected__gt=since))
+                .values_list('submission__user_id', flat=True))
+    users.update(contest.models.SemifinalUnlockState.objects
+                 .filter(challenge=challenge.name)
+                 .filter(Q(date_computed__gt=since) | Q(valid_until__lte=now))
+                 .values_list('contestant__user_id', flat=True))
+    return users
+
+
+def get_contestants(edition, challenge, now, since=None):
+    """
+    Contestants of `edition` with their score, lines of code, unlocked problems
+    (`semifinal_problems`, latest first) and highest solved difficulty.
+    If `since` is given, only contestants that may have changed since then.
+    """
+    contestants = (contest.models.Contestant.objects
+                   .select_related('user', 'semifinal_unlock_state')
+                   .filter(user__is_staff=False, user__is_superuser=False, edition=edition)
+                   .annotate(score=Sum(Submission.get_score_func('user__training_submissions')))
+                   .order_by('user__username'))
+    if since is not None:
+        contestants = contestants.filter(user__in=changed_users(challenge, since, now))
+    contestants = list(contestants)
+    user_ids = [contestant.user_id for contestant in contestants]
+
+    explicit_unlocks = collections.defaultdict(list)
+    for unlock in ExplicitProblemUnlock.objects.filter(challenge=challenge.name, user__in=user_ids):
+        explicit_unlocks[unlock.user_id].append(unlock)
+    solved_submissions = collections.defaultdict(list)
+    for submission in Submission.objects.filter(challenge=challenge.name, user__in=user_ids, score_base__gt=0):
+        solved_submissions[submission.user_id].append(submission)
+    lines_of_code = collections.Counter()
+    for user_id, code in (SubmissionCode.objects
+                          .filter(submission__challenge=challenge.name, submission__user__in=user_ids)
+                          .values_list('submission__user_id', 'code')):
+        lines_of_code[user_id] += contest.models.Contestant.count_lines_of_code(code)
+
+    warning, danger = settings.SEMIFINAL_CONCERNING_TIME_SPENT
+    for contestant in contestants:
+        # semifinal_challenge is looked up from the edition
+        contestant.edition = edition
+        # extend available_semifinal_problems with more attributes and store it as semifinal_problems
+        max_difficulty = 0
+        # read-only: stale states are saved by the contestants' own requests
+        problems = contestant.get_semifinal_unlocks(explicit_unlocks[contestant.user_id],
+                                                    solved_submissions[contestant.user_id], store=False)
+        for problem, dates in problems.items():
+            delta = None
+            concerning = ''
+            if dates['solved']:
+                delta = dates['solved'] - dates['unlocked']
+                max_difficulty = max(max_difficulty, problem.difficulty)
+            else:
+                seconds = (now - dates['unlocked']).seconds
+                if seconds > danger:
+                    concerning = 'danger'
+                elif seconds > warning:
+                    concerning = 'warning'
+            dates['delta'] = delta
+            dates['concerning'] = concerning
+        contestant.max_difficulty = max_difficulty
+        contestant.semifinal_lines_of_code = lines_of_code[contestant.user_id]
+        contestant.semifinal_problems = sorted(problems.items(), key=lambda p: p[1]['unlocked'], reverse=True)
+    return contestants
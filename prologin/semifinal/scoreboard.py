@@ -0,0 +1,238 @@
+"""
+Live semifinal scoreboard.
+
+The total score of every active contestant is kept in a Redis sorted set.
+problems.tasks.submit_problem_code sets the score of a user to their total in
+the database once a correction changing it is committed, so that concurrent
+updates converge to the stored scores. Rankings are then looked up in
+O(log n) instead of aggregating the scores of all submissions on every page
+view. Ex aequo users are listed by username: the position of each user in
+the username order is encoded in the low bits of their score in the sorted
+set, so that Redis orders them as the pages do.
+
+The sorted set is rebuilt from the database when missing, when a user who is
+not in it yet gets a score (the username order is computed by the rebuild), or
+with the rebuild_semifinal_scoreboard command. Scores updated during a rebuild
+are set again once it is done. When Redis is unavailable, the scoreboard is
+computed from the database.
+"""
+import logging
+
+import redis
+import redis.exceptions
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from problems.models import Submission
+from prologin.utils.scoring import decorate_with_rank
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+# size of the username position range encoded below each score; scores and
+# positions stay exact in a Redis double up to scores of 2 ** 33
+TIE_BREAK_RANGE = 2 ** 20
+
+
+def _store():
+    return redis.StrictRedis(**settings.PROLOGIN_UTILITY_REDIS_STORE)
+
+
+def _key():
+    return settings.SEMIFINAL_SCOREBOARD_REDIS_KEY.format(edition=settings.PROLOGIN_EDITION)
+
+
+def ranked_users():
+    return User.objects.filter(is_active=True, is_staff=False, is_superuser=False)
+
+
+def _with_scores(users):
+    return users.annotate(score=Coalesce(Sum(Submission.get_score_func('training_submissions')), 0))
+
+
+def _scores(users):
+    """Scores of `users` by pk, in username order."""
+    return {str(pk): score
+            for pk, score in _with_scores(users).order_by('username').values_list('pk', 'score')}
+
+
+def _encode(score, position):
+    # highest first in Redis: better scores, then lower positions
+    return score * TIE_BREAK_RANGE + TIE_BREAK_RANGE - 1 - position
+
+
+def _decode(value):
+    """The (score, position) pair of a sorted set score."""
+    score, tie_break = divmod(int(value), TIE_BREAK_RANGE)
+    return score, TIE_BREAK_RANGE - 1 - tie_break
+
+
+def rebuild():
+    """Recompute the scoreboard from the database. Returns the number of ranked users."""
+    store = _store()
+    key = _key()
+    store.delete(key + '.updated')
+    scores = _scores(ranked_users())
+    if not scores:
+        store.delete(key)
+        return 0
+    # replace atomically, readers never see a partial scoreboard
+    with store.pipeline() as pipe:
+        pipe.delete(key + '.rebuild')
+        pipe.zadd(key + '.rebuild', {pk: _encode(score, position)
+                                     for position, (pk, score) in enumerate(scores.items())})
+        pipe.rename(key + '.rebuild', key)
+        pipe.execute()
+    # scores committed after they were read above
+    if not _set_scores(store, store.smembers(key + '.updated')):
+        # users ranked since, the username order has to be computed again
+        return rebuild()
+    return len(scores)
+
+
+def _set_scores(store, user_pks):
+    """
+    Set the scores of `user_pks`, keeping their username position. Returns
+    False, leaving their scores unchanged, if some of them are not in the sorted
+    set yet.
+    """
+    user_pks = [str(pk) for pk in user_pks]
+    if not user_pks:
+        return True
+    scores = _scores(ranked_users().filter(pk__in=user_pks))
+    with store.pipeline(transaction=False) as pipe:
+        for pk in user_pks:
+            pipe.zscore(_key(), pk)
+        current = dict(zip(user_pks, pipe.execute()))
+    if any(pk in scores and current[pk] is None for pk in user_pks):
+        return False
+    with store.pipeline() as pipe:
+        for pk in user_pks:
+            if pk in scores:
+                pipe.zadd(_key(), {pk: _encode(scores[pk], _decode(current[pk])[1])})
+            else:
+                pipe.zrem(_key(), pk)
+        pipe.execute()
+    return True
+
+
+def update_score(user):
+    """
+    Set the score of `user` to their total score in the database. To be called
+    once the change is committed. Redis errors are logged, not raised.
+    """
+    if not settings.PROLOGIN_SEMIFINAL_MODE:
+        return
+    try:
+        store = _store()
+        if not store.exists(_key()):
+            # the rebuild includes this change
+            rebuild()
+            return
+        # flag first, so that a concurrent rebuild sets the score again
+        store.sadd(_key() + '.updated', user.pk)
+        if not _set_scores(store, [user.pk]):
+            rebuild()
+    except redis.exceptions.RedisError:
+        logger.exception("could not update the scoreboard score of %s", user)
+
+
+def _ensure_built(store):
+    if not store.exists(_key()):
+        rebuild()
+
+
+def _ranks(store, scores):
+    """Map each of `scores` to its (rank, number of users with this score) pair."""
+    scores = sorted(set(scores))
+    with store.pipeline(transaction=False) as pipe:
+        for score in scores:
+            pipe.zcount(_key(), _encode(score + 1, TIE_BREAK_RANGE - 1), '+inf')
+            pipe.zcount(_key(), _encode(score, TIE_BREAK_RANGE - 1), _encode(score, 0))
+        counts = pipe.execute()
+    return {score: (better + 1, same)
+            for score, better, same in zip(scores, counts[::2], counts[1::2])}
+
+
+def _database_ranking():
+    users = _with_scores(ranked_users()).order_by('-score', 'username')
+
+    def score_getter(user):
+        return user.score
+
+    def decorator(user, rank, ex_aequo):
+        user.rank = rank
+        user.ex_aequo = ex_aequo
+
+    users = list(users)
+    decorate_with_rank(users, score_getter, decorator)
+    return users
+
+
+def get_page(start=0, count=None):
+    """
+    Users ranked from `start` (0-based) to `start + count`, best first, with
+    their `score`, `rank` and `ex_aequo` attributes set as decorate_with_rank
+    does: ex aequo users are listed by username, the first one is not
+    `ex_aequo`.
+    """
+    try:
+        store = _store()
+        _ensure_built(store)
+        stop = -1 if count is None else start + count - 1
+        entries = [(int(pk), _decode(value)[0])
+                   for pk, value in store.zrevrange(_key(), start, stop, withscores=True)]
+        ranks = _ranks(store, [score for pk, score in entries])
+    except redis.exceptions.RedisError:
+        logger.exception("could not read the scoreboard, ranking from the database")
+        users = _database_ranking()
+        return users[start:] if count is None else users[start:start + count]
+    users = User.objects.in_bulk([pk for pk, score in entries])
+    page = []
+    for pk, score in entries:
+        user = users.get(pk)
+        if user is None:
+            continue
+        user.score = score
+        page.append(user)
+    for position, user in enumerate(page, start + 1):
+        user.rank = ranks[user.score][0]
+        user.ex_aequo = position != user.rank
+    return page
+
+
+def get_rank(user):
+    """
+    The (rank, score, ex aequo) of `user`, None if the user is not ranked.
+    `ex aequo` is True when other users have the same score.
+    """
+    try:
+        store = _store()
+        _ensure_built(store)
+        value = store.zscore(_key(), str(user.pk))
+        if value is None:
+            return None
+        score = _decode(value)[0]
+        rank, same = _ranks(store, [score])[score]
+        return rank, score, same > 1
+    except redis.exceptions.RedisError:
+        logger.exception("could not read the scoreboard, ranking from the database")
+    users = _database_ranking()
+    scores = [ranked.score for ranked in users]
+    for ranked in users:
+        if ranked.pk == user.pk:
+            return ranked.rank, ranked.score, scores.count(ranked.score) > 1
+    return None
+
+
+def count():
+    try:
+        store = _store()
+        _ensure_built(store)
+        return store.zcard(_key())
+    except redis.exceptions.RedisError:
+        logger.exception("could not read the scoreboard, counting from the database")
+        return ranked_users().count()
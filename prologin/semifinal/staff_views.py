@@ -1,20 +1,23 @@
+import datetime
+
 from django.conf import settings
 from django.contrib import messages
 from django.urls import reverse_lazy
 from django.db import IntegrityError
-from django.db.models.aggregates import Sum
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
+from django.template.loader import get_template
 from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.translation import ugettext_lazy as _
-from django.views.generic import FormView
+from django.views.generic import FormView, View
 from django.views.generic.base import TemplateView
 from rules.contrib.views import PermissionRequiredMixin
 
 import contest.models
 import problems
-from problems.models import Submission
 import semifinal.forms
+import semifinal.monitoring
 
 
 class MonitorPermissionMixin(PermissionRequiredMixin):
@@ -26,39 +29,39 @@ class MonitoringIndexView(MonitorPermissionMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        contestants = (contest.models.Contestant.objects
-                       .select_related('user')
-                       .filter(user__is_staff=False, user__is_superuser=False,
-                               edition=self.request.current_edition)
-                       .annotate(score=Sum(
-                           Submission.get_score_func('user__training_submissions')))
-                       .order_by('user__username'))
         now = timezone.now()
-        for contestant in contestants:
-            # extend available_semifinal_problems with more attributes and store it as semifinal_problems
-            max_difficulty = 0
-            problems = contestant.available_semifinal_problems
-            for problem, dates in problems.items():
-                delta = None
-                concerning = ''
-                if dates['solved']:
-                    delta = dates['solved'] - dates['unlocked']
-                    max_difficulty = max(max_difficulty, problem.difficulty)
-                else:
-                    warning, danger = settings.SEMIFINAL_CONCERNING_TIME_SPENT
-                    seconds = (now - dates['unlocked']).seconds
-                    if seconds > danger:
-                        concerning = 'danger'
-                    elif seconds > warning:
-                        concerning = 'warning'
-                dates['delta'] = delta
-                dates['concerning'] = concerning
-            contestant.max_difficulty = max_difficulty
-            contestant.semifinal_problems = sorted(problems.items(), key=lambda p: p[1]['unlocked'], reverse=True)
-        context['contestants'] = contestants
+        context['contestants'] = semifinal.monitoring.get_contestants(self.request.current_edition,
+                                                                      self.request.current_challenge, now)
+        context['now'] = now.timestamp()
+        context['poll_interval'] = 1000 * settings.SEMIFINAL_MONITORING_POLL_INTERVAL
+        context['full_refresh'] = settings.SEMIFINAL_MONITORING_FULL_REFRESH
         return context
 
 
+class MonitoringDataView(MonitorPermissionMixin, View):
+    """
+    Rendered rows of the monitoring board, as JSON. With a `since` timestamp,
+    only the rows of contestants that may have changed since then.
+    """
+    def get(self, request, *args, **kwargs):
+        now = timezone.now()
+        since = request.GET.get('since')
+        try:
+            # overlap a bit, for changes committed while the previous request ran
+            since = datetime.datetime.fromtimestamp(float(since) - 5, tz=datetime.timezone.utc)
+        except (TypeError, ValueError):
+            since = None
+        contestants = semifinal.monitoring.get_contestants(request.current_edition, request.current_challenge,
+                                                           now, since)
+        template = get_template('semifinal/stub-monitoring-contestant.html')
+        return JsonResponse({
+            'now': now.timestamp(),
+            'contestants': [{'id': contestant.pk,
+                             'html': template.render({'contestant': contestant}, request)}
+                            for contestant in contestants],
+        })
+
+
 class ExplicitUnlockView(FormView):
     template_name = 'semifinal/explicit-unlock.html'
     form_class = semifinal.forms.ExplicitProblemUnlockForm
@@ -0,0 +1,174 @@
+import unittest.mock
+
+import redis.exceptions
+from django.test import override_settings
+
+import problems.models
+import semifinal.scoreboard
+from prologin.tests import ProloginTestCase
+
+
+class FakeRedis:
+    """In-memory sorted sets and sets, with the commands used by the scoreboard."""
+    def __init__(self):
+        self.data = {}
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def rename(self, src, dst):
+        self.data[dst] = self.data.pop(src)
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update({str(member).encode(): float(score)
+                                              for member, score in mapping.items()})
+
+    def zrem(self, key, member):
+        self.data.get(key, {}).pop(str(member).encode(), None)
+
+    def zscore(self, key, member):
+        return self.data.get(key, {}).get(str(member).encode())
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def zcount(self, key, min, max):
+        exclusive = isinstance(min, str) and min.startswith('(')
+        low = float(min[1:] if exclusive else min)
+        return sum(1 for score in self.data.get(key, {}).values()
+                   if (score > low if exclusive else score >= low) and score <= float(max))
+
+    def zrevrange(self, key, start, stop, withscores=False):
+        items = sorted(self.data.get(key, {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+        return items[start:None if stop == -1 else stop + 1]
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(str(member).encode())
+
+    def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, store):
+        self.store = store
+        self.calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return call
+
+    def execute(self):
+        return [getattr(self.store, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+@override_settings(PROLOGIN_SEMIFINAL_MODE=True)
+class ScoreboardTest(ProloginTestCase):
+    def _contribute(self):
+        super()._contribute()
+        self.users = {}
+        for username, score in (('alice', 100), ('bob', 50), ('carol', 50), ('dave', None), ('eve', 10)):
+            user = self.create_user(username, '{}@example.com'.format(username))
+            if score is not None:
+                problems.models.Submission.objects.create(challenge='demi2017', problem='foo', user=user,
+                                                          score_base=score)
+            self.users[username] = user
+        self.staff = self.create_user('staff', 'staff@example.com', is_staff=True)
+
+    def setUp(self):
+        super().setUp()
+        self.store = FakeRedis()
+        patcher = unittest.mock.patch('semifinal.scoreboard._store', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertRanking(self, users, expected):
+        self.assertEqual([(user.username, user.score, user.rank, user.ex_aequo) for user in users], expected)
+
+    ranking = [
+        ('alice', 100, 1, False),
+        ('bob', 50, 2, False),
+        ('carol', 50, 2, True),
+        ('eve', 10, 4, False),
+        ('dave', 0, 5, False),
+    ]
+
+    def test_page(self):
+        self.assertRanking(semifinal.scoreboard.get_page(), self.ranking)
+        self.assertEqual(semifinal.scoreboard.count(), 5)
+
+    def test_partial_page(self):
+        self.assertRanking(semifinal.scoreboard.get_page(1, 2), self.ranking[1:3])
+        self.assertRanking(semifinal.scoreboard.get_page(3, 2), self.ranking[3:5])
+
+    def test_tie_across_pages(self):
+        # bob and carol are ex aequo, carol has the greater pk
+        self.assertRanking(semifinal.scoreboard.get_page(0, 2), self.ranking[0:2])
+        self.assertRanking(semifinal.scoreboard.get_page(2, 2), self.ranking[2:4])
+        # the username order is kept by score updates
+        semifinal.scoreboard.update_score(self.users['carol'])
+        semifinal.scoreboard.update_score(self.users['bob'])
+        self.assertRanking(semifinal.scoreboard.get_page(0, 2), self.ranking[0:2])
+        self.assertRanking(semifinal.scoreboard.get_page(2, 2), self.ranking[2:4])
+
+    def test_new_user(self):
+        semifinal.scoreboard.rebuild()
+        aaron = self.create_user('aaron', 'aaron@example.com')
+        problems.models.Submission.objects.create(challenge='demi2017', problem='foo', user=aaron, score_base=50)
+        semifinal.scoreboard.update_score(aaron)
+        self.assertRanking(semifinal.scoreboard.get_page(1, 3),
+                           [('aaron', 50, 2, False), ('bob', 50, 2, True), ('carol', 50, 2, True)])
+
+    def test_rank(self):
+        self.assertEqual(semifinal.scoreboard.get_rank(self.users['alice']), (1, 100, False))
+        self.assertEqual(semifinal.scoreboard.get_rank(self.users['carol']), (2, 50, True))
+        self.assertEqual(semifinal.scoreboard.get_rank(self.users['dave']), (5, 0, False))
+        self.assertIsNone(semifinal.scoreboard.get_rank(self.staff))
+
+    def test_update_score(self):
+        semifinal.scoreboard.rebuild()
+        problems.models.Submission.objects.filter(user=self.users['eve']).update(score_base=200)
+        semifinal.scoreboard.update_score(self.users['eve'])
+        self.assertEqual(semifinal.scoreboard.get_rank(self.users['eve']), (1, 200, False))
+        self.assertEqual(semifinal.scoreboard.get_rank(self.users['alice']), (2, 100, False))
+
+    def test_update_during_rebuild(self):
+        semifinal.scoreboard.rebuild()
+        bob = self.users['bob']
+        scores = semifinal.scoreboard._scores
+
+        def read_then_update(users):
+            result = scores(users)
+            if len(result) > 1:
+                # committed and updated after the rebuild read the scores
+                problems.models.Submission.objects.filter(user=bob).update(score_base=60)
+                semifinal.scoreboard.update_score(bob)
+            return result
+
+        with unittest.mock.patch('semifinal.scoreboard._scores', side_effect=read_then_update):
+            semifinal.scoreboard.rebuild()
+        self.assertEqual(semifinal.scoreboard.get_rank(bob), (2, 60, False))
+
+    def test_database_fallback(self):
+        with unittest.mock.patch('semifinal.scoreboard._store', side_effect=redis.exceptions.ConnectionError):
+            with self.assertLogs('semifinal.scoreboard', 'ERROR'):
+                self.assertRanking(semifinal.scoreboard.get_page(), self.ranking)
+                self.assertRanking(semifinal.scoreboard.get_page(1, 2), self.ranking[1:3])
+                self.assertEqual(semifinal.scoreboard.get_rank(self.users['carol']), (2, 50, True))
+                self.assertEqual(semifinal.scoreboard.count(), 5)
+                # logged, the correction is not failed
+                semifinal.scoreboard.update_score(self.users['alice'])
+
@@ -20,6 +20,7 @@ urlpatterns = [
 
 monitoring_patterns = [
     path('', semifinal.staff_views.MonitoringIndexView.as_view(), name='index'),
+    path('data', semifinal.staff_views.MonitoringDataView.as_view(), name='data'),
     path('unlock', semifinal.staff_views.ExplicitUnlockView.as_view(), name='unlock'),
 ]
 
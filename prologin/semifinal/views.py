@@ -1,32 +1,25 @@
-from django.contrib.auth import get_user_model
-from django.db.models.aggregates import Sum
+from django.conf import settings
 from django.http import JsonResponse
 from django.template.loader import get_template
 from django.views.generic import TemplateView, View
 from rules.contrib.views import PermissionRequiredMixin
 
-from problems.models import Submission
-from prologin.utils.scoring import decorate_with_rank
-
-User = get_user_model()
+import semifinal.scoreboard
 
 
 class ScoreboardUserListMixin:
-    def get_user_list(self):
-        users = (User.objects
-                 .filter(is_active=True, is_staff=False, is_superuser=False)
-                 .annotate(score=Sum(Submission.get_score_func('training_submissions')))
-                 .order_by('-score', 'username'))
+    def get_page_size(self):
+        return settings.SEMIFINAL_SCOREBOARD_PAGE_SIZE
 
-        def score_getter(user):
-            return user.score
+    def get_page_number(self):
+        try:
+            return max(1, int(self.request.GET.get('page', 1)))
+        except ValueError:
+            return 1
 
-        def decorator(user, rank, ex_aequo):
-            user.rank = rank
-            user.ex_aequo = ex_aequo
-
-        decorate_with_rank(users, score_getter, decorator)
-        return users
+    def get_user_list(self):
+        page_size = self.get_page_size()
+        return semifinal.scoreboard.get_page((self.get_page_number() - 1) * page_size, page_size)
 
 
 class ParticipateRequiredMixin(PermissionRequiredMixin):
@@ -43,6 +36,12 @@ class Scoreboard(ScoreboardUserListMixin, TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['users'] = self.get_user_list()
+        page = self.get_page_number()
+        context['page'] = page
+        context['previous_page'] = page - 1 if page > 1 else None
+        context['next_page'] = page + 1 if page * self.get_page_size() < semifinal.scoreboard.count() else None
+        if self.request.user.is_authenticated:
+            context['user_rank'] = semifinal.scoreboard.get_rank(self.request.user)
         return context
 
 